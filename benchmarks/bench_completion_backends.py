@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures per-keystroke latency of the awscli completion backends.
+
+Usage:
+    python benchmarks/bench_completion_backends.py [repeat]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import sys
+import timeit
+import traceback
+from awscli import completer as awscli_completer
+from saws.backends import CaptureCompletionBackend, \
+    ResidentCompletionBackend
+
+
+KEYSTROKES = ['aws e',
+              'aws ec2',
+              'aws ec2 describe-ins',
+              'aws ec2 describe-instances --',
+              'aws s3api get-bucket-acl --b']
+
+
+def log_exception(e, _):
+    print('exception:', e, file=sys.stderr)
+
+
+def bench(backend, repeat):
+    # Warm up once so the resident backend pays its one time build cost
+    # outside of the measured loop.
+    backend.complete(KEYSTROKES[0])
+    timer = timeit.Timer(
+        lambda: [backend.complete(text) for text in KEYSTROKES])
+    best = min(timer.repeat(repeat=repeat, number=1))
+    return best / len(KEYSTROKES)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for backend_class in (CaptureCompletionBackend,
+                          ResidentCompletionBackend):
+        backend = backend_class(awscli_completer, log_exception)
+        per_keystroke = bench(backend, repeat)
+        print('{0:<28} {1:10.2f} ms/keystroke'.format(
+            backend_class.__name__, per_keystroke * 1000))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
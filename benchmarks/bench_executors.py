@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares running an aws command in the shell and in process with the
+resident clidriver.
+
+The default command only reads the local aws config, so no requests are
+sent and the timings show the cost of starting the aws cli.
+
+Usage:
+    python benchmarks/bench_executors.py [runs] [command]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import os
+import subprocess
+import sys
+import time
+from saws.executors import ClidriverExecutor
+from saws.utils import LazyModule
+
+
+def timed_runs(func, runs):
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            stdout, stderr = os.dup(1), os.dup(2)
+            os.dup2(devnull.fileno(), 1)
+            os.dup2(devnull.fileno(), 2)
+            try:
+                start = time.time()
+                func()
+                sys.stdout.flush()
+                times.append(time.time() - start)
+            finally:
+                os.dup2(stdout, 1)
+                os.dup2(stderr, 2)
+    return times
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    command = sys.argv[2] if len(sys.argv) > 2 else 'aws configure list'
+    executor = ClidriverExecutor(LazyModule('awscli.clidriver'),
+                                 lambda e, traceback: None,
+                                 ' | pygmentize -l json')
+    print('{0:<10} {1:>9} {2:>9} {3:>9}'.format(
+        'executor', 'first ms', 'median ms', 'max ms'))
+    for name, func in [
+            ('shell', lambda: subprocess.call(command, shell=True)),
+            ('clidriver', lambda: executor.execute(command))]:
+        times = timed_runs(func, runs)
+        rest = sorted(times[1:]) or times
+        print('{0:<10} {1:>9.1f} {2:>9.1f} {3:>9.1f}'.format(
+            name, times[0] * 1000, rest[len(rest) // 2] * 1000,
+            max(rest) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares fuzzyfinder with the indexed FuzzyMatcher.
+
+Usage:
+    python benchmarks/bench_fuzzy.py [size ...]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import random
+import sys
+import time
+import fuzzyfinder
+from saws.matching import FuzzyIndex
+
+
+QUERIES = ['a5', 'i-ab', 'f00d', '9e9e1']
+
+
+def create_instance_ids(size):
+    rand = random.Random(size)
+    return ['i-%08x' % rand.getrandbits(32) for _ in range(size)]
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or \
+        [1000, 100000, 1000000]
+    print('{0:>9} {1:>7} {2:>14} {3:>12} {4:>12}'.format(
+        'size', 'query', 'fuzzyfinder ms', 'index ms', 'build ms'))
+    for size in sizes:
+        collection = create_instance_ids(size)
+        index, build_time = timed(FuzzyIndex, collection)
+        for query in QUERIES:
+            expected, fuzzyfinder_time = timed(
+                lambda: list(fuzzyfinder.fuzzyfinder(query, collection)))
+            result, index_time = timed(index.find_matches, query)
+            assert [match[-1] for match in result] == expected
+            print('{0:>9} {1:>7} {2:>14.1f} {3:>12.1f} {4:>12.1f}'.format(
+                size, query, fuzzyfinder_time * 1000, index_time * 1000,
+                build_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures building and searching the instance search index.
+
+Usage:
+    python benchmarks/bench_instance_search.py [num_instances]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import sys
+import time
+from saws.matching import PrefixMatcher
+from saws.resources import AwsResources
+
+
+QUERIES = ['web', 'web-server-4', 'prod', '10.1.2', 'api-42']
+SERVICES = ['web-server', 'api', 'worker', 'db']
+
+
+def log_exception(e, _):
+    print('exception:', e, file=sys.stderr)
+
+
+def create_instances(num_instances):
+    return [('i-{0:08x}'.format(i),
+             'running',
+             [{'Key': 'Name', 'Value': '{0}-{1}'.format(
+                 SERVICES[i % len(SERVICES)], i)},
+              {'Key': 'Stack', 'Value': 'prod' if i % 3 else 'dev'}],
+             '10.{0}.{1}.{2}'.format(i >> 16, (i >> 8) & 255, i & 255))
+            for i in range(num_instances)]
+
+
+def main():
+    num_instances = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    resources = AwsResources(log_exception)
+    instances = create_instances(num_instances)
+    start = time.time()
+    resources.update_instances(instances)
+    print('Indexed {0} instances, {1} terms in {2:.2f}s'.format(
+        num_instances, len(resources.instance_search_terms),
+        time.time() - start))
+    matcher = PrefixMatcher()
+    matcher.find_matches('', resources.instance_search_terms, 'search')
+    for query in QUERIES:
+        start = time.time()
+        terms = matcher.find_matches(query, resources.instance_search_terms,
+                                     'search', limit=100)
+        instance_ids = set()
+        for term in terms:
+            instance_ids.update(resources.instance_search_index[term])
+        print('{0:>14} {1:>7} ids {2:>8.2f}ms'.format(
+            query, len(instance_ids), (time.time() - start) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures highlighting while typing a long command, one keystroke at a
+time, with and without the CommandLexer's cache.
+
+Usage:
+    python benchmarks/bench_lexer.py [size]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import json
+import sys
+import time
+from saws.commands import AwsCommands
+from saws.lexer import CommandLexerFactory
+
+
+def create_command(size):
+    filters = []
+    while len(json.dumps(filters, indent=2)) < size:
+        filters.append({'Name': 'tag:Name',
+                        'Values': ['web-%d' % len(filters), 'db']})
+    return "aws ec2 describe-instances --output json --filters '%s'" % \
+        json.dumps(filters, indent=2)[:size]
+
+
+def type_command(lexer, command):
+    times = []
+    for end in range(1, len(command) + 1):
+        start = time.time()
+        for _ in lexer.get_tokens(command[:end]):
+            pass
+        times.append(time.time() - start)
+    return times
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10240
+    command = create_command(size)
+    lexer_class = CommandLexerFactory(AwsCommands().get_all_commands(),
+                                      {}).lexer
+    print('{0:<9} {1:>9} {2:>12} {3:>9}'.format(
+        'cache', 'total s', 'mean us', 'max us'))
+    for cache_size in [0, lexer_class.CACHE_SIZE]:
+        lexer_class.CACHE_SIZE = cache_size
+        lexer = lexer_class(stripnl=False, stripall=False, ensurenl=False)
+        times = type_command(lexer, command)
+        print('{0:<9} {1:>9.2f} {2:>12.1f} {3:>9.1f}'.format(
+            cache_size, sum(times), sum(times) / len(times) * 1e6,
+            max(times) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares sorting and scanning collections with the PrefixIndex.
+
+Usage:
+    python benchmarks/bench_prefix.py [size ...]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import random
+import sys
+import time
+from saws.matching import PrefixIndex
+
+
+QUERIES = ['i-', 'i-a', 'i-a5', 'i-f00d']
+
+
+def create_instance_ids(size, seed=None):
+    rand = random.Random(size if seed is None else seed)
+    return ['i-%08x' % i for i in rand.sample(range(1 << 32), size)]
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def scan(word, collection):
+    return [name for name in sorted(collection) if name.startswith(word)]
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or \
+        [10000, 100000, 1000000]
+    print('{0:>9} {1:>7} {2:>8} {3:>9} {4:>9} {5:>9} {6:>9}'.format(
+        'size', 'query', 'matches', 'scan ms', 'index ms', 'build ms',
+        'merge ms'))
+    for size in sizes:
+        collection = create_instance_ids(size)
+        index, build_time = timed(PrefixIndex, collection)
+        # A refresh replacing 1% of the instances
+        refreshed = collection[size // 100:] + \
+            create_instance_ids(size // 100, seed=-size)
+        _, merge_time = timed(PrefixIndex(collection).update, refreshed)
+        for query in QUERIES:
+            expected, scan_time = timed(scan, query, collection)
+            result, index_time = timed(index.find_matches, query)
+            assert result == expected
+            print('{0:>9} {1:>7} {2:>8} {3:>9.1f} {4:>9.3f} {5:>9.1f} '
+                  '{6:>9.1f}'.format(size, query, len(result),
+                                     scan_time * 1000, index_time * 1000,
+                                     build_time * 1000, merge_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
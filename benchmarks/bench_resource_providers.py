@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures loading a synthetic fleet through the botocore provider.
+
+The EC2 API is replaced by botocore's Stubber, so this measures the in
+process cost of paginating and building the instance resources, without
+the network or an aws process startup per query.
+
+Usage:
+    python benchmarks/bench_resource_providers.py [num_instances]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import sys
+import time
+import botocore.session
+from botocore.stub import Stubber
+from saws.providers import BotocoreResourceProvider
+from saws.resources import AwsResources
+
+
+PAGE_SIZE = 1000
+
+
+def log_exception(e, _):
+    print('exception:', e, file=sys.stderr)
+
+
+def create_fleet_pages(num_instances):
+    pages = []
+    for start in range(0, num_instances, PAGE_SIZE):
+        instances = [{
+            'InstanceId': 'i-{0:08x}'.format(i),
+            'State': {'Code': 16, 'Name': 'running'},
+            'Tags': [{'Key': 'Name', 'Value': 'web server {0}'.format(i)},
+                     {'Key': 'Stack', 'Value': 'prod'}],
+        } for i in range(start, min(start + PAGE_SIZE, num_instances))]
+        page = {'Reservations': [{'Instances': instances}]}
+        if start + PAGE_SIZE < num_instances:
+            page['NextToken'] = str(start + PAGE_SIZE)
+        pages.append(page)
+    return pages
+
+
+def main():
+    num_instances = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    session = botocore.session.get_session()
+    provider = BotocoreResourceProvider(session)
+    client = session.create_client('ec2',
+                                   region_name='us-east-1',
+                                   aws_access_key_id='access-key',
+                                   aws_secret_access_key='secret-key')
+    provider.clients['ec2'] = client
+    stubber = Stubber(client)
+    for page in create_fleet_pages(num_instances):
+        stubber.add_response('describe_instances', page)
+    resources = AwsResources(log_exception)
+    resources.provider = provider
+    start = time.time()
+    with stubber:
+        resources.query_instances()
+    elapsed = time.time() - start
+    assert len(resources.instance_ids) == num_instances
+    print('{0} instances loaded in {1:.2f}s ({2:.1f} us per instance, '
+          'including stub validation)'.format(
+              num_instances, elapsed, elapsed / num_instances * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures the time from starting Python to the prompt being ready.
+
+Each run starts a new interpreter, so imports and files are not cached
+between runs.  Resources keep loading in the background and are not
+included.
+
+Usage:
+    python benchmarks/bench_startup.py [runs]
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+import json
+import subprocess
+import sys
+
+
+SCRIPT = '''
+import json, time
+start = time.time()
+from saws.profiling import StartupProfiler
+profiler = StartupProfiler()
+profiler.start = start
+with profiler.phase('imports'):
+    from saws.saws import Saws
+Saws(profiler)
+phases = profiler.phases + [('first prompt', time.time() - start)]
+print(json.dumps(phases))
+'''
+
+
+def run_once():
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    timings = {}
+    names = []
+    for _ in range(runs):
+        for name, seconds in run_once():
+            if name not in timings:
+                names.append(name)
+                timings[name] = []
+            timings[name].append(seconds)
+    print('{0:<18} {1:>9} {2:>9}'.format('phase', 'median ms', 'max ms'))
+    for name in names:
+        print('{0:<18} {1:>9.1f} {2:>9.1f}'.format(
+            name, median(timings[name]) * 1000, max(timings[name]) * 1000))
+
+
+if __name__ == '__main__':
+    main()
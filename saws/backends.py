@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import logging
+import re
+import sys
+import threading
+import traceback
+from six.moves import cStringIO
+from .index import AwsCommandIndex
+
+
+class CaptureCompletionBackend(object):
+    """Completes by driving the awscli completer module on every call.
+
+    Each call to awscli's module level complete rebuilds the clidriver and
+    its command table, then prints the completions to stdout, which we
+    capture and parse.
+
+    Attributes:
+        * aws_completer: The official aws cli completer module.
+        * log_exception: A callable log_exception from SawsLogger.
+    """
+
+    def __init__(self, aws_completer, log_exception):
+        """Initializes CaptureCompletionBackend.
+
+        Args:
+            * aws_completer: The official aws cli completer module.
+            * log_exception: A callable log_exception from SawsLogger.
+
+        Returns:
+            None.
+        """
+        self.aws_completer = aws_completer
+        self.log_exception = log_exception
+
+    def complete(self, text):
+        """Gets the awscli completions for text.
+
+        Args:
+            * text: A string representing the input command text.
+
+        Returns:
+            A list of string completions.
+        """
+        old_stdout = sys.stdout
+        sys.stdout = mystdout = cStringIO()
+        try:
+            # Capture the AWS CLI autocompleter and store it in a string
+            self.aws_completer.complete(text, len(text))
+        except Exception as e:
+            self.log_exception(e, traceback)
+        sys.stdout = old_stdout
+        aws_completer_results = mystdout.getvalue()
+        # Tidy up the completions and store it in a list
+        aws_completer_results = re.sub('\n', '', aws_completer_results)
+        return aws_completer_results.split()
+
+
+class ResidentCompletionBackend(object):
+    """Completes with a single awscli Completer kept resident in process.
+
+    The clidriver and its command table are built on first use and reused
+    for every following call.  Completions are returned directly as a list
+    instead of being printed and scraped from stdout.
+
+    Attributes:
+        * aws_completer: The official aws cli completer module.
+        * log_exception: A callable log_exception from SawsLogger.
+        * completer: An instance of awscli's Completer, or None until
+            the first completion is requested.
+        * lock: A threading.Lock guarding the creation of the completer, so
+            it is only built once.
+    """
+
+    def __init__(self, aws_completer, log_exception):
+        """Initializes ResidentCompletionBackend.
+
+        Args:
+            * aws_completer: The official aws cli completer module.
+            * log_exception: A callable log_exception from SawsLogger.
+
+        Returns:
+            None.
+        """
+        self.aws_completer = aws_completer
+        self.log_exception = log_exception
+        self.completer = None
+        self.lock = threading.Lock()
+
+    def get_completer(self):
+        """Gets the resident awscli Completer, building it on first use.
+
+        Args:
+            * None.
+
+        Returns:
+            An instance of awscli's Completer.
+        """
+        with self.lock:
+            if self.completer is None:
+                self.completer = self.aws_completer.Completer()
+            return self.completer
+
+    def complete(self, text):
+        """Gets the awscli completions for text.
+
+        Args:
+            * text: A string representing the input command text.
+
+        Returns:
+            A list of string completions.
+        """
+        try:
+            return list(self.get_completer().complete(text, len(text)))
+        except Exception as e:
+            self.log_exception(e, traceback)
+        return []
+
+
+class IndexCompletionBackend(object):
+    """Completes from the precompiled command index in ~/.saws-index.
+
+    The index header is checked against the installed awscli version on
+    startup.  If the index is missing or stale, or it can not answer a
+    completion (such as the value of --profile), the resident backend is
+    used instead.
+
+    Attributes:
+        * index: An instance of AwsCommandIndex, or None if the index is
+            missing or stale.
+        * fallback: An instance of the backend used when the index can
+            not answer, or None until it is first needed.
+        * lock: A threading.Lock guarding the creation of the fallback.
+    """
+
+    def __init__(self, aws_completer, log_exception, index_path=None):
+        """Initializes IndexCompletionBackend.
+
+        Args:
+            * aws_completer: The official aws cli completer module.
+            * log_exception: A callable log_exception from SawsLogger.
+            * index_path: A string representing the index file path.
+
+        Returns:
+            None.
+        """
+        self.index = None
+        self.aws_completer = aws_completer
+        self.log_exception = log_exception
+        self.fallback = None
+        self.lock = threading.Lock()
+        index_path = index_path or AwsCommandIndex.INDEX_PATH
+        if AwsCommandIndex.is_current(index_path):
+            try:
+                self.index = AwsCommandIndex.load(index_path)
+            except Exception as e:
+                log_exception(e, traceback)
+        else:
+            logging.getLogger(__name__).info(
+                'Command index %r is missing or stale, regenerate it '
+                'with: python -m saws.index', index_path)
+
+    def complete(self, text):
+        """Gets the completions for text.
+
+        Args:
+            * text: A string representing the input command text.
+
+        Returns:
+            A list of string completions.
+        """
+        if self.index is not None:
+            completions = self.index.complete(text)
+            if completions is not None:
+                return completions
+        return self.get_fallback().complete(text)
+
+    def get_fallback(self):
+        """Gets the fallback backend, creating it on first use.
+
+        The awscli completer is only imported once the index can not
+        answer.
+
+        Args:
+            * None.
+
+        Returns:
+            An instance of the resident completion backend.
+        """
+        with self.lock:
+            if self.fallback is None:
+                self.fallback = CompletionBackendFactory(
+                    'resident', self.aws_completer, self.log_exception).backend
+            return self.fallback
+
+
+class CompletionBackendFactory(object):
+    """Creates the completion backend named in ~/.sawsrc.
+
+    Attributes:
+        * backend: An instance of the selected completion backend.
+        * BACKENDS: A dict mapping backend names to backend classes.
+    """
+
+    BACKENDS = {
+        'capture': CaptureCompletionBackend,
+        'index': IndexCompletionBackend,
+        'resident': ResidentCompletionBackend,
+    }
+
+    def __init__(self, name, aws_completer, log_exception):
+        """Initializes CompletionBackendFactory.
+
+        Args:
+            * name: A string representing the backend name.
+            * aws_completer: The official aws cli completer module.
+            * log_exception: A callable log_exception from SawsLogger.
+
+        Returns:
+            None.
+        """
+        self.backend = self.backend_factory(name,
+                                            aws_completer,
+                                            log_exception)
+
+    def backend_factory(self, name, aws_completer, log_exception):
+        """Creates the specified completion backend.
+
+        If the name is unknown, or the installed awscli does not provide a
+        Completer class to keep resident, the capture backend is returned.
+
+        Args:
+            * name: A string representing the backend name.
+            * aws_completer: The official aws cli completer module.
+            * log_exception: A callable log_exception from SawsLogger.
+
+        Returns:
+            An instance of a completion backend.
+        """
+        backend_class = self.BACKENDS.get(name, CaptureCompletionBackend)
+        if backend_class is ResidentCompletionBackend and \
+                not hasattr(aws_completer, 'Completer'):
+            backend_class = CaptureCompletionBackend
+        return backend_class(aws_completer, log_exception)
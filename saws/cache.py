@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import errno
+import logging
+import os
+import re
+import tempfile
+import threading
+import zlib
+from six.moves import cPickle as pickle
+try:
+    from collections import OrderedDict
+except:
+    from ordereddict import OrderedDict
+
+
+class LRUCache(object):
+    """Bounded mapping that evicts the least recently used entries.
+
+    Attributes:
+        * max_size: An int representing the maximum number of entries.
+        * hits: An int counting lookups that found a usable entry.
+        * misses: An int counting lookups that did not.
+        * evictions: An int counting entries evicted to stay under max_size.
+    """
+
+    def __init__(self, max_size=128):
+        """Initializes LRUCache.
+
+        Args:
+            * max_size: An int representing the maximum number of entries.
+
+        Returns:
+            None.
+        """
+        self.max_size = max(1, int(max_size))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None, predicate=None):
+        """Gets the entry for key, marking it as recently used.
+
+        Args:
+            * key: A hashable key.
+            * default: The value returned on a miss.
+            * predicate: An optional callable taking the cached value and
+                returning whether it can be used.  An unusable entry is
+                counted as a miss.
+
+        Returns:
+            The cached value, or default.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            if predicate is not None and not predicate(value):
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores value for key, evicting the oldest entries if needed.
+
+        Args:
+            * key: A hashable key.
+            * value: The value to store.
+
+        Returns:
+            None.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Removes all entries, keeping the counters.
+
+        Args:
+            * None.
+
+        Returns:
+            None.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class ResourceCache(object):
+    """Versioned file caching the AWS resources between sessions.
+
+    The file lives in the user's cache directory, $XDG_CACHE_HOME/saws or
+    ~/.cache/saws, and starts with a one line header recording its format,
+    followed by the zlib compressed resources.  It is loaded with a single
+    read, and saved by writing a temporary file that is renamed over the
+    cache, so concurrent sessions never see a partially written cache.
+
+    Attributes:
+        * CACHE_DIR: A string representing the default cache directory.
+        * FORMAT_VERSION: An int representing the cache file format.
+        * HEADER_PREFIX: A bytes string marking the start of the header.
+        * CORRUPT_ERRORS: A tuple of the exceptions raised when reading a
+            truncated or corrupt cache file.
+        * path: A string representing the cache file path.
+    """
+
+    CACHE_DIR = os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'saws')
+    FORMAT_VERSION = 1
+    HEADER_PREFIX = b'saws-resources'
+    # Unpickling garbled data can raise most anything besides
+    # UnpicklingError
+    CORRUPT_ERRORS = (EOFError, zlib.error, pickle.UnpicklingError,
+                      ValueError, AttributeError, ImportError, IndexError,
+                      KeyError, TypeError)
+
+    def __init__(self, path=None, profile=None, region=None):
+        """Initializes ResourceCache.
+
+        Args:
+            * path: A string representing the cache file path, or None to
+                use the cache directory.
+            * profile: A string representing the profile of the cached
+                resources, or None for the default profile.
+            * region: A string representing the region of the cached
+                resources, or None for the default region.
+
+        Returns:
+            None.
+        """
+        self.path = path or os.path.join(
+            self.CACHE_DIR, self.get_file_name(profile, region))
+        self._saved = None
+
+    def get_file_name(self, profile=None, region=None):
+        """Gets the cache file name for a profile and region.
+
+        Args:
+            * profile: A string representing the profile, or None for the
+                default profile.
+            * region: A string representing the region, or None for the
+                default region.
+
+        Returns:
+            A string representing the file name, such as
+            'resources-prod-us_east_1'.
+        """
+        if profile is None and region is None:
+            return 'resources'
+        return '-'.join(['resources'] + [
+            re.sub(r'[^\w.]', '_', name) if name is not None else 'default'
+            for name in [profile, region]])
+
+    def load(self):
+        """Loads the resources from the cache file.
+
+        Args:
+            * None.
+
+        Returns:
+            A dict of the cached resources, or None if the file does not
+            exist, was written in another format or is corrupt.  A corrupt
+            file is removed, so it is written again on the next save.
+        """
+        try:
+            with open(self.path, 'rb') as fp:
+                contents = fp.read()
+        except IOError:
+            return None
+        header, _, body = contents.partition(b'\n')
+        if header.split() != [self.HEADER_PREFIX,
+                              str(self.FORMAT_VERSION).encode('utf-8')]:
+            return None
+        try:
+            data = pickle.loads(zlib.decompress(body))
+        except self.CORRUPT_ERRORS:
+            logging.getLogger(__name__).warning(
+                'Removing corrupt resource cache %s', self.path)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return None
+        self._saved = data
+        return data
+
+    def save(self, data):
+        """Saves the resources to the cache file, unless they are unchanged.
+
+        Args:
+            * data: A dict of the resources to cache.
+
+        Returns:
+            A boolean that determines whether the cache file was written.
+        """
+        if data == self._saved:
+            return False
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        header = ' '.join([self.HEADER_PREFIX.decode('utf-8'),
+                           str(self.FORMAT_VERSION)]) + '\n'
+        handle, temp_path = tempfile.mkstemp(dir=directory,
+                                             prefix='.resources-')
+        try:
+            with os.fdopen(handle, 'wb') as fp:
+                fp.write(header.encode('utf-8'))
+                fp.write(zlib.compress(pickle.dumps(data, 2)))
+            # os.rename does not replace an existing file on Windows
+            getattr(os, 'replace', os.rename)(temp_path, self.path)
+        except:
+            os.remove(temp_path)
+            raise
+        self._saved = data
+        return True
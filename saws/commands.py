@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 from __future__ import print_function
 import os
 import re
+import threading
 from enum import Enum
 
 
@@ -41,6 +42,8 @@ class AwsCommands(object):
     EC2_STATES_HEADER = '[ec2_states]: '
     SOURCES_DIR = os.path.dirname(os.path.realpath(__file__))
     SOURCES_PATH = os.path.join(SOURCES_DIR, 'data/SOURCES.txt')
+    _all_commands = None
+    _lock = threading.Lock()
 
     class CommandType(Enum):
         """Enum specifying the command type.
@@ -60,6 +63,27 @@ class AwsCommands(object):
         COMMANDS, SUB_COMMANDS, GLOBAL_OPTIONS, RESOURCE_OPTIONS, \
             EC2_STATES = range(5)
 
+    def get_all_commands(self):
+        """Gets all commands, parsing data/SOURCES.txt once per process.
+
+        The lists are shared by every caller and must not be modified.
+
+        Args:
+            * None.
+
+        Returns:
+            A tuple, where each tuple element is a list of:
+                * commands
+                * sub_commands
+                * global_options
+                * resource_options
+                * ec2_states
+        """
+        with AwsCommands._lock:
+            if AwsCommands._all_commands is None:
+                AwsCommands._all_commands = self.generate_all_commands()
+            return AwsCommands._all_commands
+
     def generate_all_commands(self):
         """Generates all commands from the data/SOURCES.txt file.
 
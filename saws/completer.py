@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from __future__ import print_function
-import re
-import sys
+import threading
 import traceback
 try:
     from collections import OrderedDict
 except:
     from ordereddict import OrderedDict
-from six.moves import cStringIO
-from prompt_toolkit.completion import Completer
+from prompt_toolkit.completion import Completer, Completion
+from .backends import CompletionBackendFactory
+from .cache import LRUCache
 from .utils import TextUtils
 from .commands import AwsCommands
-from .resources import AwsResources
+from .providers import ResourceFetcherRegistry
+from .resources import AwsResources, AwsResourcePool
+from .shortcuts import ShortcutExpander
 
 
 class AwsCompleter(Completer):
@@ -20,20 +22,46 @@ class AwsCompleter(Completer):
 
     Attributes:
         * aws_completer: An instance of the official awscli Completer.
+        * completion_backend: An instance of a completion backend, selected
+            by the completion_backend option in ~/.sawsrc.
         * aws_completions: A set of completions to show the user.
+        * completion_cache: An instance of LRUCache mapping a command scope
+            (the words before the current word) to the awscli completions
+            last returned for that scope.
         * config_obj: An instance of ConfigObj, reads from ~/.sawsrc.
         * log_exception: A callable log_exception from SawsLogger.
         * ec2_states: A list of the possible instance states.
         * text_utils: An instance of TextUtils.
         * fuzzy_match: A boolean that determines whether to use fuzzy matching.
+        * max_completions: An int representing the maximum number of
+            completions to show, or None to show every completion.
         * shortcut_match: A boolean that determines whether to match shortcuts.
         * BASE_COMMAND: A string representing the 'aws' command.
         * DOCS_COMMAND: A string representing the 'docs' command.
-        * resources: An instance of AwsResources.
+        * resources: An instance of AwsResources for the default profile
+            and region.
+        * resource_pool: An instance of AwsResourcePool holding the
+            resources of each profile and region.
+        * resource_fetchers: An instance of ResourceFetcherRegistry mapping
+            the options whose resources are fetched lazily, such as
+            '--function-name', to their fetchers.
         * shortcuts: An OrderedDict containing shortcuts commands as keys
             and their corresponding full commands as values.
+        * shortcut_expander: An instance of ShortcutExpander, compiled
+            from shortcuts.
+        * COMMAND_INSTANCE_STATES: A dict mapping commands to the state of
+            the instances whose ids they are completed with.
+        * GLOBAL_FLAGS: A list of the global options that take no value.
     """
 
+    COMMAND_INSTANCE_STATES = {
+        'start-instances': 'stopped',
+        'stop-instances': 'running',
+        'reboot-instances': 'running',
+    }
+    GLOBAL_FLAGS = ['--debug', '--no-paginate', '--no-sign-request',
+                    '--no-verify-ssl', '--version']
+
     def __init__(self,
                  aws_completer,
                  config_obj,
@@ -60,75 +88,323 @@ class AwsCompleter(Completer):
         self.aws_completions = set()
         self.config_obj = config_obj
         self.log_exception = log_exception
+        self.completion_backend = CompletionBackendFactory(
+            self.config_obj['main']['completion_backend'],
+            self.aws_completer,
+            self.log_exception).backend
+        self.completion_cache = LRUCache(
+            self.config_obj['main'].as_int('completion_cache_size'))
         self.ec2_states = ec2_states
         self.text_utils = TextUtils()
         self.fuzzy_match = fuzzy_match
+        self.max_completions = \
+            self.config_obj['main'].as_int('max_completions') or None
         self.shortcut_match = shortcut_match
         self.BASE_COMMAND = AwsCommands.AWS_COMMAND
         # TODO: Refactor to use config_obj.get_shortcuts()
         self.shortcuts = OrderedDict(zip(self.config_obj['shortcuts'].keys(),
                                          self.config_obj['shortcuts'].values()))
-        self.resources = \
-            AwsResources(
-                self.log_exception,
-                self.config_obj['main'].as_bool('refresh_instance_ids'),
-                self.config_obj['main'].as_bool('refresh_instance_tags'),
-                self.config_obj['main'].as_bool('refresh_bucket_names'))
-        self.resources.refresh()
-        self.resource_map = dict(zip([self.resources.INSTANCE_IDS,
-                                      self.resources.EC2_TAG_KEY,
-                                      self.resources.EC2_TAG_VALUE,
-                                      self.resources.EC2_STATE,
-                                      self.resources.BUCKET],
-                                     [self.resources.instance_ids,
-                                      self.resources.instance_tag_keys,
-                                      self.resources.instance_tag_values,
-                                      self.ec2_states,
-                                      self.resources.bucket_names]))
+        self.shortcut_expander = ShortcutExpander(self.shortcuts)
+        self.resource_fetchers = ResourceFetcherRegistry()
+        self.resources = self.create_resources()
+        self.resource_pool = AwsResourcePool(
+            self.resources,
+            self.create_resources,
+            self.config_obj['main'].as_int('resource_cache_size'))
+        self.refresh_resources()
+
+    def create_resources(self, profile=None, region=None):
+        """Creates the AWS resources of a profile and region.
+
+        Args:
+            * profile: A string representing the profile, or None for the
+                default profile.
+            * region: A string representing the region, or None for the
+                default region.
+
+        Returns:
+            An instance of AwsResources.
+        """
+        return AwsResources(
+            self.log_exception,
+            self.config_obj['main'].as_bool('refresh_instance_ids'),
+            self.config_obj['main'].as_bool('refresh_instance_tags'),
+            self.config_obj['main'].as_bool('refresh_bucket_names'),
+            self.config_obj['main'].as_int('refresh_concurrency'),
+            self.config_obj['main'].as_float('refresh_timeout'),
+            self.config_obj['main']['resource_provider'],
+            self.get_resource_ttls(),
+            profile,
+            region,
+            self.resource_fetchers,
+            self.config_obj['main'].as_int('lazy_resources_ttl'))
+
+    def refresh_resources(self, force_refresh=False):
+        """Refreshes the resources of the default and configured regions.
+
+        The resources of the default profile and region, and of each region
+        listed in resource_regions, are refreshed in the background.
+
+        Args:
+            * force_refresh: A boolean determines whether to force a cache
+                refresh.  This value is set to True when the user presses `F5`.
+
+        Returns:
+            None.
+        """
+        self.resources.refresh_async(force_refresh=force_refresh)
+        regions = self.config_obj['main'].as_list('resource_regions')
+        if regions:
+            self.resource_pool.refresh_all(
+                [(None, region) for region in regions],
+                force_refresh,
+                self.config_obj['main'].as_int('refresh_concurrency'))
+
+    def get_resources(self, words):
+        """Gets the resources of the profile and region on the command line.
+
+        Args:
+            * words: A list of strings for each word in the command text.
+
+        Returns:
+            An instance of AwsResources for the values of the --profile and
+            --region options, given as separate words or after '=', or the
+            default ones if they are not given.
+        """
+        options = {'--profile': None, '--region': None}
+        for index, word in enumerate(words):
+            # Options are given either as --profile prod or --profile=prod
+            option, equals, value = word.partition('=')
+            if option not in options:
+                continue
+            if equals:
+                options[option] = value
+            elif index + 1 < len(words):
+                options[option] = words[index + 1]
+        return self.resource_pool.get(options['--profile'],
+                                      options['--region'])
+
+    def get_service_name(self, words):
+        """Gets the service of the command, such as 'lambda'.
+
+        Args:
+            * words: A list of strings for each word in the command text.
+
+        Returns:
+            A string representing the first word after aws that is neither
+            a global option nor its value, or None if there is none.
+        """
+        args = iter(words[1:])
+        for word in args:
+            if not word.startswith('-'):
+                return word
+            # Global options other than flags are followed by their value
+            if word not in self.GLOBAL_FLAGS and '=' not in word:
+                next(args, None)
+        return None
+
+    def get_resource_ttls(self):
+        """Gets the TTL of each type of resources from ~/.sawsrc.
+
+        Args:
+            * None.
+
+        Returns:
+            A dict mapping each AwsResources.ResType to an int representing
+            the number of seconds after which its resources expire.
+        """
+        res_type = AwsResources.ResType
+        return dict(zip([res_type.INSTANCE_IDS,
+                         res_type.INSTANCE_TAG_KEYS,
+                         res_type.INSTANCE_TAG_VALUES,
+                         res_type.BUCKET_NAMES],
+                        [self.config_obj['main'].as_int(key) for key in
+                         ['instance_ids_ttl',
+                          'instance_tag_keys_ttl',
+                          'instance_tag_values_ttl',
+                          'bucket_names_ttl']]))
+
+    @property
+    def resource_map(self):
+        """Maps resource options to the default resource collections.
+
+        Args:
+            * None.
+
+        Returns:
+            A dict mapping resource options, such as '--instance-ids', to
+            their resource collections.
+        """
+        return self.get_resource_map(self.resources)
+
+    def get_resource_map(self, resources):
+        """Maps resource options to their current resource collections.
+
+        The collections are looked up on each call, as a refresh replaces
+        them with new ones.
+
+        Args:
+            * resources: An instance of AwsResources.
+
+        Returns:
+            A dict mapping resource options, such as '--instance-ids', to
+            their resource collections.
+        """
+        return dict(zip([resources.INSTANCE_IDS,
+                         resources.EC2_TAG_KEY,
+                         resources.EC2_TAG_VALUE,
+                         resources.EC2_TAG,
+                         resources.EC2_STATE,
+                         resources.BUCKET],
+                        [resources.instance_ids,
+                         resources.instance_tag_keys,
+                         resources.instance_tag_values,
+                         resources.instance_tag_keys,
+                         self.ec2_states,
+                         resources.bucket_names]))
+
+    def get_tag_filter(self, words, word_before_cursor):
+        """Gets the instance tag given before the word being completed.
+
+        The tag is given with --ec2-tag-key and --ec2-tag-value, or with
+        --ec2-tag followed by its key and value.
+
+        Args:
+            * words: A list of strings for each word in the command text.
+            * word_before_cursor: A string representing the word before
+                the cursor.
+
+        Returns:
+            A tuple of a string representing the tag key and a string
+            representing the tag value, either of which is None if it is
+            not given.
+        """
+        if word_before_cursor:
+            words = words[:-1]
+        key = value = None
+        for i, word in enumerate(words[:-1]):
+            if word == self.resources.EC2_TAG_KEY:
+                key = words[i + 1]
+            elif word == self.resources.EC2_TAG_VALUE:
+                value = words[i + 1]
+            elif word == self.resources.EC2_TAG and i + 2 < len(words):
+                key, value = words[i + 1], words[i + 2]
+        return key, value
+
+    def get_state_filter(self, words, word_before_cursor):
+        """Gets the instance state to complete instance ids with.
+
+        The state is given with --ec2-state, or implied by the command,
+        such as stopped instances for start-instances.
+
+        Args:
+            * words: A list of strings for each word in the command text.
+            * word_before_cursor: A string representing the word before
+                the cursor.
+
+        Returns:
+            A string representing the instance state, or None to complete
+            instances in any state.
+        """
+        if word_before_cursor:
+            words = words[:-1]
+        state = None
+        for i, word in enumerate(words):
+            if word == self.resources.EC2_STATE and i + 1 < len(words):
+                return words[i + 1]
+            if state is None:
+                state = self.COMMAND_INSTANCE_STATES.get(word)
+        return state
+
+    def get_scoped_resource(self, resources, option_text, words,
+                            word_before_cursor):
+        """Gets the resources of an option, scoped by the tag on the line.
+
+        Tag values are scoped to the tag key given before them, and
+        instance ids to the instances with the tag and state given before
+        them.
+
+        Args:
+            * resources: An instance of AwsResources.
+            * option_text: A string representing a resource option, such
+                as '--instance-ids'.
+            * words: A list of strings for each word in the command text.
+            * word_before_cursor: A string representing the word before
+                the cursor.
+
+        Returns:
+            A tuple of the resource collection and a hashable identifying
+            its scope.
+        """
+        if option_text == resources.EC2_TAG_VALUE:
+            key, _ = self.get_tag_filter(words, word_before_cursor)
+            if key is not None:
+                return resources.get_tag_values(key), (key, None)
+        elif option_text == resources.INSTANCE_IDS:
+            key, value = self.get_tag_filter(words, word_before_cursor)
+            state = self.get_state_filter(words, word_before_cursor)
+            scope = (key, value, state)
+            if scope != (None, None, None):
+                return resources.get_instance_ids(*scope), scope
+        return self.get_resource_map(resources)[option_text], None
+
+    def completing_tag_value(self, words, word_before_cursor):
+        """Gets the tag key whose value is being completed after --ec2-tag.
+
+        Args:
+            * words: A list of strings for each word in the command text.
+            * word_before_cursor: A string representing the word before
+                the cursor.
+
+        Returns:
+            A string representing the tag key, or None if no tag value is
+            being completed.
+        """
+        # ... --ec2-tag Stack
+        # ... --ec2-tag Stack [user is now completing the tag value]
+        if word_before_cursor:
+            words = words[:-1]
+        if len(words) >= 2 and words[-2] == self.resources.EC2_TAG:
+            return words[-1]
+        return None
 
     def replace_shortcut(self, text):
         """Replaces matched shortcut commands with their full command.
 
-        Currently, only one shortcut is replaced before shortcut replacement
-        terminates, although this function could potentially be extended
-        to replace mutliple shortcuts.
+        Every shortcut in text is replaced, preferring the longest shortcut
+        starting at a word, and each `%s` in a full command is substituted
+        with the words following the shortcut.
 
         Args:
             * text: A string representing the input command text to replace.
 
         Returns:
-            A string representing input command text with a shortcut
-                replaced, if one has been found.
+            A string representing input command text with its shortcuts
+                replaced, if any have been found.
         """
-        for key, value in self.shortcuts.items():
-            if key in text:
-                text = re.sub(key, value, text)
-                text = self.replace_substitution(text)
-                break
-        return text
+        return self.shortcut_expander.expand(text)
 
     def replace_substitution(self, text):
-        """Replaces a `%s` with the word immediately following it.
-
-        Currently, only one substitution is done before replacement terminates,
-        although this function could potentially be extended to do multiple
-        subsitutions.
+        """Replaces each `%s` with the trailing words of text, in order.
 
         Args:
             * text: A string representing the input command text to replace.
 
         Returns:
-            A string representing input command text with a substitution,
-            if one has been found.
+            A string representing input command text with its substitutions,
+            if any have been found.
         """
-        if '%s' in text:
+        count = text.count('%s')
+        if count:
             tokens = text.split()
-            text = ' '.join(tokens[:-1])
-            text = re.sub('%s', tokens[-1], text)
+            arguments = tokens[-count:]
+            text = ' '.join(tokens[:-count])
+            for argument in arguments:
+                text = text.replace('%s', argument, 1)
         return text
 
     def get_resource_completions(self, words, word_before_cursor,
-                                 option_text, resource):
+                                 option_text, resource, key=None):
         """Get completions for enabled AWS resources.
 
         Args:
@@ -143,26 +419,51 @@ class AwsCompleter(Completer):
             * resource: A list that represents the resource completions to
                 display if option_text is matched.  For example, instance ids,
                 instance tags, etc.
+            * key: A hashable identifying the resource collection across
+                refreshes, so its prefix index is updated rather than
+                rebuilt, or None.
 
         Returns:
             A generator of prompt_toolkit's Completion objects, containing
             matched completions.
         """
+        if self.completing_option(words, word_before_cursor, option_text):
+            return self.text_utils.find_matches(word_before_cursor,
+                                                resource,
+                                                self.fuzzy_match,
+                                                key,
+                                                self.max_completions)
+
+    def completing_option(self, words, word_before_cursor, option_text):
+        """Determines whether the value of an option is being completed.
+
+        Args:
+            * words: A list of words that represent the input command text.
+            * word_before_cursor: A string representing the word before the
+                cursor.
+            * option_text: A string representing the option text, such as
+                '--ec2-state'.
+
+        Returns:
+            A boolean that determines whether the option value is being
+            completed.
+        """
         if len(words) <= 1:
-            return
+            return False
         # Show the matching resources in the following scenarios:
         # ... --instance-ids
         # ... --instance-ids [user is now completing the instance id]
         option_text_match = (words[-1] == option_text)
         completing_res = (words[-2] == option_text and word_before_cursor != '')
-        if option_text_match or completing_res:
-            return self.text_utils.find_matches(word_before_cursor,
-                                                resource,
-                                                self.fuzzy_match)
+        return option_text_match or completing_res
 
     def get_aws_cli_completions(self, document):
         """Get completions from the official AWS CLI for the current scope.
 
+        Completions are cached per scope, the words before the current word.
+        When the user keeps typing the current word, the cached completions
+        for the scope are narrowed down instead of asking awscli again.
+
         Args:
             * document: An instance of prompt_toolkit's Document.
 
@@ -170,22 +471,71 @@ class AwsCompleter(Completer):
             A list of string completions.
         """
         text = self.replace_shortcut(document.text)
-        old_stdout = sys.stdout
-        sys.stdout = mystdout = cStringIO()
-        try:
-            # Capture the AWS CLI autocompleter and store it in a string
-            self.aws_completer.complete(text, len(text))
-        except Exception as e:
-            self.log_exception(e, traceback)
-        sys.stdout = old_stdout
-        aws_completer_results = mystdout.getvalue()
-        # Tidy up the completions and store it in a list
-        aws_completer_results = re.sub('\n', '', aws_completer_results)
-        aws_completer_results_list = aws_completer_results.split()
-        return aws_completer_results_list
+        if not text.strip():
+            return []
+        if text[-1].isspace():
+            # awscli ignores the trailing whitespace and completes the last
+            # word, so these results can't be narrowed by the next word
+            return self.completion_backend.complete(text)
+        words = text.split()
+        scope = tuple(words[:-1])
+        word = words[-1]
+
+        def can_narrow(entry):
+            prefix, completions = entry
+            return word.startswith(prefix) and word not in completions
+
+        entry = self.completion_cache.get(scope, predicate=can_narrow)
+        if entry is not None:
+            completions = [completion for completion in entry[1]
+                           if self.completion_startswith(completion, word)]
+        else:
+            completions = self.completion_backend.complete(text)
+            if not all(self.completion_startswith(completion, word)
+                       for completion in completions):
+                # awscli changed scope, for example completing 'ec2' lists
+                # its subcommands, so don't narrow these completions later
+                return completions
+        self.completion_cache.put(scope, (word, completions))
+        return completions
+
+    def completion_startswith(self, completion, word):
+        """Determines whether an awscli completion matches the word typed.
+
+        Options are matched ignoring their leading dashes, as awscli does.
+
+        Args:
+            * completion: A string representing an awscli completion.
+            * word: A string representing the word being completed.
+
+        Returns:
+            A boolean that determines whether the completion matches.
+        """
+        if word.startswith('-'):
+            return completion.lstrip('-').startswith(word.lstrip('-'))
+        return completion.startswith(word)
+
+    def clear_cache(self):
+        """Clears the cached awscli completions.
+
+        Called when the fuzzy or shortcut matching modes are toggled.
+
+        Args:
+            * None.
+
+        Returns:
+            None.
+        """
+        self.completion_cache.clear()
 
     def get_all_resource_completions(self, words, word_before_cursor):
-        """Description.
+        """Gets the resource completions of the option being completed.
+
+        Resources are taken from the profile and region given by the
+        --profile and --region options on the command line, and scoped by
+        the instance tag given before the word being completed.  The
+        resources of the options in resource_fetchers are fetched the first
+        time they are completed, if the command is of the fetcher's service.
 
         Args:
             * words: A list of strings for each word in the command text.
@@ -194,19 +544,139 @@ class AwsCompleter(Completer):
 
         Returns:
             A generator of prompt_toolkit's Completion objects, containing
-            matched completions.
+            matched completions, or None if no resource option is being
+            completed.
         """
-        completions = None
-        for key, value in self.resource_map.items():
-            if completions is None:
-                completions = self \
-                    .get_resource_completions(words,
-                                              word_before_cursor,
-                                              key,
-                                              value)
-            else:
-                break
-        return completions
+        tag_key = self.completing_tag_value(words, word_before_cursor)
+        if tag_key is not None:
+            resources = self.get_resources(words)
+            resources.refresh_expired()
+            return self.text_utils.find_matches(
+                word_before_cursor,
+                resources.get_tag_values(tag_key),
+                self.fuzzy_match,
+                (resources.profile, resources.region,
+                 resources.EC2_TAG_VALUE, (tag_key, None)),
+                self.max_completions)
+        for option_text in self.resource_map:
+            if self.completing_option(words, word_before_cursor, option_text):
+                resources = self.get_resources(words)
+                # Expired resources are completed while they are refreshed
+                resources.refresh_expired()
+                resource, scope = self.get_scoped_resource(
+                    resources, option_text, words, word_before_cursor)
+                completions = self.get_resource_completions(
+                    words,
+                    word_before_cursor,
+                    option_text,
+                    resource,
+                    (resources.profile, resources.region, option_text, scope))
+                if option_text == resources.INSTANCE_IDS:
+                    return self.get_instance_completions(
+                        resources, word_before_cursor, resource, completions)
+                return completions
+        service_name = self.get_service_name(words)
+        for option_text in self.resource_fetchers:
+            # Options such as --table-name are shared by unrelated services
+            fetcher = self.resource_fetchers.get(option_text)
+            if fetcher.service_name == service_name and \
+                    self.completing_option(words, word_before_cursor,
+                                           option_text):
+                resources = self.get_resources(words)
+                return self.get_resource_completions(
+                    words,
+                    word_before_cursor,
+                    option_text,
+                    resources.get_lazy_resources(option_text),
+                    (resources.profile, resources.region, option_text))
+        return None
+
+    def get_instance_completions(self, resources, word_before_cursor,
+                                 instance_ids, completions):
+        """Adds the instances found by name, tag value or IP to completions.
+
+        Unless the word looks like an instance id, instances whose tag
+        values, or their words, or private IP address start with the word
+        are completed first, with their name and IP address as meta.
+
+        Args:
+            * resources: An instance of AwsResources.
+            * word_before_cursor: A string representing the word before
+                the cursor.
+            * instance_ids: A list of the instance ids in scope.
+            * completions: A generator of prompt_toolkit's Completion
+                objects, containing the matched instance ids.
+
+        Yields:
+            prompt_toolkit's Completion objects.
+        """
+        word = self.text_utils.last_token(word_before_cursor)
+        found = set()
+        if word and not word.lower().startswith('i-') and \
+                resources.instance_search_index:
+            in_scope = None
+            if instance_ids is not resources.instance_ids:
+                in_scope = set(instance_ids)
+            for completion in self.find_instances(resources, word, in_scope):
+                found.add(completion.text)
+                yield completion
+        for completion in completions:
+            if completion.text not in found:
+                yield completion
+
+    def find_instances(self, resources, word, in_scope=None):
+        """Finds instances by the start of their tag values or IP.
+
+        Args:
+            * resources: An instance of AwsResources.
+            * word: A string representing the word to find, in any case.
+            * in_scope: A set of the instance ids to complete, or None to
+                complete any instance.
+
+        Yields:
+            prompt_toolkit's Completion objects, replacing the word with
+            the ids of the instances found, at most max_completions.
+        """
+        # The search terms are lower case, but lower casing can change the
+        # length of the word the completions replace
+        search_word = word.lower()
+        if self.fuzzy_match:
+            terms = self.text_utils.fuzzy_matcher.find_matches(
+                search_word, resources.instance_search_terms)
+        else:
+            terms = self.text_utils.prefix_matcher.find_matches(
+                search_word, resources.instance_search_terms,
+                (resources.profile, resources.region, 'instance search'))
+        completions = self.iter_instance_completions(resources, word, terms,
+                                                     in_scope)
+        for completion in self.text_utils.limit_completions(
+                completions, self.max_completions):
+            yield completion
+
+    def iter_instance_completions(self, resources, word, terms, in_scope):
+        """Yields a completion for each instance found by the search terms.
+
+        Args:
+            * resources: An instance of AwsResources.
+            * word: A string representing the word the completions replace.
+            * terms: An iterable of the matching search terms, best first.
+            * in_scope: A set of the instance ids to complete, or None to
+                complete any instance.
+
+        Yields:
+            prompt_toolkit's Completion objects, replacing the word with
+            the ids of the instances found, each only once.
+        """
+        seen = set()
+        for term in terms:
+            for instance_id in resources.instance_search_index.get(term, []):
+                if instance_id in seen or \
+                        in_scope is not None and instance_id not in in_scope:
+                    continue
+                seen.add(instance_id)
+                yield Completion(
+                    instance_id, -len(word),
+                    display_meta=resources.get_instance_label(instance_id))
 
     def get_completions(self, document, _):
         """Get completions for the current scope.
@@ -219,26 +689,166 @@ class AwsCompleter(Completer):
             A generator of prompt_toolkit's Completion objects, containing
             matched completions.
         """
-        aws_completer_results_list = self.get_aws_cli_completions(document)
-        self.aws_completions = set()
-        if len(document.text) < len(self.BASE_COMMAND):
-            # Autocomplete 'aws' at the beginning of the command
-            self.aws_completions.update([self.BASE_COMMAND])
-        else:
-            self.aws_completions.update(aws_completer_results_list)
         word_before_cursor = document.get_word_before_cursor(WORD=True)
         words = self.text_utils.get_tokens(document.text)
         if len(words) == 0:
             return []
-        elif len(words) == 2 and words[0] == self.BASE_COMMAND:
+        completions = self.get_all_resource_completions(words,
+                                                        word_before_cursor)
+        if completions is not None:
+            return completions
+        # Build the completions locally, get_completions can be called
+        # from several completion threads at once
+        aws_completions = set()
+        if len(document.text) < len(self.BASE_COMMAND):
+            # Autocomplete 'aws' at the beginning of the command
+            aws_completions.update([self.BASE_COMMAND])
+        else:
+            aws_completions.update(self.get_aws_cli_completions(document))
+        if len(words) == 2 and words[0] == self.BASE_COMMAND:
             # Insert shortcuts if the user typed 'aws' as the first
             # command and is inputting the subcommand
             if self.shortcut_match:
-                self.aws_completions.update(self.shortcuts.keys())
-        completions = self.get_all_resource_completions(words,
-                                                        word_before_cursor)
-        if completions is None:
-            completions = self .text_utils.find_matches(word_before_cursor,
-                                                        self.aws_completions,
-                                                        self.fuzzy_match)
-        return completions
+                aws_completions.update(self.shortcuts.keys())
+        self.aws_completions = aws_completions
+        return self.text_utils.find_matches(word_before_cursor,
+                                            aws_completions,
+                                            self.fuzzy_match,
+                                            limit=self.max_completions)
+
+
+class AsyncCompleter(Completer):
+    """Computes completions on a worker thread, cancelling stale ones.
+
+    prompt_toolkit asks for completions from a single completion thread and
+    waits for the answer before it can start completing the next keystroke.
+    AsyncCompleter hands each request to a single long-lived worker thread
+    instead, and every new request or call to cancel supersedes the
+    previous one: its caller returns no completions right away, the worker
+    stops at the next completion it yields, and its results are never
+    published.  Requests superseded before the worker picks them up are
+    never started, so at most one completion is computed at a time.
+
+    Attributes:
+        * completer: An instance of prompt_toolkit's Completer, such as
+            AwsCompleter, that computes the completions.
+        * log_exception: A callable log_exception from SawsLogger.
+    """
+
+    def __init__(self, completer, log_exception):
+        """Initializes AsyncCompleter.
+
+        Args:
+            * completer: An instance of prompt_toolkit's Completer.
+            * log_exception: A callable log_exception from SawsLogger.
+
+        Returns:
+            None.
+        """
+        self.completer = completer
+        self.log_exception = log_exception
+        self._generation = 0
+        self._results = {}
+        self._pending = None
+        self._worker = None
+        self._condition = threading.Condition()
+
+    def cancel(self):
+        """Cancels the in-flight completion, if any.
+
+        Hooked to the buffer's on_text_changed event, so each keystroke
+        cancels the completion of the previous document.
+
+        Args:
+            * None.
+
+        Returns:
+            None.
+        """
+        with self._condition:
+            self._generation += 1
+            self._results.clear()
+            self._pending = None
+            self._condition.notify_all()
+
+    def is_cancelled(self, generation):
+        """Determines whether a completion request has been superseded.
+
+        Args:
+            * generation: An int identifying the completion request.
+
+        Returns:
+            A boolean that determines whether the request was cancelled.
+        """
+        return generation != self._generation
+
+    def _complete(self, generation, document, complete_event):
+        """Computes the completions for a request on a worker thread.
+
+        Internal method, call get_completions instead.
+
+        Args:
+            * generation: An int identifying the completion request.
+            * document: An instance of prompt_toolkit's Document.
+            * complete_event: An instance of prompt_toolkit's CompleteEvent.
+
+        Returns:
+            None.
+        """
+        completions = []
+        try:
+            for completion in self.completer.get_completions(document,
+                                                             complete_event):
+                if self.is_cancelled(generation):
+                    return
+                completions.append(completion)
+        except Exception as e:
+            self.log_exception(e, traceback)
+        with self._condition:
+            if not self.is_cancelled(generation):
+                self._results[generation] = completions
+                self._condition.notify_all()
+
+    def _run(self):
+        """Computes the latest pending request, for ever, on the worker.
+
+        Internal method, started by get_completions.
+
+        Args:
+            * None.
+
+        Returns:
+            None.
+        """
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                generation, document, complete_event = self._pending
+                self._pending = None
+            self._complete(generation, document, complete_event)
+
+    def get_completions(self, document, complete_event):
+        """Get completions for the current scope.
+
+        Args:
+            * document: An instance of prompt_toolkit's Document.
+            * complete_event: An instance of prompt_toolkit's CompleteEvent.
+
+        Returns:
+            A list of prompt_toolkit's Completion objects, which is empty
+            if the request was cancelled by a newer one.
+        """
+        with self._condition:
+            self.cancel()
+            generation = self._generation
+            self._pending = (generation, document, complete_event)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run)
+                self._worker.daemon = True
+                self._worker.start()
+            self._condition.notify_all()
+            while generation not in self._results and \
+                    not self.is_cancelled(generation):
+                self._condition.wait()
+            return self._results.pop(generation, [])
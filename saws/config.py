@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 from __future__ import print_function
 import shutil
 import os
+import threading
 try:
     from collections import OrderedDict
 except:
@@ -13,10 +14,18 @@ from configobj import ConfigObj
 class Config(object):
     """Reads and writes the config file `sawsrc`.
 
+    The config files are read once per process.  Each call to
+    read_configuration returns a copy of that snapshot, so changes made
+    through one ConfigObj, such as toggling fuzzy matching, don't leak
+    into the others.
+
     Attributes:
         * None
     """
 
+    _snapshot = None
+    _lock = threading.Lock()
+
     def _read_configuration(self, usr_config, def_config=None):
         """Reads the config file if it exists, else reads the default config.
 
@@ -56,17 +65,28 @@ class Config(object):
     def read_configuration(self):
         """Reads the config file if it exists, else reads the default config.
 
+        The files are only read the first time, later calls copy the
+        configuration read then.
+
         Args:
             * None.
 
         Returns:
             An instance of a ConfigObj.
         """
-        config_template = 'sawsrc'
-        config_name = '~/.sawsrc'
-        default_config = os.path.join(os.path.dirname(__file__), config_template)
-        self.write_default_config(default_config, config_name)
-        return self._read_configuration(config_name, default_config)
+        with Config._lock:
+            if Config._snapshot is None:
+                config_template = 'sawsrc'
+                config_name = '~/.sawsrc'
+                default_config = os.path.join(os.path.dirname(__file__),
+                                              config_template)
+                self.write_default_config(default_config, config_name)
+                Config._snapshot = self._read_configuration(config_name,
+                                                            default_config)
+            snapshot = Config._snapshot
+        cfg = ConfigObj(snapshot, interpolation=False)
+        cfg.filename = snapshot.filename
+        return cfg
 
     def get_shortcuts(self, config):
         """Gets the shortcuts from the specified config.
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import contextlib
+import glob
+import io
+import logging
+import os
+import six
+import sys
+import traceback
+from six.moves import cStringIO
+from .commands import AwsCommands
+from .utils import Tokenizer
+
+
+class ClidriverExecutor(object):
+    """Runs aws commands in process with resident awscli clidrivers.
+
+    Running `aws` in the shell starts a new interpreter that imports awscli
+    and botocore and loads the service models for every command.  Instead,
+    a clidriver is kept for each profile, so its botocore session, resolved
+    credentials and loaded models are reused by the following commands.
+
+    Commands that need the shell, such as pipelines, redirections, variables
+    or globs matching files, are left to the shell, as are commands with
+    global options that change the session for the commands that follow.
+
+    Attributes:
+        * aws_clidriver: The awscli clidriver module.
+        * log_exception: A callable log_exception from SawsLogger.
+        * pygments_cmd: A string representing the pipe to pygmentize that
+            saws appends to commands to highlight their output.  The output
+            of these commands is highlighted in process instead.
+        * max_commands: An int representing the number of commands a
+            clidriver runs before it is replaced, as awscli registers a few
+            handlers on the session for each command.
+        * drivers: A dict mapping each profile, or None for the default
+            profile, to a list of its clidriver, the number of commands it
+            ran and the modification times of the aws config files.
+    """
+
+    SHELL_CHARS = set('|&;<>()$`{\n')
+    GLOB_CHARS = set('*?[')
+    SHELL_OPTIONS = ['--no-sign-request']
+    LOGGERS = ['botocore', 'awscli', 's3transfer', 'urllib3']
+
+    def __init__(self, aws_clidriver, log_exception, pygments_cmd,
+                 max_commands=100):
+        """Initializes ClidriverExecutor.
+
+        Args:
+            * aws_clidriver: The awscli clidriver module.
+            * log_exception: A callable log_exception from SawsLogger.
+            * pygments_cmd: A string representing the pipe to pygmentize
+                that saws appends to highlight output.
+            * max_commands: An int representing the number of commands a
+                clidriver runs before it is replaced.
+
+        Returns:
+            None.
+        """
+        self.aws_clidriver = aws_clidriver
+        self.log_exception = log_exception
+        self.pygments_cmd = pygments_cmd
+        self.max_commands = max_commands
+        self.drivers = {}
+
+    def execute(self, text):
+        """Runs the command in process, if it doesn't need the shell.
+
+        Args:
+            * text: A string representing the input command text.
+
+        Returns:
+            An int representing the exit code the command would have had in
+            the shell, or None if the command needs the shell.  As in the
+            shell, a highlighted command exits with the status of the
+            highlighting rather than of awscli.
+        """
+        text = text.strip()
+        highlight = text.endswith(self.pygments_cmd)
+        if highlight:
+            text = text[:-len(self.pygments_cmd)]
+        args = self.get_args(text)
+        if args is None or args[:1] != [AwsCommands.AWS_COMMAND] or \
+                any(arg in self.SHELL_OPTIONS for arg in args):
+            return None
+        args = args[1:]
+        if not highlight:
+            return self.run(args)
+        with self.capture_stdout() as output:
+            self.run(args)
+        self.write_highlighted(output())
+        # The shell returns the status of the last command of the pipeline
+        return 0
+
+    def get_args(self, text):
+        """Splits the command into arguments as the shell would.
+
+        Args:
+            * text: A string representing the command text.
+
+        Returns:
+            A list of string arguments, or None if the command uses quoting,
+            expansions or operators that only the shell can handle.
+        """
+        args = []
+        word, quoted, globbed = None, False, False
+        for match in Tokenizer.CHUNK_REGEX.finditer(text):
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == 'space':
+                if '\n' in value:
+                    return None
+                if word is not None:
+                    if globbed and (quoted or glob.glob(word)):
+                        return None
+                    args.append(word)
+                word, quoted, globbed = None, False, False
+                continue
+            if kind == 'word':
+                if self.SHELL_CHARS.intersection(value) or \
+                        word is None and value[0] in '~#':
+                    return None
+                globbed = globbed or \
+                    bool(self.GLOB_CHARS.intersection(value))
+            elif kind in ('single', 'double'):
+                # Unterminated quotes are left for the shell to report
+                if match.end(kind) == match.end():
+                    return None
+                if kind == 'double':
+                    if '$' in value or '`' in value or '\\\n' in value:
+                        return None
+                    value = Tokenizer.DOUBLE_QUOTE_ESCAPE_REGEX.sub(
+                        r'\1', value)
+                quoted = True
+            elif kind == 'escaped':
+                if not value:
+                    return None
+                # A backslash before a newline continues the line
+                if value == '\n':
+                    continue
+                quoted = True
+            word = (word or '') + value
+        if word is not None:
+            if globbed and (quoted or glob.glob(word)):
+                return None
+            args.append(word)
+        return args
+
+    def get_profile(self, args):
+        """Gets the profile named by the --profile option.
+
+        Args:
+            * args: A list of string arguments, without `aws`.
+
+        Returns:
+            A string representing the profile, or None for the default
+            profile.
+        """
+        profile = None
+        for index, arg in enumerate(args):
+            if arg == '--profile' and index + 1 < len(args):
+                profile = args[index + 1]
+            elif arg.startswith('--profile='):
+                profile = arg.split('=', 1)[1]
+        return profile
+
+    def get_config_mtimes(self, session):
+        """Gets the modification times of the aws config files.
+
+        Args:
+            * session: An instance of botocore's Session.
+
+        Returns:
+            A tuple of the modification time of each config file, or None
+            if it doesn't exist.
+        """
+        mtimes = []
+        for name in ['config_file', 'credentials_file']:
+            try:
+                path = os.path.expanduser(session.get_config_variable(name))
+                mtimes.append(os.stat(path).st_mtime)
+            except (OSError, TypeError):
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def get_driver(self, profile):
+        """Gets the clidriver for the profile, creating it if needed.
+
+        A clidriver is replaced once it ran max_commands commands, or when
+        the aws config or credentials files changed since it was created.
+
+        Args:
+            * profile: A string representing the profile, or None for the
+                default profile.
+
+        Returns:
+            An instance of awscli's CLIDriver.
+        """
+        entry = self.drivers.get(profile)
+        if entry is not None and (
+                entry[1] >= self.max_commands or
+                entry[2] != self.get_config_mtimes(entry[0].session)):
+            entry = None
+        if entry is None:
+            driver = self.aws_clidriver.create_clidriver()
+            entry = [driver, 0, self.get_config_mtimes(driver.session)]
+            self.drivers[profile] = entry
+        entry[1] += 1
+        return entry[0]
+
+    def run(self, args):
+        """Runs the aws command with the resident clidriver.
+
+        Session variables, default client config and loggers changed by the
+        command's global options are restored afterwards, so they don't
+        carry over to the following commands.
+
+        Args:
+            * args: A list of string arguments, without `aws`.
+
+        Returns:
+            An int representing the exit code of the command.
+        """
+        profile = self.get_profile(args)
+        driver = self.get_driver(profile)
+        session = driver.session
+        variables = session.instance_variables()
+        client_config = session.get_default_client_config()
+        loggers = [(logger, logger.handlers[:], logger.level) for logger in
+                   [logging.getLogger(name) for name in self.LOGGERS]]
+        # argparse names the program in usage errors after sys.argv[0]
+        argv = sys.argv
+        sys.argv = [AwsCommands.AWS_COMMAND] + args
+        try:
+            exit_code = driver.main(args)
+            # Older awscli versions do not record the CLI history
+            history_recorder = getattr(self.aws_clidriver,
+                                       'HISTORY_RECORDER', None)
+            if history_recorder is not None:
+                history_recorder.record('CLI_RC', exit_code, 'CLI')
+            # Some commands return None, which the interpreter exits with 0
+            exit_code = exit_code or 0
+        except SystemExit as e:
+            # argparse exits on usage errors, as the interpreter would
+            if e.code is None or isinstance(e.code, int):
+                exit_code = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except Exception as e:
+            self.log_exception(e, traceback)
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            sys.argv = argv
+            used_profile = session.instance_variables().get('profile')
+            for name, value in session.instance_variables().items():
+                if variables.get(name) != value:
+                    session.set_config_variable(name, variables.get(name))
+            session.set_default_client_config(client_config)
+            for logger, handlers, level in loggers:
+                logger.handlers[:] = handlers
+                logger.setLevel(level)
+            sys.stdout.flush()
+            sys.stderr.flush()
+        # An abbreviated --profile option would have resolved credentials
+        # for another profile in this session
+        if used_profile != profile:
+            self.drivers.pop(profile, None)
+        return exit_code
+
+    @contextlib.contextmanager
+    def capture_stdout(self):
+        """Captures what is written to stdout in the with block.
+
+        Args:
+            * None.
+
+        Yields:
+            A callable returning the captured string.
+        """
+        old_stdout = sys.stdout
+        if six.PY2:
+            sys.stdout = stream = cStringIO()
+        else:
+            # awscli writes binary output to sys.stdout.buffer
+            sys.stdout = stream = io.TextIOWrapper(io.BytesIO(),
+                                                   encoding='utf-8')
+
+        def output():
+            stream.flush()
+            if six.PY2:
+                return stream.getvalue().decode('utf-8', 'replace')
+            return stream.buffer.getvalue().decode('utf-8', 'replace')
+
+        try:
+            yield output
+        finally:
+            sys.stdout = old_stdout
+
+    def write_highlighted(self, output):
+        """Writes the output highlighted as json, as pygmentize would.
+
+        Args:
+            * output: A string representing the output of a command.
+
+        Returns:
+            None.
+        """
+        if not output:
+            return
+        from pygments import highlight
+        from pygments.formatters import Terminal256Formatter, \
+            TerminalFormatter
+        from pygments.lexers import JsonLexer
+        if '256' in os.environ.get('TERM', ''):
+            formatter = Terminal256Formatter()
+        else:
+            formatter = TerminalFormatter()
+        sys.stdout.write(highlight(output, JsonLexer(), formatter))
+        sys.stdout.flush()
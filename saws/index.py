@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import os
+import sys
+import tempfile
+import zlib
+import awscli
+from six.moves import cPickle as pickle
+
+
+class AwsCommandIndex(object):
+    """Precompiled command -> subcommand -> option tree of the awscli.
+
+    The tree is generated from the installed awscli/botocore models by
+    build() and saved to ~/.saws-index, so completions can be answered
+    without touching awscli at runtime.  The file starts with a one line
+    header recording the index format and the awscli version it was built
+    from, which lets a stale index be detected without loading it.
+
+    Regenerate the index with:
+        python -m saws.index
+
+    Attributes:
+        * INDEX_PATH: A string representing the default index file path.
+        * FORMAT_VERSION: An int representing the index file format.
+        * HEADER_PREFIX: A bytes string marking the start of the header.
+        * global_options: A dict mapping each global option name (without
+            the leading dashes) to a tuple of its possible values.
+        * commands: A dict mapping each command to a dict of its
+            subcommands, which in turn map each option name (without
+            the leading dashes) to a tuple of its possible (enum) values.
+        * awscli_version: A string representing the awscli version the
+            index was built from.
+    """
+
+    INDEX_PATH = os.path.expanduser('~/.saws-index')
+    FORMAT_VERSION = 1
+    HEADER_PREFIX = b'saws-index'
+
+    def __init__(self, global_options=None, commands=None,
+                 awscli_version=None):
+        """Initializes AwsCommandIndex.
+
+        Args:
+            * global_options: A dict of global options and their values.
+            * commands: A dict of commands, subcommands and options.
+            * awscli_version: A string representing the awscli version.
+
+        Returns:
+            None.
+        """
+        self.global_options = global_options or {}
+        self.commands = commands or {}
+        self.awscli_version = awscli_version or awscli.__version__
+
+    @classmethod
+    def build(cls, driver=None, services=None):
+        """Builds the index by walking the awscli command tables.
+
+        This loads every service model and can take several seconds.
+
+        Args:
+            * driver: An instance of awscli's CLIDriver, created if None.
+            * services: An optional list of command names to index,
+                all commands are indexed if None.
+
+        Returns:
+            An instance of AwsCommandIndex.
+        """
+        if driver is None:
+            from awscli.clidriver import create_clidriver
+            driver = create_clidriver()
+        main_help = driver.create_help_command()
+        global_options = cls._index_options(main_help.arg_table)
+        commands = {}
+        for command_name, command in main_help.command_table.items():
+            if services is not None and command_name not in services:
+                continue
+            if getattr(command, '_UNDOCUMENTED', False):
+                continue
+            command_help = command.create_help_command()
+            sub_commands = {}
+            if command_help is not None and \
+                    command_help.command_table is not None:
+                for sub_command_name, sub_command in \
+                        command_help.command_table.items():
+                    if getattr(sub_command, '_UNDOCUMENTED', False):
+                        continue
+                    sub_command_help = sub_command.create_help_command()
+                    sub_commands[sub_command_name] = \
+                        cls._index_options(sub_command_help.arg_table)
+            commands[command_name] = sub_commands
+        return cls(global_options, commands, awscli.__version__)
+
+    @staticmethod
+    def _index_options(arg_table):
+        """Indexes the documented options of an awscli argument table.
+
+        Internal method, call build instead.
+
+        Args:
+            * arg_table: A dict of awscli arguments keyed by name.
+
+        Returns:
+            A dict mapping each option name to a tuple of its values.
+        """
+        options = {}
+        for name, argument in arg_table.items():
+            if getattr(argument, '_UNDOCUMENTED', False) or \
+                    getattr(argument, 'positional_arg', False):
+                continue
+            values = getattr(argument, 'choices', None)
+            if not values:
+                model = getattr(argument, 'argument_model', None)
+                values = getattr(model, 'enum', None)
+            options[name] = tuple(values or ())
+        return options
+
+    @classmethod
+    def read_header(cls, path):
+        """Reads the format and awscli version from the index header.
+
+        Only the first line of the file is read.
+
+        Args:
+            * path: A string representing the index file path.
+
+        Returns:
+            A tuple of (format version, awscli version), or None if the
+            file does not exist or is not an index.
+        """
+        try:
+            with open(path, 'rb') as fp:
+                header = fp.readline()
+        except IOError:
+            return None
+        fields = header.split()
+        if len(fields) != 3 or fields[0] != cls.HEADER_PREFIX:
+            return None
+        try:
+            return int(fields[1]), fields[2].decode('utf-8')
+        except ValueError:
+            return None
+
+    @classmethod
+    def is_current(cls, path=None):
+        """Checks the index was built with this format and awscli version.
+
+        Args:
+            * path: A string representing the index file path.
+
+        Returns:
+            A boolean, False if the index is missing or stale.
+        """
+        header = cls.read_header(path or cls.INDEX_PATH)
+        return header == (cls.FORMAT_VERSION, awscli.__version__)
+
+    @classmethod
+    def load(cls, path=None):
+        """Loads the index from a file.
+
+        Args:
+            * path: A string representing the index file path.
+
+        Returns:
+            An instance of AwsCommandIndex.
+        """
+        with open(path or cls.INDEX_PATH, 'rb') as fp:
+            fp.readline()
+            data = pickle.loads(zlib.decompress(fp.read()))
+        return cls(data['global_options'],
+                   data['commands'],
+                   data['awscli_version'])
+
+    def save(self, path=None):
+        """Saves the index to a file.
+
+        The index is written to a temporary file that is renamed over the
+        index, so an interrupted save never leaves a truncated index with a
+        current header.
+
+        Args:
+            * path: A string representing the index file path.
+
+        Returns:
+            None.
+        """
+        path = path or self.INDEX_PATH
+        data = {
+            'global_options': self.global_options,
+            'commands': self.commands,
+            'awscli_version': self.awscli_version,
+        }
+        header = ' '.join([self.HEADER_PREFIX.decode('utf-8'),
+                           str(self.FORMAT_VERSION),
+                           self.awscli_version]) + '\n'
+        handle, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), prefix='.saws-index-')
+        try:
+            with os.fdopen(handle, 'wb') as fp:
+                fp.write(header.encode('utf-8'))
+                fp.write(zlib.compress(pickle.dumps(data, 2)))
+            # os.rename does not replace an existing file on Windows
+            getattr(os, 'replace', os.rename)(temp_path, path)
+        except:
+            os.remove(temp_path)
+            raise
+
+    def complete(self, text):
+        """Gets the completions for text from the index.
+
+        Mirrors the scoping rules of awscli's Completer, and additionally
+        completes the possible values of options with enum values.
+
+        Args:
+            * text: A string representing the input command text.
+
+        Returns:
+            A list of string completions, or None if the index can not
+            answer, for example completing the value of --profile.
+        """
+        args = text.split()
+        if not args:
+            return []
+        current_arg = args[-1]
+        cmd_args = [w for w in args if not w.startswith('-')]
+        opts = [w for w in args if w.startswith('-')]
+        cmd_name = self._find_name(self.commands, cmd_args)
+        if cmd_name is None:
+            if current_arg.startswith('-'):
+                return self._complete_options(current_arg, opts)
+            elif current_arg == 'aws':
+                return list(self.commands)
+            return self._starting_with(self.commands, current_arg)
+        sub_commands = self.commands[cmd_name]
+        sub_command_name = self._find_name(sub_commands, cmd_args)
+        if sub_command_name is None:
+            if current_arg == cmd_name:
+                return list(sub_commands)
+            elif current_arg.startswith('-'):
+                return self._complete_options(current_arg, opts)
+            return self._starting_with(sub_commands, current_arg)
+        options = sub_commands[sub_command_name]
+        if current_arg != sub_command_name and current_arg.startswith('-'):
+            return self._complete_options(current_arg, opts, options)
+        if len(args) > 1 and not current_arg.startswith('-'):
+            # Complete the enum values of the option before the cursor
+            option = args[-2].lstrip('-')
+            values = options.get(option) or \
+                self.global_options.get(option, ())
+            return [v for v in values if v.startswith(current_arg)]
+        return []
+
+    def _find_name(self, table, cmd_args):
+        """Finds the first word in cmd_args that is a key in table.
+
+        Internal method, call complete instead.
+
+        Args:
+            * table: A dict of command or subcommand names.
+            * cmd_args: A list of words that are not options.
+
+        Returns:
+            A string representing the name found, or None.
+        """
+        for name in cmd_args:
+            if name in table:
+                return name
+        return None
+
+    def _starting_with(self, table, word):
+        """Lists the keys in table starting with word.
+
+        Internal method, call complete instead.
+
+        Args:
+            * table: A dict of command or subcommand names.
+            * word: A string to match.
+
+        Returns:
+            A list of matching strings.
+        """
+        return [name for name in table if name.startswith(word)]
+
+    def _complete_options(self, current_arg, opts, options=None):
+        """Completes option names, or the values of a completed option.
+
+        Internal method, call complete instead.
+
+        Args:
+            * current_arg: A string representing the word being completed.
+            * opts: A list of the options already on the command line.
+            * options: A dict of the subcommand's options, or None.
+
+        Returns:
+            A list of string completions, or None if the values of the
+            option can not be answered from the index.
+        """
+        all_options = dict(self.global_options)
+        if options is not None:
+            all_options.update(options)
+        for option in opts:
+            if option != current_arg:
+                all_options.pop(option.lstrip('-'), None)
+        cw = current_arg.lstrip('-')
+        possibilities = ['--' + n for n in all_options if n.startswith(cw)]
+        if len(possibilities) == 1 and possibilities[0] == current_arg:
+            if cw == 'profile':
+                # Profiles are read from the user's config at runtime
+                return None
+            return list(all_options[cw])
+        return possibilities
+
+
+def main():
+    """Regenerates the command index from the installed awscli.
+
+    Args:
+        * None.
+
+    Returns:
+        None.
+    """
+    path = sys.argv[1] if len(sys.argv) > 1 else AwsCommandIndex.INDEX_PATH
+    index = AwsCommandIndex.build()
+    index.save(path)
+    print('Indexed {0} commands from awscli {1} into {2}'.format(
+        len(index.commands), index.awscli_version, path))
+
+
+if __name__ == '__main__':
+    main()
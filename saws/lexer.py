@@ -1,77 +1,219 @@
 # -*- coding: utf-8
-from pygments.lexer import RegexLexer
-from pygments.lexer import words
-from pygments.token import Keyword, Name, Operator, Generic, Literal
+import re
+from bisect import bisect_left
+from collections import deque
+from pygments.lexer import Lexer
+from pygments.token import Keyword, Name, Operator, Generic, Literal, Text
 from .commands import AwsCommands
-from .config import Config
 
 
-class CommandLexer(RegexLexer):
+class CommandLexerFactory(object):
+    """Creates the lexer highlighting commands.
+
+    The lexer is built from the command model and shortcuts loaded once by
+    Saws, instead of reading data/SOURCES.txt and ~/.sawsrc again when this
+    module is imported.
+
+    The lexer splits the line into words and looks each one up in a dict
+    of the command model's words, so highlighting doesn't slow down as the
+    model grows.  The lexer created for a command model and shortcuts is
+    reused.
+
+    Attributes:
+        * lexer: A pygments Lexer subclass highlighting commands.
+    """
+
+    _lexers = {}
+
+    def __init__(self, commands, shortcuts):
+        """Initializes CommandLexerFactory.
+
+        Args:
+            * commands: A tuple, where each tuple element is a list of:
+                * commands
+                * sub_commands
+                * global_options
+                * resource_options
+                * ec2_states
+            * shortcuts: An OrderedDict containing the shortcut commands as
+                the keys and their corresponding full commands as the values.
+
+        Returns:
+            None.
+        """
+        key = (id(commands), tuple(shortcuts.keys()))
+        entry = self._lexers.get(key)
+        # The entry keeps a reference to the commands, so their id can't be
+        # reused by other commands while it is cached
+        if entry is None or entry[0] is not commands:
+            entry = (commands, self.lexer_factory(commands, shortcuts))
+            CommandLexerFactory._lexers[key] = entry
+        self.lexer = entry[1]
+
+    def lexer_factory(self, commands, shortcuts):
+        """Creates the lexer class for the commands and shortcuts.
+
+        Args:
+            * commands: A tuple of the lists of commands, sub_commands,
+                global_options, resource_options and ec2_states.
+            * shortcuts: An OrderedDict containing the shortcut commands as
+                the keys and their corresponding full commands as the values.
+
+        Returns:
+            A pygments Lexer subclass.
+        """
+        shortcut_tokens = []
+        for shortcut in shortcuts.keys():
+            tokens = shortcut.split()
+            for token in tokens:
+                shortcut_tokens.append(token)
+        token_types = {}
+        # Earlier entries take precedence, as the rules of a RegexLexer do
+        for words, token_type in [
+                ([AwsCommands.AWS_COMMAND], Literal.String),
+                ([AwsCommands.AWS_DOCS], Literal.Number),
+                (commands[AwsCommands.CommandType.COMMANDS.value],
+                 Name.Class),
+                (commands[AwsCommands.CommandType.SUB_COMMANDS.value],
+                 Keyword.Declaration),
+                (commands[AwsCommands.CommandType.GLOBAL_OPTIONS.value],
+                 Generic.Output),
+                (commands[AwsCommands.CommandType.RESOURCE_OPTIONS.value],
+                 Operator.Word),
+                (commands[AwsCommands.CommandType.EC2_STATES.value],
+                 Generic.Output),
+                (shortcut_tokens, Name.Exception)]:
+            for word in words:
+                token_types.setdefault(word, token_type)
+
+        return type(str('CommandLexer'), (CommandLexer,),
+                    {'token_types': token_types})
+
+
+class CommandLexer(Lexer):
     """Provides highlighting for commands.
 
-    Custom Pygments Lexers seem to require a specific class structure, samples:
-        http://pygments.org/docs/lexerdevelopment/
-    TODO: Investigate how to clean this up while still keeping Pygments happy.
+    prompt_toolkit lexes the whole buffer on each keystroke, so the tokens
+    of the last few documents are kept, and only the text after the last
+    word the new document shares with one of them is lexed again.
 
     Attributes:
-        * config_obj: An instance of ConfigObj.
-        * shortcuts: An OrderedDict containing the shortcut commands as the
-            keys and their corresponding full commands as the values.
-        * shortcut_tokens: A list containing words for each shortcut key:
-            key: 'aws ec2 ls' -> shortcut_tokens: ['aws', 'ec2', 'ls'].
-        * aws_commands: An instance of AwsCommands.
-        * commands: A tuple, where each tuple element is a list of:
-            * commands
-            * sub_commands
-            * global_options
-            * resource_options
-            * ec2_states
-        * tokens: A dictionary of pygments tokens.
+        * token_types: A dict mapping each word of the command model to its
+            pygments token type.
+        * CACHE_SIZE: An int representing the number of documents whose
+            tokens are kept.
     """
 
-    config = Config()
-    config_obj = config.read_configuration()
-    shortcuts = config.get_shortcuts(config_obj)
-    shortcut_tokens = []
-    for shortcut in shortcuts.keys():
-        tokens = shortcut.split()
-        for token in tokens:
-            shortcut_tokens.append(token)
-    aws_commands = AwsCommands()
-    commands = aws_commands.generate_all_commands()
-    tokens = {
-        'root': [
-            (words(tuple([AwsCommands.AWS_COMMAND]),
-                   prefix=r'\b',
-                   suffix=r'\b'),
-             Literal.String),
-            (words(tuple([AwsCommands.AWS_DOCS]),
-                   prefix=r'\b',
-                   suffix=r'\b'),
-             Literal.Number),
-            (words(tuple(commands[AwsCommands.CommandType.COMMANDS.value]),
-                   prefix=r'\b',
-                   suffix=r'\b'),
-             Name.Class),
-            (words(tuple(commands[AwsCommands.CommandType.SUB_COMMANDS.value]),
-                   prefix=r'\b',
-                   suffix=r'\b'),
-             Keyword.Declaration),
-            (words(tuple(commands[AwsCommands.CommandType.GLOBAL_OPTIONS.value]),
-                   prefix=r'',
-                   suffix=r'\b'),
-             Generic.Output),
-            (words(tuple(commands[AwsCommands.CommandType.RESOURCE_OPTIONS.value]),
-                   prefix=r'',
-                   suffix=r'\b'),
-             Operator.Word),
-            (words(tuple(commands[AwsCommands.CommandType.EC2_STATES.value]),
-                   prefix=r'',
-                   suffix=r'\b'),
-             Generic.Output),
-            (words(tuple(shortcut_tokens),
-                   prefix=r'',
-                   suffix=r'\b'),
-             Name.Exception),
-        ]
-    }
+    WORD_REGEX = re.compile(r'\S+')
+    CACHE_SIZE = 4
+    token_types = {}
+
+    def __init__(self, **options):
+        """Initializes CommandLexer.
+
+        Args:
+            * options: A dict of pygments lexer options.
+
+        Returns:
+            None.
+        """
+        super(CommandLexer, self).__init__(**options)
+        self._cache = deque(maxlen=self.CACHE_SIZE)
+
+    def get_tokens_unprocessed(self, text):
+        """Gets the tokens of the text, reusing cached tokens.
+
+        Args:
+            * text: A string representing the text to highlight.
+
+        Returns:
+            An iterator of tuples of the index, token type and value of each
+            token.
+        """
+        tokens, position = self.get_cached_tokens(text)
+        tokens.extend(self.classify(text, position))
+        self._cache.appendleft((text, tokens))
+        return iter(tokens)
+
+    def get_cached_tokens(self, text):
+        """Gets the cached tokens still valid for the text.
+
+        Tokens are reused up to the whitespace before the last word the text
+        shares with a cached document, as that word may continue in the
+        text.
+
+        Args:
+            * text: A string representing the text to highlight.
+
+        Returns:
+            A tuple of a list of the reused tokens and an int representing
+            the index in the text to continue lexing from.
+        """
+        best = ([], 0)
+        for cached_text, tokens in self._cache:
+            if cached_text == text:
+                return list(tokens), len(text)
+            common = self.common_prefix_length(text, cached_text)
+            if common <= best[1]:
+                continue
+            # The first token starting at or after the end of the prefix
+            index = bisect_left(tokens, (common,))
+            while index > 0:
+                index -= 1
+                if tokens[index][2][:1].isspace():
+                    best = (tokens[:index], tokens[index][0])
+                    break
+        return list(best[0]), best[1]
+
+    @staticmethod
+    def common_prefix_length(text, other):
+        """Finds the length of the prefix shared by two strings.
+
+        Args:
+            * text: A string.
+            * other: A string.
+
+        Returns:
+            An int representing the length of the shared prefix.
+        """
+        low, high = 0, min(len(text), len(other))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if text[:middle] == other[:middle]:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def classify(self, text, position=0):
+        """Splits the text into words and classifies each one.
+
+        Words not in the command model, and the whitespace between words,
+        are Text.  The option in --option=value is classified on its own.
+
+        Args:
+            * text: A string representing the text to highlight.
+            * position: An int representing the index to start from, which
+                must be the start of a word or of whitespace.
+
+        Returns:
+            A generator of tuples of the index, token type and value of each
+            token.
+        """
+        for match in self.WORD_REGEX.finditer(text, position):
+            start = match.start()
+            if start > position:
+                yield position, Text, text[position:start]
+            position = match.end()
+            word = match.group()
+            token_type = self.token_types.get(word)
+            if token_type is None and '=' in word:
+                option = word.split('=', 1)[0]
+                token_type = self.token_types.get(option)
+                if token_type is not None:
+                    yield start, token_type, option
+                    yield start + len(option), Text, word[len(option):]
+                    continue
+            yield start, token_type or Text, word
+        if position < len(text):
+            yield position, Text, text[position:]
@@ -3,7 +3,7 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 import click
-from .saws import Saws
+from .profiling import StartupProfiler
 
 
 # Disable Warning: Click detected the use of the unicode_literals
@@ -12,17 +12,29 @@ click.disable_unicode_literals_warning = True
 
 
 @click.command()
-def cli():
+@click.option('--profile-startup', is_flag=True,
+              help='Print the time spent in each phase of startup.')
+def cli(profile_startup):
     """Creates and calls Saws.
 
     Args:
-        * None.
+        * profile_startup: A boolean that determines whether to print the
+            time spent in each phase of startup.
 
     Returns:
         None.
     """
+    profiler = StartupProfiler()
+    with profiler.phase('imports'):
+        from .saws import Saws
     try:
-        saws = Saws()
+        saws = Saws(profiler)
+        if profile_startup:
+            # Resources load in the background once the prompt is ready,
+            # this is the time left to wait for them
+            with profiler.phase('resource load'):
+                saws.completer.resources.wait_for_refresh()
+            click.echo(profiler.format_report())
         saws.run_cli()
     except (EOFError, KeyboardInterrupt):
         saws.config_obj.write()
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import binascii
+import bisect
+import heapq
+import six
+from .cache import LRUCache
+
+
+class FuzzyIndex(object):
+    """Character postings over a collection, for fast fuzzy matching.
+
+    For every character in the collection, a bitset records which items
+    contain it.  A query only scores the items containing all of its
+    characters, found by AND-ing their bitsets, instead of running a regex
+    over every item.  Matches are ranked like fuzzyfinder: by the length of
+    the shortest match, then its start, then the item itself.
+
+    Attributes:
+        * items: A list of the indexed strings.
+        * lowered_items: A list of the indexed strings in lower case.
+        * bitsets: A dict mapping each lower case character to an int
+            bitset of the indices of the items containing it.
+    """
+
+    def __init__(self, collection):
+        """Initializes FuzzyIndex.
+
+        Args:
+            * collection: A collection of strings to index.
+
+        Returns:
+            None.
+        """
+        self.items = list(collection)
+        self.lowered_items = [item.lower() for item in self.items]
+        self.bitsets = self._build_bitsets(self.lowered_items)
+
+    def _build_bitsets(self, lowered_items):
+        """Builds the character bitsets.
+
+        Internal method, called on init.
+
+        Args:
+            * lowered_items: A list of strings in lower case.
+
+        Returns:
+            A dict mapping each character to an int bitset.
+        """
+        size = (len(lowered_items) >> 3) + 1
+        byte_sets = {}
+        for i, item in enumerate(lowered_items):
+            byte, bit = i >> 3, 1 << (i & 7)
+            for char in set(item):
+                bits = byte_sets.get(char)
+                if bits is None:
+                    bits = byte_sets[char] = bytearray(size)
+                bits[byte] |= bit
+        bitsets = {}
+        for char, bits in byte_sets.items():
+            bits.reverse()
+            bitsets[char] = int(binascii.hexlify(bytes(bits)), 16)
+        return bitsets
+
+    def candidates(self, word):
+        """Finds the indices of the items containing every char in word.
+
+        Args:
+            * word: A string in lower case.
+
+        Returns:
+            A list of ints representing item indices.
+        """
+        if not word:
+            return range(len(self.items))
+        mask = -1
+        for char in set(word):
+            bitset = self.bitsets.get(char)
+            if bitset is None:
+                return []
+            mask &= bitset
+        bits = bin(mask)[:1:-1]
+        indices = []
+        i = bits.find('1')
+        while i != -1:
+            indices.append(i)
+            i = bits.find('1', i + 1)
+        return indices
+
+    def find_matches(self, word, limit=None):
+        """Finds and ranks the items fuzzy matching word.
+
+        Args:
+            * word: A string to match.
+            * limit: An int representing the maximum number of matches to
+                return, or None to return every match.
+
+        Returns:
+            A list of tuples (match length, match start, item), sorted by
+            rank.
+        """
+        word = word.lower()
+        matches = []
+        for i in self.candidates(word):
+            match = fuzzy_match(word, self.lowered_items[i])
+            if match is not None:
+                matches.append(match + (self.items[i],))
+        return select_matches(matches, limit)
+
+
+def select_matches(matches, limit=None):
+    """Sorts matches, selecting the best limit with a heap if given.
+
+    Args:
+        * matches: A list of matches ordered by rank.
+        * limit: An int representing the maximum number of matches to
+            return, or None to return every match.
+
+    Returns:
+        A sorted list of the best matches.
+    """
+    if limit is not None and limit < len(matches):
+        return heapq.nsmallest(limit, matches)
+    matches.sort()
+    return matches
+
+
+def fuzzy_match(word, text):
+    """Finds the shortest subsequence match of word in text.
+
+    Equivalent to fuzzyfinder's shortest lookahead regex match, without
+    compiling a regex for each word.
+
+    Args:
+        * word: A string to match.
+        * text: A string to search.
+
+    Returns:
+        A tuple (match length, match start), or None if text doesn't contain
+        the characters of word in order.
+    """
+    if not word:
+        return 0, 0
+    first = word[0]
+    rest = word[1:]
+    best = None
+    start = text.find(first)
+    while start != -1:
+        end = start + 1
+        for char in rest:
+            end = text.find(char, end)
+            if end == -1:
+                # No later start can match either
+                return best
+            end += 1
+        length = end - start
+        if best is None or length < best[0]:
+            best = (length, start)
+            if length == len(word):
+                break
+        start = text.find(first, start + 1)
+    return best
+
+
+class FuzzyMatcher(object):
+    """Fuzzy matches words against collections, indexing large ones.
+
+    An index is built the first time a large collection is matched and is
+    reused until the collection is replaced or its size changes.  Small
+    collections, such as the per keystroke awscli completions, are scanned
+    directly.
+
+    Attributes:
+        * INDEX_THRESHOLD: An int representing the collection size from
+            which collections are indexed.
+        * indexes: An instance of LRUCache mapping a collection id to a
+            tuple of the collection, its size and its FuzzyIndex.
+    """
+
+    INDEX_THRESHOLD = 1000
+
+    def __init__(self, max_indexes=16):
+        """Initializes FuzzyMatcher.
+
+        Args:
+            * max_indexes: An int representing the number of collection
+                indexes to keep.
+
+        Returns:
+            None.
+        """
+        self.indexes = LRUCache(max_indexes)
+
+    def get_index(self, collection):
+        """Gets the index for collection, building it if needed.
+
+        Args:
+            * collection: A collection of strings.
+
+        Returns:
+            An instance of FuzzyIndex.
+        """
+        key = id(collection)
+        size = len(collection)
+        # The cache entry keeps a reference to the collection, so its id
+        # can't be reused by another collection while it is cached
+        entry = self.indexes.get(
+            key, predicate=lambda entry: entry[0] is collection and
+            entry[1] == size)
+        if entry is None:
+            entry = (collection, size, FuzzyIndex(collection))
+            self.indexes.put(key, entry)
+        return entry[2]
+
+    def find_matches(self, word, collection, limit=None):
+        """Finds and ranks the items of collection fuzzy matching word.
+
+        Args:
+            * word: A string to match.
+            * collection: A collection of strings.
+            * limit: An int representing the maximum number of matches to
+                return, or None to return every match.
+
+        Returns:
+            A list of the best matching strings, sorted by rank.
+        """
+        if len(collection) >= self.INDEX_THRESHOLD:
+            matches = self.get_index(collection).find_matches(word, limit)
+        else:
+            word = word.lower()
+            matches = []
+            for item in collection:
+                match = fuzzy_match(word, item.lower())
+                if match is not None:
+                    matches.append(match + (item,))
+            matches = select_matches(matches, limit)
+        return [match[-1] for match in matches]
+
+
+class PrefixIndex(object):
+    """A sorted array of strings, prefix matched with binary searches.
+
+    The items matching a prefix are contiguous in the sorted array, so a
+    lookup is two binary searches and a slice instead of a scan.  Updating
+    the index sorts only the added items and merges them into the array.
+
+    Attributes:
+        * items: A sorted list of the unique indexed strings.  It is
+            replaced, never modified, when the index is updated.
+    """
+
+    def __init__(self, collection=()):
+        """Initializes PrefixIndex.
+
+        Args:
+            * collection: A collection of strings to index.
+
+        Returns:
+            None.
+        """
+        self.items = sorted(set(collection))
+
+    def update(self, collection):
+        """Updates the index to hold the items of collection.
+
+        Args:
+            * collection: A collection of strings.
+
+        Returns:
+            A boolean that determines whether the items changed.
+        """
+        new_items = collection if isinstance(collection, (set, frozenset)) \
+            else set(collection)
+        items = self.items
+        added = sorted(new_items.difference(items))
+        if len(items) + len(added) != len(new_items):
+            items = [item for item in items if item in new_items]
+        elif not added:
+            return False
+        else:
+            items = list(items)
+        # Timsort merges the two sorted runs in linear time
+        items.extend(added)
+        items.sort()
+        self.items = items
+        return True
+
+    def find_matches(self, word, limit=None):
+        """Finds the items starting with word.
+
+        Args:
+            * word: A string to match.
+            * limit: An int representing the maximum number of matches to
+                return, or None to return every match.
+
+        Returns:
+            A sorted list of the first matching strings.
+        """
+        items = self.items
+        if not word:
+            return items[:limit]
+        start = bisect.bisect_left(items, word)
+        try:
+            # The smallest string greater than every string starting with
+            # word, except strings of the last code point
+            bound = word[:-1] + six.unichr(ord(word[-1]) + 1)
+        except ValueError:
+            return [item for item in items[start:]
+                    if item.startswith(word)][:limit]
+        end = bisect.bisect_left(items, bound, start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return items[start:end]
+
+
+class PrefixMatcher(object):
+    """Prefix matches words against collections, indexing large ones.
+
+    An index is built the first time a large collection is matched.  Once
+    the collection is replaced or its size changes, the index is updated
+    with the differences rather than rebuilt.  Small collections, such as
+    the per keystroke awscli completions, are scanned directly.
+
+    Attributes:
+        * INDEX_THRESHOLD: An int representing the collection size from
+            which collections are indexed.
+        * indexes: An instance of LRUCache mapping a key to a tuple of the
+            collection last indexed, its size and its PrefixIndex.
+    """
+
+    INDEX_THRESHOLD = 1000
+
+    def __init__(self, max_indexes=16):
+        """Initializes PrefixMatcher.
+
+        Args:
+            * max_indexes: An int representing the number of collection
+                indexes to keep.
+
+        Returns:
+            None.
+        """
+        self.indexes = LRUCache(max_indexes)
+
+    def get_index(self, collection, key=None):
+        """Gets the index for collection, building or updating it if needed.
+
+        Args:
+            * collection: A collection of strings.
+            * key: A hashable identifying the collection across its
+                replacements, such as the option it completes, or None to
+                identify it by its id.
+
+        Returns:
+            An instance of PrefixIndex.
+        """
+        if key is None:
+            key = id(collection)
+        size = len(collection)
+        entry = self.indexes.get(key)
+        if entry is None:
+            index = PrefixIndex(collection)
+        else:
+            index = entry[2]
+            if entry[0] is collection and entry[1] == size:
+                return index
+            index.update(collection)
+        # The cache entry keeps a reference to the collection, so its id
+        # can't be reused by another collection while it is cached
+        self.indexes.put(key, (collection, size, index))
+        return index
+
+    def find_matches(self, word, collection, key=None, limit=None):
+        """Finds the items of collection starting with word.
+
+        Args:
+            * word: A string to match.
+            * collection: A collection of strings.
+            * key: A hashable identifying the collection across its
+                replacements, or None to identify it by its id.
+            * limit: An int representing the maximum number of matches to
+                return, or None to return every match.
+
+        Returns:
+            A sorted list of the first matching strings.
+        """
+        if len(collection) >= self.INDEX_THRESHOLD:
+            return self.get_index(collection, key).find_matches(word, limit)
+        return select_matches([item for item in collection
+                               if not word or item.startswith(word)],
+                              limit)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import contextlib
+import time
+
+
+class StartupProfiler(object):
+    """Times each phase of startup, for `saws --profile-startup`.
+
+    Attributes:
+        * start: A float representing the time profiling started.
+        * phases: A list of tuples of a string naming each phase and a
+            float representing the number of seconds it took.
+    """
+
+    def __init__(self):
+        """Initializes StartupProfiler.
+
+        Args:
+            * None.
+
+        Returns:
+            None.
+        """
+        self.start = time.time()
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the phase run in the with block.
+
+        Args:
+            * name: A string naming the phase.
+
+        Yields:
+            None.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - start))
+
+    def format_report(self):
+        """Formats the time taken by each phase.
+
+        Args:
+            * None.
+
+        Returns:
+            A string with a line for each phase and a line for the total.
+        """
+        width = max([len(name) for name, _ in self.phases] + [len('total')])
+        lines = ['{0:<{1}} {2:>8.1f} ms'.format(name, width, seconds * 1000)
+                 for name, seconds in self.phases]
+        lines.append('{0:<{1}} {2:>8.1f} ms'.format(
+            'total', width, (time.time() - self.start) * 1000))
+        return '\n'.join(lines)
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import json
+import threading
+try:
+    from collections import OrderedDict
+except:
+    from ordereddict import OrderedDict
+try:
+    from importlib.util import find_spec
+except ImportError:
+    from pkgutil import find_loader as find_spec
+
+
+class BotocoreResourceProvider(object):
+    """Fetches AWS resources in process with botocore.
+
+    A single botocore session, and one client per service, are created on
+    first use and reused for every refresh, instead of starting an aws
+    process per query.  Paginated results are yielded page by page, so the
+    resources are built while the following pages are fetched.
+
+    Attributes:
+        * session: An instance of botocore's Session, or None until the
+            first client is created.
+        * profile: A string representing the profile to use, or None for
+            the default profile.
+        * region: A string representing the region to use, or None for
+            the default region.
+        * timeout: A float representing the number of seconds after which
+            a connection or read times out, or 0 to use botocore's defaults.
+        * clients: A dict mapping service names to botocore clients.
+    """
+
+    def __init__(self, session=None, timeout=0, profile=None, region=None):
+        """Initializes BotocoreResourceProvider.
+
+        Args:
+            * session: An instance of botocore's Session, or None to create
+                one on first use.
+            * timeout: A float representing the number of seconds after
+                which a connection or read times out, or 0 to use
+                botocore's defaults.
+            * profile: A string representing the profile to use, or None
+                for the default profile.
+            * region: A string representing the region to use, or None
+                for the default region.
+
+        Returns:
+            None.
+        """
+        self.session = session
+        self.timeout = timeout
+        self.profile = profile
+        self.region = region
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_available():
+        """Determines whether botocore can be imported.
+
+        botocore is only looked up here, and imported when the first
+        client is created, so it doesn't slow down startup.
+
+        Args:
+            * None.
+
+        Returns:
+            A boolean that determines whether botocore is available.
+        """
+        return find_spec('botocore') is not None
+
+    def get_client(self, service_name):
+        """Gets the client for a service, creating it on first use.
+
+        Clients are thread safe, but the session used to create them is not,
+        so clients are created under a lock.
+
+        Args:
+            * service_name: A string representing the service name, such
+                as 'ec2'.
+
+        Returns:
+            An instance of a botocore client.
+        """
+        import botocore.session
+        from botocore.config import Config
+        with self._lock:
+            if service_name not in self.clients:
+                if self.session is None:
+                    self.session = botocore.session.Session(
+                        profile=self.profile)
+                config = None
+                if self.timeout:
+                    config = Config(connect_timeout=self.timeout,
+                                    read_timeout=self.timeout)
+                self.clients[service_name] = self.session.create_client(
+                    service_name, region_name=self.region, config=config)
+            return self.clients[service_name]
+
+    def iter_pages(self, service_name, operation_name):
+        """Yields each page of results of an operation.
+
+        Args:
+            * service_name: A string representing the service name.
+            * operation_name: A string representing the operation name,
+                such as 'describe_instances'.
+
+        Yields:
+            A dict for each page of results.
+        """
+        client = self.get_client(service_name)
+        if client.can_paginate(operation_name):
+            for page in client.get_paginator(operation_name).paginate():
+                yield page
+        else:
+            yield getattr(client, operation_name)()
+
+    def iter_instances(self):
+        """Yields the id, state, tags and private IP of each instance.
+
+        Args:
+            * None.
+
+        Yields:
+            A tuple of a string representing the instance id, a string
+            representing its state, a list of its tags as dicts with
+            'Key' and 'Value' items, or None if it has no tags, and a
+            string representing its private IP address, or None.
+        """
+        for page in self.iter_pages('ec2', 'describe_instances'):
+            for reservation in page.get('Reservations', []):
+                for instance in reservation.get('Instances', []):
+                    yield (instance['InstanceId'],
+                           instance.get('State', {}).get('Name'),
+                           instance.get('Tags'),
+                           instance.get('PrivateIpAddress'))
+
+    def iter_bucket_names(self):
+        """Yields the name of each bucket.
+
+        Args:
+            * None.
+
+        Yields:
+            A string representing the bucket name.
+        """
+        for page in self.iter_pages('s3', 'list_buckets'):
+            for bucket in page.get('Buckets', []):
+                yield bucket['Name']
+
+    def iter_resources(self, fetcher):
+        """Yields each resource listed by a ResourceFetcher's operation.
+
+        Args:
+            * fetcher: An instance of ResourceFetcher.
+
+        Yields:
+            A string representing the resource.
+        """
+        for page in self.iter_pages(fetcher.service_name,
+                                    fetcher.operation_name):
+            for item in page.get(fetcher.result_key, []):
+                if fetcher.value_key is not None:
+                    item = item.get(fetcher.value_key)
+                if item:
+                    yield item
+
+
+class ResourceFetcher(object):
+    """Describes how to list the resources completing an option.
+
+    The same description is used to call the operation with botocore, or
+    to run the equivalent aws CLI command when botocore is not used.
+
+    Attributes:
+        * service_name: A string representing the service name, such as
+            'lambda'.
+        * operation_name: A string representing the operation name, such
+            as 'list_functions'.
+        * result_key: A string representing the key of the list of results
+            in each page, such as 'Functions'.
+        * value_key: A string representing the key of the resource in each
+            result, such as 'FunctionName', or None if the results are the
+            resources.
+    """
+
+    def __init__(self, service_name, operation_name, result_key,
+                 value_key=None):
+        """Initializes ResourceFetcher.
+
+        Args:
+            * service_name: A string representing the service name.
+            * operation_name: A string representing the operation name.
+            * result_key: A string representing the key of the list of
+                results in each page.
+            * value_key: A string representing the key of the resource in
+                each result, or None if the results are the resources.
+
+        Returns:
+            None.
+        """
+        self.service_name = service_name
+        self.operation_name = operation_name
+        self.result_key = result_key
+        self.value_key = value_key
+
+    def get_command(self):
+        """Gets the aws CLI command listing the resources as JSON.
+
+        Args:
+            * None.
+
+        Returns:
+            A string representing the aws CLI command.
+        """
+        query = self.result_key
+        if self.value_key is not None:
+            query += '[].' + self.value_key
+        return 'aws {0} {1} --query "{2}" --output json'.format(
+            self.service_name,
+            self.operation_name.replace('_', '-'),
+            query)
+
+    def parse_output(self, output):
+        """Parses the output of the command from get_command.
+
+        Args:
+            * output: A string representing the JSON output.
+
+        Returns:
+            A list of strings representing the resources.
+        """
+        return [value for value in json.loads(output) or [] if value]
+
+
+class ResourceFetcherRegistry(object):
+    """Maps options to the ResourceFetcher listing their resources.
+
+    An option is only completed from its fetcher in the commands of the
+    fetcher's service, as options such as --table-name are shared by
+    unrelated services.
+
+    Attributes:
+        * fetchers: An OrderedDict mapping options, such as
+            '--function-name', to instances of ResourceFetcher.
+        * DEFAULT_FETCHERS: A list of tuples of an option and the
+            ResourceFetcher registered for it by default.
+    """
+
+    DEFAULT_FETCHERS = [
+        ('--function-name',
+         ResourceFetcher('lambda', 'list_functions',
+                         'Functions', 'FunctionName')),
+        ('--db-instance-identifier',
+         ResourceFetcher('rds', 'describe_db_instances',
+                         'DBInstances', 'DBInstanceIdentifier')),
+        ('--queue-url',
+         ResourceFetcher('sqs', 'list_queues', 'QueueUrls')),
+        ('--stack-name',
+         ResourceFetcher('cloudformation', 'describe_stacks',
+                         'Stacks', 'StackName')),
+        ('--table-name',
+         ResourceFetcher('dynamodb', 'list_tables', 'TableNames')),
+        ('--role-name',
+         ResourceFetcher('iam', 'list_roles', 'Roles', 'RoleName')),
+        ('--log-group-name',
+         ResourceFetcher('logs', 'describe_log_groups',
+                         'logGroups', 'logGroupName')),
+        ('--topic-arn',
+         ResourceFetcher('sns', 'list_topics', 'Topics', 'TopicArn')),
+    ]
+
+    def __init__(self, fetchers=None):
+        """Initializes ResourceFetcherRegistry.
+
+        Args:
+            * fetchers: A list of tuples of an option and a ResourceFetcher,
+                or None to register DEFAULT_FETCHERS.
+
+        Returns:
+            None.
+        """
+        self.fetchers = OrderedDict()
+        for option, fetcher in (self.DEFAULT_FETCHERS if fetchers is None
+                                else fetchers):
+            self.register(option, fetcher)
+
+    def register(self, option, fetcher):
+        """Registers the fetcher completing an option, replacing any other.
+
+        Args:
+            * option: A string representing the option, such as
+                '--function-name'.
+            * fetcher: An instance of ResourceFetcher.
+
+        Returns:
+            None.
+        """
+        self.fetchers[option] = fetcher
+
+    def get(self, option):
+        """Gets the fetcher completing an option.
+
+        Args:
+            * option: A string representing the option.
+
+        Returns:
+            An instance of ResourceFetcher, or None if the option has no
+            registered fetcher.
+        """
+        return self.fetchers.get(option)
+
+    def __contains__(self, option):
+        return option in self.fetchers
+
+    def __iter__(self):
+        return iter(self.fetchers)
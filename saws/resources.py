@@ -1,12 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from __future__ import print_function
+import functools
+import json
+import logging
 import os
 import re
+import signal
 import subprocess
+import threading
+import time
 import traceback
 from enum import Enum
+from six.moves import configparser, queue, shlex_quote
+from .cache import LRUCache, ResourceCache
 from .commands import AwsCommands
+from .providers import BotocoreResourceProvider, ResourceFetcherRegistry
 
 
 class AwsResources(object):
@@ -16,6 +25,25 @@ class AwsResources(object):
         * instance_ids: A list of instance ids.
         * instance_tag_keys: A set of instance tag keys.
         * instance_tag_values: A set of isntance tag values.
+        * instance_tags: A dict mapping instance ids to a dict of their
+            tag keys and values.
+        * instance_states: A dict mapping instance ids to their states.
+        * tag_values_by_key: A dict mapping instance tag keys to the set
+            of their values.
+        * instance_ids_by_tag: A dict mapping (tag key, tag value) tuples
+            to the list of ids of the instances with that tag.  Tuples with
+            a None tag value, or a None tag key, map to the instances with
+            the key, or the value, under any value, or key.
+        * instance_ids_by_state: A dict mapping instance states to the list
+            of ids of the instances in that state.
+        * instance_ips: A dict mapping instance ids to their private IP
+            addresses.
+        * instance_search_index: A dict mapping search terms to the list of
+            ids of the instances they find.  The terms are the lower case
+            tag values of each instance, the words of its tag values, and
+            its private IP address.
+        * instance_search_terms: A list of the keys of
+            instance_search_index.
         * bucket_names: A list of bucket names.
         * refresh_instance_ids: A boolean that determines whether to
             refresh instance ids by querying AWS.
@@ -23,6 +51,42 @@ class AwsResources(object):
             refresh instance tags by querying AWS.
         * refresh_bucket_names: A boolean that determines whether to
             refresh bucket names by querying AWS.
+        * refresh_concurrency: An int representing the maximum number of
+            AWS queries to run at once when refreshing.
+        * refresh_timeout: A float representing the number of seconds
+            after which an AWS query is killed, or 0 to wait indefinitely.
+        * refresh_status: A string describing the refresh in progress, or
+            None if resources are not being refreshed.
+        * on_refresh_status: A callable called without arguments when
+            refresh_status changes, or None.
+        * provider: An instance of BotocoreResourceProvider, or None to
+            query AWS by running aws CLI commands.
+        * resource_ttls: A dict mapping each ResType to an int representing
+            the number of seconds after which its resources expire, or 0
+            if they never expire once cached.
+        * fetched_at: A dict mapping each ResType to the time its resources
+            were fetched from AWS, if known.
+        * profile: A string representing the profile the resources belong
+            to, or None for the default profile.
+        * region: A string representing the region the resources belong
+            to, or None for the default region.
+        * cache_key: A tuple of strings representing the profile and region
+            the resources belong to once the defaults are resolved, which
+            names the cache file.
+        * cache: An instance of ResourceCache.
+        * fetchers: An instance of ResourceFetcherRegistry, mapping the
+            options whose resources are fetched lazily to their fetchers.
+        * lazy_resources: A dict mapping options to the list of resources
+            fetched for them.  An option is fetched the first time its
+            resources are requested, then cached.
+        * lazy_resources_ttl: An int representing the number of seconds
+            after which lazy resources expire, or 0 if they never expire
+            once cached.
+        * lazy_fetched_at: A dict mapping options to the time their lazy
+            resources were fetched from AWS.
+        * RESOURCE_FILE: A string representing the path of the resource
+            file used before ResourceCache, relative to the package, which
+            is migrated if the cache does not exist.
         * INSTANCE_IDS_MARKER: A string marking the start of
             instance ids in data/RESOURCES.txt.
         * INSTANCE_TAG_KEYS_MARKER: A string marking the start of
@@ -31,17 +95,18 @@ class AwsResources(object):
             instance tag values in data/RESOURCES.txt.
         * BUCKET_NAMES_MARKER: A string marking the start of i
             bucket names in data/RESOURCES.txt.
-        QUERY_INSTANCE_IDS_CMD: A string representing the AWS query to
-            list all instance ids
-        QUERY_INSTANCE_TAG_KEYS_CMD: A string representing the AWS query to
-            list all instance tag keys
-        QUERY_INSTANCE_TAG_VALUES_CMD: A string representing the AWS query to
-            list all instance tag values
+        QUERY_INSTANCES_CMD: A string representing the AWS query to
+            list the id, state, tags and private IP address of all
+            instances
         QUERY_BUCKET_NAMES_CMD: A string representing the AWS query to
             list all bucket names
+        * SEARCH_WORD_REGEX: A compiled regex matching the words of a tag
+            value that are indexed for search.
         * log_exception: A callable log_exception from SawsLogger.
     """
 
+    SEARCH_WORD_REGEX = re.compile(r'[^\W_]+', re.UNICODE)
+
     class ResType(Enum):
         """Enum specifying the resource type.
 
@@ -59,7 +124,15 @@ class AwsResources(object):
                  log_exception,
                  refresh_instance_ids=True,
                  refresh_instance_tags=True,
-                 refresh_bucket_names=True):
+                 refresh_bucket_names=True,
+                 refresh_concurrency=4,
+                 refresh_timeout=60,
+                 resource_provider='botocore',
+                 resource_ttls=None,
+                 profile=None,
+                 region=None,
+                 fetchers=None,
+                 lazy_resources_ttl=0):
         """Initializes AwsResources.
 
         Args:
@@ -70,6 +143,28 @@ class AwsResources(object):
                 refresh instance tags by querying AWS.
             * refresh_bucket_names: A boolean that determines whether to
                 refresh bucket names by querying AWS.
+            * refresh_concurrency: An int representing the maximum number of
+                AWS queries to run at once when refreshing.
+            * refresh_timeout: A float representing the number of seconds
+                after which an AWS query is killed, or 0 to wait
+                indefinitely.
+            * resource_provider: A string representing how AWS is queried,
+                'botocore' to call the AWS APIs in process, or 'shell' to
+                run aws CLI commands.  Falls back to 'shell' if botocore
+                is not available.
+            * resource_ttls: A dict mapping a ResType to an int representing
+                the number of seconds after which its resources expire, or 0
+                if they never expire once cached.  Resource types missing
+                from the dict never expire.
+            * profile: A string representing the profile the resources
+                belong to, or None for the default profile.
+            * region: A string representing the region the resources
+                belong to, or None for the default region.
+            * fetchers: An instance of ResourceFetcherRegistry, or None to
+                use the default fetchers.
+            * lazy_resources_ttl: An int representing the number of seconds
+                after which lazy resources expire, or 0 if they never
+                expire once cached.
 
         Returns:
             None.
@@ -78,10 +173,47 @@ class AwsResources(object):
         self.instance_ids = []
         self.instance_tag_keys = set()
         self.instance_tag_values = set()
+        self.instance_tags = {}
+        self.instance_states = {}
+        self.tag_values_by_key = {}
+        self.instance_ids_by_tag = {}
+        self.instance_ids_by_state = {}
+        self._filtered_instance_ids = {}
+        self.instance_ips = {}
+        self.instance_search_index = {}
+        self.instance_search_terms = []
         self.bucket_names = []
         self.refresh_instance_ids = refresh_instance_ids
         self.refresh_instance_tags = refresh_instance_tags
         self.refresh_bucket_names = refresh_bucket_names
+        self.refresh_concurrency = max(1, refresh_concurrency)
+        self.refresh_timeout = refresh_timeout
+        self.refresh_status = None
+        self.on_refresh_status = None
+        self._refresh_thread = None
+        self._refresh_lock = threading.Lock()
+        self.provider = None
+        if resource_provider == 'botocore' and \
+                BotocoreResourceProvider.is_available():
+            self.provider = BotocoreResourceProvider(timeout=refresh_timeout,
+                                                     profile=profile,
+                                                     region=region)
+        self.resource_ttls = dict((res_type, 0) for res_type in self.ResType)
+        self.resource_ttls.update(resource_ttls or {})
+        self.fetched_at = {}
+        self._attempted_at = {}
+        self.profile = profile
+        self.region = region
+        self.cache_key = self.resolve_profile_region(profile, region)
+        self.cache = ResourceCache(profile=self.cache_key[0],
+                                   region=self.cache_key[1])
+        self.fetchers = fetchers if fetchers is not None \
+            else ResourceFetcherRegistry()
+        self.lazy_resources = {}
+        self.lazy_resources_ttl = lazy_resources_ttl
+        self.lazy_fetched_at = {}
+        self._lazy_attempted_at = {}
+        self._lazy_threads = {}
         self.INSTANCE_IDS_MARKER = '[instance ids]'
         self.INSTANCE_TAG_KEYS_MARKER = '[instance tag keys]'
         self.INSTANCE_TAG_VALUES_MARKER = '[instance tag values]'
@@ -89,104 +221,874 @@ class AwsResources(object):
         self.INSTANCE_IDS = '--instance-ids'
         self.EC2_TAG_KEY = '--ec2-tag-key'
         self.EC2_TAG_VALUE = '--ec2-tag-value'
+        self.EC2_TAG = '--ec2-tag'
         self.EC2_STATE = '--ec2-state'
         self.BUCKET = '--bucket'
-        self.QUERY_INSTANCE_IDS_CMD = 'aws ec2 describe-instances --query "Reservations[].Instances[].[InstanceId]" --output text'
-        self.QUERY_INSTANCE_TAG_KEYS_CMD = 'aws ec2 describe-instances --filters "Name=tag-key,Values=*" --query Reservations[].Instances[].Tags[].Key --output text'
-        self.QUERY_INSTANCE_TAG_VALUES_CMD = 'aws ec2 describe-instances --filters "Name=tag-value,Values=*" --query Reservations[].Instances[].Tags[].Value --output text'
+        self.QUERY_INSTANCES_CMD = 'aws ec2 describe-instances --query "Reservations[].Instances[].[InstanceId,State.Name,Tags,PrivateIpAddress]" --output json'
         self.QUERY_BUCKET_NAMES_CMD = 'aws s3 ls'
         self.log_exception = log_exception
 
-    def refresh(self, force_refresh=False):
+    def refresh(self, force_refresh=False, load_cache=True):
         """Refreshes the AWS resources and caches them to a file.
 
-        This function is called on startup.
-        If no cache exists, it queries AWS to build the resource lists.
-        Pressing the `F5` key will set force_refresh to True, which proceeds
-        to refresh the list regardless of whether a cache exists.
-        Before returning, it saves the resource lists to cache.
+        The cached resources are loaded first, then each type of resources
+        that is not cached or has expired is queried from AWS.  Pressing the
+        `F5` key will set force_refresh to True, which proceeds to refresh
+        every type regardless of the cache.  Before returning, it saves the
+        resources to cache if they changed.
+
+        Each resource collection is replaced by a new one once it is loaded,
+        rather than updated in place, so a collection being iterated by the
+        completer is never modified.
 
         Args:
             * force_refresh: A boolean determines whether to force a cache
                 refresh.  This value is set to True when the user presses `F5`.
+            * load_cache: A boolean that determines whether to load the
+                cached resources before querying the expired ones.
 
         Returns:
             None.
         """
-        file_path = os.path.join(AwsCommands.SOURCES_DIR,
-                                 self.RESOURCE_FILE)
-        if not force_refresh:
+        logger = logging.getLogger(__name__)
+        try:
+            if load_cache and not force_refresh:
+                self.set_refresh_status('Loading')
+                try:
+                    self.load_cache()
+                    logger.info('Loaded resources from cache')
+                except IOError:
+                    logger.info('No resource cache found')
+            if force_refresh:
+                res_types = self.get_enabled_res_types()
+            else:
+                res_types = self.get_expired_res_types()
+            enabled_res_types = self.get_enabled_res_types()
+            queries = []
+            for name, query, query_res_types in self.get_queries():
+                if not any(res_type in res_types
+                           for res_type in query_res_types):
+                    continue
+                # A query refreshes each of its enabled types, not only the
+                # expired ones, such as tags along with instance ids
+                query_res_types = [res_type for res_type in query_res_types
+                                   if res_type in enabled_res_types]
+                if query_res_types:
+                    queries.append((name, functools.partial(
+                        self.run_query, query, query_res_types)))
+            # Lazy resources are only refreshed once they have been used
+            for option in list(self.lazy_resources):
+                if force_refresh or self.is_lazy_expired(option):
+                    queries.append((option, functools.partial(
+                        self.query_lazy_resources, option)))
+            if queries:
+                self.run_queries(queries)
             try:
-                self.refresh_resources_from_file(file_path)
-                print('Loaded resources from cache')
-            except IOError:
-                print('No resource cache found')
-                force_refresh = True
-        if force_refresh:
-            print('Refreshing resources...')
-            if self.refresh_instance_ids:
-                print('  Refreshing instance ids...')
-                self.query_instance_ids()
-            if self.refresh_instance_tags:
-                print('  Refreshing instance tags...')
-                self.query_instance_tag_keys()
-                self.query_instance_tag_values()
-            if self.refresh_bucket_names:
-                print('  Refreshing bucket names...')
-                self.query_bucket_names()
-            print('Done refreshing')
+                self.cache.save(self.get_cache_data())
+            except (IOError, OSError) as e:
+                self.log_exception(e, traceback)
+        finally:
+            self.set_refresh_status(None)
+
+    @staticmethod
+    def resolve_profile_region(profile=None, region=None):
+        """Resolves the profile and region the aws cli would use.
+
+        The profile defaults to AWS_PROFILE or AWS_DEFAULT_PROFILE, and the
+        region to AWS_DEFAULT_REGION or the region of the profile in the aws
+        config file, as botocore resolves them.  Importing botocore here
+        would slow down startup.
+
+        Args:
+            * profile: A string representing the profile, or None for the
+                default profile.
+            * region: A string representing the region, or None for the
+                default region.
+
+        Returns:
+            A tuple of a string representing the profile and a string
+            representing the region, or None if no region is configured.
+        """
+        profile = profile or os.environ.get('AWS_PROFILE') or \
+            os.environ.get('AWS_DEFAULT_PROFILE') or 'default'
+        if region is None:
+            region = os.environ.get('AWS_DEFAULT_REGION')
+        if region is None:
+            parser = configparser.RawConfigParser()
+            section = profile if profile == 'default' \
+                else 'profile ' + profile
+            try:
+                parser.read(os.path.expanduser(
+                    os.environ.get('AWS_CONFIG_FILE', '~/.aws/config')))
+                if parser.has_option(section, 'region'):
+                    region = parser.get(section, 'region')
+            except configparser.Error:
+                pass
+        return profile, region
+
+    @staticmethod
+    def get_profile_region_stamp():
+        """Gets what resolve_profile_region depends on besides its arguments.
+
+        Args:
+            * None.
+
+        Returns:
+            A tuple of the environment variables read by
+            resolve_profile_region and the modification time of the aws
+            config file, or None if it doesn't exist.
+        """
+        names = ['AWS_PROFILE', 'AWS_DEFAULT_PROFILE', 'AWS_DEFAULT_REGION',
+                 'AWS_CONFIG_FILE']
         try:
-            self.save_resources_to_file(file_path)
-        except IOError as e:
-            self.log_exception(e, traceback)
+            mtime = os.stat(os.path.expanduser(
+                os.environ.get('AWS_CONFIG_FILE', '~/.aws/config'))).st_mtime
+        except OSError:
+            mtime = None
+        return tuple(os.environ.get(name) for name in names) + (mtime,)
 
-    def query_aws(self, command):
+    def load_cache(self):
+        """Loads the AWS resources from the cache.
+
+        If the cache of the default profile and region does not exist, the
+        resource file used before ResourceCache is loaded instead, and
+        migrated to the cache when the resources are next saved.
+
+        Args:
+            * None.
+
+        Returns:
+            None.
+
+        Raises:
+            IOError: Neither the cache nor the resource file exist.
+        """
+        data = self.cache.load()
+        if data is None:
+            if self.profile is not None or self.region is not None:
+                raise IOError('No resource cache ' + self.cache.path)
+            file_path = os.path.join(AwsCommands.SOURCES_DIR,
+                                     self.RESOURCE_FILE)
+            self.refresh_resources_from_file(file_path)
+            logging.getLogger(__name__).info(
+                'Migrating resources from %s to %s',
+                file_path, self.cache.path)
+            return
+        # Copy the collections, which are compared with the saved cache
+        self.instance_ids = list(data['instance_ids'])
+        self.instance_tag_keys = set(data['instance_tag_keys'])
+        self.instance_tag_values = set(data['instance_tag_values'])
+        self.instance_tags = dict(data['instance_tags'])
+        self.tag_values_by_key, self.instance_ids_by_tag = \
+            self.index_instance_tags(self.instance_tags)
+        self._filtered_instance_ids = {}
+        self.instance_states = dict(data['instance_states'])
+        self.instance_ids_by_state = self.index_instance_states(
+            self.instance_ids, self.instance_states)
+        self.instance_ips = dict(data.get('instance_ips', {}))
+        self.instance_search_index = self.index_instance_search(
+            self.instance_tags, self.instance_ips)
+        self.instance_search_terms = list(self.instance_search_index)
+        self.bucket_names = list(data['bucket_names'])
+        self.fetched_at.update(
+            (self.ResType[name], fetched_at)
+            for name, fetched_at in data['fetched_at'].items()
+            if name in self.ResType.__members__)
+        lazy_fetched_at = data.get('lazy_fetched_at', {})
+        for option, resources in data.get('lazy_resources', {}).items():
+            # Keep the resources fetched since the cache was saved
+            if option not in self.lazy_fetched_at:
+                self.lazy_resources[option] = list(resources)
+                self.lazy_fetched_at[option] = lazy_fetched_at.get(option, 0)
+
+    def get_cache_data(self):
+        """Gets the AWS resources to save to the cache.
+
+        Args:
+            * None.
+
+        Returns:
+            A dict of the resources.
+        """
+        return {
+            'instance_ids': list(self.instance_ids),
+            'instance_tag_keys': sorted(self.instance_tag_keys),
+            'instance_tag_values': sorted(self.instance_tag_values),
+            'instance_tags': dict(self.instance_tags),
+            'instance_states': dict(self.instance_states),
+            'instance_ips': dict(self.instance_ips),
+            'bucket_names': list(self.bucket_names),
+            'fetched_at': dict((res_type.name, fetched_at)
+                               for res_type, fetched_at
+                               in self.fetched_at.items()),
+            'lazy_resources': dict(self.lazy_resources),
+            'lazy_fetched_at': dict(self.lazy_fetched_at),
+        }
+
+    def refresh_async(self, force_refresh=False, load_cache=True):
+        """Refreshes the AWS resources on a background thread.
+
+        This function is called on startup, so the prompt is shown without
+        waiting for AWS.  Until each collection is loaded, its completions
+        are empty or served from the previous collection.  Does nothing if a
+        refresh is already running.
+
+        Args:
+            * force_refresh: A boolean determines whether to force a cache
+                refresh.  This value is set to True when the user presses `F5`.
+            * load_cache: A boolean that determines whether to load the
+                cached resources before querying the expired ones.
+
+        Returns:
+            An instance of threading.Thread running the refresh.
+        """
+        with self._refresh_lock:
+            if self._refresh_thread is None or \
+                    not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(
+                    target=self._refresh_in_background,
+                    args=(force_refresh, load_cache))
+                self._refresh_thread.daemon = True
+                self._refresh_thread.start()
+            return self._refresh_thread
+
+    def refresh_expired(self):
+        """Refreshes the expired AWS resources on a background thread.
+
+        The expired resources keep being completed until the refresh
+        finishes.  A type of resources whose query failed is not retried
+        before its TTL elapses again.
+
+        Args:
+            * None.
+
+        Returns:
+            An instance of threading.Thread running the refresh, or None
+            if no resources have expired.
+        """
+        if self.get_expired_res_types():
+            return self.refresh_async(load_cache=False)
+        return None
+
+    def get_lazy_resources(self, option):
+        """Gets the lazy resources of an option, fetching them if needed.
+
+        The first time an option's resources are requested, or once they
+        have expired, they are fetched on a background thread.  Until the
+        fetch finishes, the cached resources, if any, are returned.
+
+        Args:
+            * option: A string representing an option registered in
+                fetchers, such as '--function-name'.
+
+        Returns:
+            A list of strings representing the resources.
+        """
+        if self.is_lazy_expired(option):
+            self.fetch_lazy_resources_async(option)
+        return self.lazy_resources.get(option, [])
+
+    def is_lazy_expired(self, option):
+        """Determines whether the lazy resources of an option have expired.
+
+        Args:
+            * option: A string representing an option registered in
+                fetchers.
+
+        Returns:
+            A boolean that determines whether the resources have expired.
+        """
+        last = max(self.lazy_fetched_at.get(option, 0),
+                   self._lazy_attempted_at.get(option, 0))
+        if not last:
+            return True
+        return bool(self.lazy_resources_ttl) and \
+            time.time() - last > self.lazy_resources_ttl
+
+    def fetch_lazy_resources_async(self, option):
+        """Fetches the lazy resources of an option on a background thread.
+
+        Does nothing if the option's resources are already being fetched.
+
+        Args:
+            * option: A string representing an option registered in
+                fetchers.
+
+        Returns:
+            An instance of threading.Thread running the fetch.
+        """
+        with self._refresh_lock:
+            thread = self._lazy_threads.get(option)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(
+                    target=self._fetch_lazy_resources_in_background,
+                    args=(option,))
+                thread.daemon = True
+                self._lazy_threads[option] = thread
+                thread.start()
+            return thread
+
+    def wait_for_lazy_resources(self, option, timeout=None):
+        """Waits for the fetch of an option's lazy resources to finish.
+
+        Args:
+            * option: A string representing an option registered in
+                fetchers.
+            * timeout: A float representing the number of seconds to wait,
+                or None to wait indefinitely.
+
+        Returns:
+            A boolean that determines whether no fetch is running.
+        """
+        thread = self._lazy_threads.get(option)
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _fetch_lazy_resources_in_background(self, option):
+        """Fetches and caches the lazy resources of an option.
+
+        Internal method, call fetch_lazy_resources_async instead.
+
+        Args:
+            * option: A string representing an option registered in
+                fetchers.
+
+        Returns:
+            None.
+        """
         try:
-            return subprocess.check_output(command,
-                                           universal_newlines=True,
-                                           shell=True)
+            start = time.time()
+            if self.query_lazy_resources(option):
+                logging.getLogger(__name__).info(
+                    'Fetched %s in %.2fs', option, time.time() - start)
+                self.cache.save(self.get_cache_data())
         except Exception as e:
             self.log_exception(e, traceback)
 
-    def query_instance_ids(self):
-        """Queries and stores instance ids from AWS.
+    def query_lazy_resources(self, option):
+        """Queries and stores the lazy resources of an option from AWS.
+
+        Args:
+            * option: A string representing an option registered in
+                fetchers.
+
+        Returns:
+            A boolean that determines whether the resources were stored.
+        """
+        fetcher = self.fetchers.get(option)
+        if fetcher is None:
+            return False
+        start = time.time()
+        self._lazy_attempted_at[option] = start
+        if self.provider is not None:
+            resources = list(self.provider.iter_resources(fetcher))
+        else:
+            output = self.query_aws(fetcher.get_command() +
+                                    self.get_query_options())
+            if output is None:
+                return False
+            resources = fetcher.parse_output(output)
+        self.lazy_resources[option] = resources
+        self.lazy_fetched_at[option] = start
+        return True
+
+    def get_queries(self):
+        """Gets the queries refreshing each type of resources.
 
         Args:
             * None.
 
+        Returns:
+            A list of tuples of a string naming the query, a callable that
+            queries and stores its resources, and a list of the ResTypes
+            it refreshes.
+        """
+        return [
+            ('instances', self.query_instances,
+             [self.ResType.INSTANCE_IDS,
+              self.ResType.INSTANCE_TAG_KEYS,
+              self.ResType.INSTANCE_TAG_VALUES]),
+            ('bucket names', self.query_bucket_names,
+             [self.ResType.BUCKET_NAMES]),
+        ]
+
+    def run_query(self, query, res_types):
+        """Runs a query, recording when its types of resources are fetched.
+
+        Args:
+            * query: A callable that queries and stores resources, returning
+                whether they were stored.
+            * res_types: A list of the ResTypes refreshed by the query.
+
         Returns:
             None.
         """
-        output = self.query_aws(self.QUERY_INSTANCE_IDS_CMD)
-        if output is not None:
-            output = re.sub('\n', ' ', output)
-            self.instance_ids = output.split()
+        start = time.time()
+        for res_type in res_types:
+            self._attempted_at[res_type] = start
+        if query():
+            for res_type in res_types:
+                self.fetched_at[res_type] = start
 
-    def query_instance_tag_keys(self):
-        """Queries and stores instance tag keys from AWS.
+    def get_enabled_res_types(self):
+        """Gets the types of resources enabled in ~/.sawsrc.
 
         Args:
             * None.
 
+        Returns:
+            A list of ResTypes.
+        """
+        res_types = []
+        if self.refresh_instance_ids:
+            res_types.append(self.ResType.INSTANCE_IDS)
+        if self.refresh_instance_tags:
+            res_types.append(self.ResType.INSTANCE_TAG_KEYS)
+            res_types.append(self.ResType.INSTANCE_TAG_VALUES)
+        if self.refresh_bucket_names:
+            res_types.append(self.ResType.BUCKET_NAMES)
+        return res_types
+
+    def get_expired_res_types(self):
+        """Gets the enabled types of resources that are expired.
+
+        Args:
+            * None.
+
+        Returns:
+            A list of ResTypes.
+        """
+        return [res_type for res_type in self.get_enabled_res_types()
+                if self.is_expired(res_type)]
+
+    def is_expired(self, res_type):
+        """Determines whether a type of resources has expired.
+
+        Resources that were never fetched have expired.  Otherwise they
+        expire once their TTL has elapsed since they were last fetched, or
+        since the last failed attempt to fetch them.
+
+        Args:
+            * res_type: A ResType.
+
+        Returns:
+            A boolean that determines whether the resources have expired.
+        """
+        last = max(self.fetched_at.get(res_type, 0),
+                   self._attempted_at.get(res_type, 0))
+        if not last:
+            return True
+        ttl = self.resource_ttls[res_type]
+        return bool(ttl) and time.time() - last > ttl
+
+    def get_age(self, res_type):
+        """Gets the age of a type of resources.
+
+        Args:
+            * res_type: A ResType.
+
+        Returns:
+            A float representing the number of seconds since the resources
+            were fetched, or None if they were never fetched.
+        """
+        fetched_at = self.fetched_at.get(res_type)
+        if fetched_at is None:
+            return None
+        return max(0, time.time() - fetched_at)
+
+    def _refresh_in_background(self, force_refresh, load_cache):
+        """Refreshes the AWS resources, logging any exception.
+
+        Internal method, call refresh_async instead.
+
+        Args:
+            * force_refresh: A boolean determines whether to force a cache
+                refresh.
+            * load_cache: A boolean that determines whether to load the
+                cached resources before querying the expired ones.
+
         Returns:
             None.
         """
-        output = self.query_aws(self.QUERY_INSTANCE_TAG_KEYS_CMD)
-        if output is not None:
-            self.instance_tag_keys = set(output.split('\t'))
+        try:
+            self.refresh(force_refresh, load_cache)
+        except Exception as e:
+            self.log_exception(e, traceback)
 
-    def query_instance_tag_values(self):
-        """Queries and stores instance tag values from AWS.
+    def wait_for_refresh(self, timeout=None):
+        """Waits for the refresh started by refresh_async to finish.
 
         Args:
-            * None
+            * timeout: A float representing the number of seconds to wait,
+                or None to wait indefinitely.
+
+        Returns:
+            A boolean that determines whether no refresh is running.
+        """
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def set_refresh_status(self, status):
+        """Sets refresh_status and calls on_refresh_status.
+
+        Args:
+            * status: A string describing the refresh in progress, or None
+                if resources are not being refreshed.
+
+        Returns:
+            None.
+        """
+        self.refresh_status = status
+        if self.on_refresh_status is not None:
+            self.on_refresh_status()
+
+    def run_queries(self, queries):
+        """Runs the AWS queries concurrently.
+
+        At most refresh_concurrency queries run at once.  A query that fails
+        is logged and leaves its resources as they were, so the resources of
+        the other queries are still refreshed.
+
+        Args:
+            * queries: A list of tuples of a string naming the query and a
+                callable that queries and stores its resources.
+
+        Returns:
+            None.
+        """
+        pending = queue.Queue()
+        for query in queries:
+            pending.put(query)
+        logger = logging.getLogger(__name__)
+        lock = threading.Lock()
+        finished = []
+
+        def set_progress():
+            self.set_refresh_status('Refreshing {0}/{1}'.format(
+                len(finished), len(queries)))
+
+        def worker():
+            while True:
+                try:
+                    name, query = pending.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.time()
+                try:
+                    query()
+                except Exception as e:
+                    self.log_exception(e, traceback)
+                logger.info('Refreshed %s in %.2fs',
+                            name, time.time() - start)
+                with lock:
+                    finished.append(name)
+                    set_progress()
+
+        set_progress()
+        threads = [threading.Thread(target=worker)
+                   for _ in range(min(self.refresh_concurrency,
+                                      len(queries)))]
+        start = time.time()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.info('Refreshed resources in %.2fs', time.time() - start)
+
+    def get_query_options(self):
+        """Gets the aws CLI options selecting the profile and region.
+
+        Args:
+            * None.
+
+        Returns:
+            A string representing the options to append to a query, empty
+            for the default profile and region.
+        """
+        options = ''
+        if self.profile is not None:
+            options += ' --profile ' + shlex_quote(self.profile)
+        if self.region is not None:
+            options += ' --region ' + shlex_quote(self.region)
+        return options
+
+    def query_aws(self, command):
+        """Runs an AWS CLI query, killing it after refresh_timeout.
+
+        Args:
+            * command: A string representing the AWS CLI command to run.
+
+        Returns:
+            A string representing the output of the command, or None if
+            the command failed or timed out.
+        """
+        try:
+            kwargs = {}
+            if os.name == 'posix':
+                # Run the shell in its own process group, so a timeout also
+                # kills the aws process it spawns
+                kwargs['preexec_fn'] = os.setsid
+            process = subprocess.Popen(command,
+                                       stdout=subprocess.PIPE,
+                                       universal_newlines=True,
+                                       shell=True,
+                                       **kwargs)
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                try:
+                    if os.name == 'posix':
+                        os.killpg(process.pid, signal.SIGKILL)
+                    else:
+                        process.kill()
+                except OSError:
+                    # The query finished as it timed out
+                    pass
+
+            timer = None
+            if self.refresh_timeout:
+                timer = threading.Timer(self.refresh_timeout, kill)
+                timer.start()
+            try:
+                output, _ = process.communicate()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            if timed_out.is_set():
+                raise RuntimeError('Timed out after {0}s: {1}'.format(
+                    self.refresh_timeout, command))
+            if process.returncode:
+                raise subprocess.CalledProcessError(process.returncode,
+                                                    command)
+            return output
+        except Exception as e:
+            self.log_exception(e, traceback)
+
+    def query_instances(self):
+        """Queries and stores instance ids, states and tags from AWS.
+
+        A single describe-instances query fetches each instance once, and
+        every instance resource is derived from its output.
+
+        Args:
+            * None.
+
+        Returns:
+            A boolean that determines whether the instances were stored.
+        """
+        if self.provider is not None:
+            self.update_instances(self.provider.iter_instances())
+            return True
+        output = self.query_aws(self.QUERY_INSTANCES_CMD +
+                                self.get_query_options())
+        if output is None:
+            return False
+        self.update_instances(json.loads(output))
+        return True
+
+    def update_instances(self, instances):
+        """Stores the instance ids, states, tags and IP addresses.
+
+        Instance ids are only stored if refresh_instance_ids is set, and
+        instance tags only if refresh_instance_tags is set.
+
+        Args:
+            * instances: An iterable of sequences of an instance id, its
+                state, its list of tags and optionally its private IP
+                address, as output by QUERY_INSTANCES_CMD.
 
         Returns:
             None.
         """
-        output = self.query_aws(self.QUERY_INSTANCE_TAG_VALUES_CMD)
-        if output is not None:
-            self.instance_tag_values = set(output.split('\t'))
+        instance_ids = []
+        instance_tags = {}
+        instance_states = {}
+        instance_ips = {}
+        for instance in instances:
+            instance_id, state, tags = instance[:3]
+            instance_ids.append(instance_id)
+            instance_states[instance_id] = state
+            instance_tags[instance_id] = dict(
+                (tag['Key'], tag['Value']) for tag in tags or [])
+            if len(instance) > 3 and instance[3]:
+                instance_ips[instance_id] = instance[3]
+        self.instance_states = instance_states
+        self.instance_ips = instance_ips
+        self.instance_ids_by_state = self.index_instance_states(
+            instance_ids, instance_states)
+        if self.refresh_instance_ids:
+            self.instance_ids = instance_ids
+        if self.refresh_instance_tags:
+            self.instance_tags = instance_tags
+            self.tag_values_by_key, self.instance_ids_by_tag = \
+                self.index_instance_tags(instance_tags)
+            self.instance_tag_keys = set(
+                key for tags in instance_tags.values() for key in tags)
+            self.instance_tag_values = set(
+                value for tags in instance_tags.values()
+                for value in tags.values())
+        self._filtered_instance_ids = {}
+        self.instance_search_index = self.index_instance_search(
+            self.instance_tags, instance_ips)
+        self.instance_search_terms = list(self.instance_search_index)
+
+    def index_instance_tags(self, instance_tags):
+        """Builds the inverted indexes of instance tags.
+
+        Args:
+            * instance_tags: A dict mapping instance ids to a dict of their
+                tag keys and values.
+
+        Returns:
+            A tuple of the tag_values_by_key and instance_ids_by_tag dicts.
+        """
+        tag_values_by_key = {}
+        instance_ids_by_tag = {}
+        for instance_id, tags in instance_tags.items():
+            for key, value in tags.items():
+                tag_values_by_key.setdefault(key, set()).add(value)
+                for tag in ((key, value), (key, None), (None, value)):
+                    instance_ids = instance_ids_by_tag.setdefault(tag, [])
+                    # An instance may have the same value under two keys
+                    if not instance_ids or instance_ids[-1] != instance_id:
+                        instance_ids.append(instance_id)
+        return tag_values_by_key, instance_ids_by_tag
+
+    def index_instance_states(self, instance_ids, instance_states):
+        """Builds the index of instance ids by state.
+
+        Args:
+            * instance_ids: A list of instance ids.
+            * instance_states: A dict mapping instance ids to their states.
+
+        Returns:
+            A dict mapping instance states to lists of instance ids.
+        """
+        instance_ids_by_state = {}
+        for instance_id in instance_ids:
+            state = instance_states.get(instance_id)
+            if state is not None:
+                instance_ids_by_state.setdefault(state, []).append(
+                    instance_id)
+        return instance_ids_by_state
+
+    def index_instance_search(self, instance_tags, instance_ips):
+        """Builds the index finding instances by tag values and IPs.
+
+        Args:
+            * instance_tags: A dict mapping instance ids to a dict of their
+                tag keys and values.
+            * instance_ips: A dict mapping instance ids to their private IP
+                addresses.
+
+        Returns:
+            A dict mapping search terms to lists of instance ids.
+        """
+        index = {}
+
+        def add(term, instance_id):
+            instance_ids = index.setdefault(term, [])
+            if not instance_ids or instance_ids[-1] != instance_id:
+                instance_ids.append(instance_id)
+
+        for instance_id, tags in instance_tags.items():
+            for value in tags.values():
+                value = value.lower()
+                add(value, instance_id)
+                for word in self.SEARCH_WORD_REGEX.findall(value):
+                    if word != value:
+                        add(word, instance_id)
+        for instance_id, ip in instance_ips.items():
+            add(ip, instance_id)
+        return index
+
+    def get_instance_label(self, instance_id):
+        """Gets a label describing an instance to the user.
+
+        Args:
+            * instance_id: A string representing the instance id.
+
+        Returns:
+            A string made of the instance's Name tag and private IP
+            address, either of which may be missing.
+        """
+        name = self.instance_tags.get(instance_id, {}).get('Name')
+        ip = self.instance_ips.get(instance_id)
+        if name and ip:
+            return '{0} ({1})'.format(name, ip)
+        return name or ip or ''
+
+    def get_tag_values(self, key):
+        """Gets the values of an instance tag key.
+
+        Args:
+            * key: A string representing the tag key.
+
+        Returns:
+            A set of the values of the tag key.  If the tags of each
+            instance are unknown, as with the resource file used before
+            ResourceCache, every tag value is returned.
+        """
+        if not self.tag_values_by_key:
+            return self.instance_tag_values
+        return self.tag_values_by_key.get(key, set())
+
+    def get_tagged_instance_ids(self, key=None, value=None):
+        """Gets the ids of the instances with a tag.
+
+        Args:
+            * key: A string representing the tag key, or None to match
+                any key.
+            * value: A string representing the tag value, or None to match
+                any value.
+
+        Returns:
+            A list of instance ids.  Every instance id is returned if
+            neither key nor value is given, or if the tags of each instance
+            are unknown.
+        """
+        if key is None and value is None or not self.instance_ids_by_tag:
+            return self.instance_ids
+        return self.instance_ids_by_tag.get((key, value), [])
+
+    def get_instance_ids(self, key=None, value=None, state=None):
+        """Gets the ids of the instances with a tag and a state.
+
+        The filtered ids are kept until the instances are next refreshed,
+        so completing them again returns the same list.
+
+        Args:
+            * key: A string representing the tag key, or None to match
+                any key.
+            * value: A string representing the tag value, or None to match
+                any value.
+            * state: A string representing the instance state, such as
+                'running', or None to match any state.
+
+        Returns:
+            A list of instance ids.  A filter is ignored if the tags, or
+            the states, of each instance are unknown.
+        """
+        if state is None or not self.instance_ids_by_state:
+            return self.get_tagged_instance_ids(key, value)
+        filters = self._filtered_instance_ids
+        instance_ids = filters.get((key, value, state))
+        if instance_ids is None:
+            instance_ids = self.instance_ids_by_state.get(state, [])
+            tagged = self.get_tagged_instance_ids(key, value)
+            if tagged is not self.instance_ids:
+                tagged = set(tagged)
+                instance_ids = [instance_id for instance_id in instance_ids
+                                if instance_id in tagged]
+            filters[(key, value, state)] = instance_ids
+        return instance_ids
 
     def query_bucket_names(self):
         """Queries and stores bucket names from AWS.
@@ -195,19 +1097,26 @@ class AwsResources(object):
             * None
 
         Returns:
-            None
+            A boolean that determines whether the bucket names were stored.
         """
-        output = self.query_aws(self.QUERY_BUCKET_NAMES_CMD)
-        if output is not None:
-            self.bucket_names = []
-            result_list = output.split('\n')
-            for result in result_list:
-                try:
-                    result = result.split()[-1]
-                    self.bucket_names.append(result)
-                except:
-                    # Ignore blank lines
-                    pass
+        if self.provider is not None:
+            self.bucket_names = list(self.provider.iter_bucket_names())
+            return True
+        output = self.query_aws(self.QUERY_BUCKET_NAMES_CMD +
+                                self.get_query_options())
+        if output is None:
+            return False
+        bucket_names = []
+        result_list = output.split('\n')
+        for result in result_list:
+            try:
+                result = result.split()[-1]
+                bucket_names.append(result)
+            except:
+                # Ignore blank lines
+                pass
+        self.bucket_names = bucket_names
+        return True
 
     def refresh_resources_from_file(self, file_path):
         """Refreshes the AWS resources from data/RESOURCES.txt.
@@ -219,59 +1128,190 @@ class AwsResources(object):
             None.
         """
         res_type = self.ResType.INSTANCE_IDS
+        # Caches written before fetch times were recorded are as old as
+        # the file
+        modified_at = os.path.getmtime(file_path)
+        fetched_at = {}
+        instance_ids = []
+        instance_tag_keys_list = []
+        instance_tag_values_list = []
+        bucket_names = []
         with open(file_path) as fp:
-            self.instance_ids = []
-            self.instance_tag_keys = set()
-            self.instance_tag_values = set()
-            self.bucket_names = []
-            instance_tag_keys_list = []
-            instance_tag_values_list = []
             for line in fp:
                 line = re.sub('\n', '', line)
                 if line.strip() == '':
                     continue
                 elif self.INSTANCE_IDS_MARKER in line:
                     res_type = self.ResType.INSTANCE_IDS
+                    fetched_at[res_type] = self.parse_fetched_at(
+                        line, modified_at)
                     continue
                 elif self.INSTANCE_TAG_KEYS_MARKER in line:
                     res_type = self.ResType.INSTANCE_TAG_KEYS
+                    fetched_at[res_type] = self.parse_fetched_at(
+                        line, modified_at)
                     continue
                 elif self.INSTANCE_TAG_VALUES_MARKER in line:
                     res_type = self.ResType.INSTANCE_TAG_VALUES
+                    fetched_at[res_type] = self.parse_fetched_at(
+                        line, modified_at)
                     continue
                 elif self.BUCKET_NAMES_MARKER in line:
                     res_type = self.ResType.BUCKET_NAMES
+                    fetched_at[res_type] = self.parse_fetched_at(
+                        line, modified_at)
                     continue
                 if res_type == self.ResType.INSTANCE_IDS:
-                    self.instance_ids.append(line)
+                    instance_ids.append(line)
                 elif res_type == self.ResType.INSTANCE_TAG_KEYS:
                     instance_tag_keys_list.append(line)
                 elif res_type == self.ResType.INSTANCE_TAG_VALUES:
                     instance_tag_values_list.append(line)
                 elif res_type == self.ResType.BUCKET_NAMES:
-                    self.bucket_names.append(line)
-            self.instance_tag_keys = set(instance_tag_keys_list)
-            self.instance_tag_values = set(instance_tag_values_list)
+                    bucket_names.append(line)
+        self.instance_ids = instance_ids
+        self.instance_tag_keys = set(instance_tag_keys_list)
+        self.instance_tag_values = set(instance_tag_values_list)
+        self.bucket_names = bucket_names
+        self.fetched_at.update(fetched_at)
 
-    def save_resources_to_file(self, file_path):
-        """Saves the AWS resources to data/RESOURCES.txt.
+    def parse_fetched_at(self, line, default):
+        """Parses the fetch time following a marker in the resource file.
 
         Args:
-            * file_path: A string representing the resource file path.
+            * line: A string representing a marker line, such as
+                '[instance ids] 1445000000'.
+            * default: A float representing the time to return if the line
+                has no fetch time.
+
+        Returns:
+            A float representing the time the resources were fetched.
+        """
+        try:
+            return float(line.split(']', 1)[1].split()[0])
+        except (IndexError, ValueError):
+            return default
+
+
+class AwsResourcePool(object):
+    """Holds the AWS resources of each profile and region.
+
+    The resources of the default profile and region are always kept, and
+    are also returned for the profile and region the defaults resolve to.
+    The resources of other profiles and regions are created and refreshed
+    the first time they are requested, and the least recently used are evicted
+    from memory once more than max_size are held.  Their cache files are
+    kept, so they load quickly if requested again.
+
+    Attributes:
+        * default: An instance of AwsResources for the default profile and
+            region.
+        * create_resources: A callable that takes a profile and a region,
+            either of which may be None, and returns an AwsResources.
+        * resources: An instance of LRUCache mapping (profile, region)
+            tuples, with the defaults resolved, to AwsResources.
+    """
+
+    def __init__(self, default, create_resources, max_size=16):
+        """Initializes AwsResourcePool.
+
+        Args:
+            * default: An instance of AwsResources for the default profile
+                and region.
+            * create_resources: A callable that takes a profile and a
+                region, either of which may be None, and returns an
+                AwsResources.
+            * max_size: An int representing the maximum number of profile
+                and region resources to keep besides the default ones.
 
         Returns:
             None.
         """
-        with open(file_path, 'wt') as fp:
-            fp.write(self.INSTANCE_IDS_MARKER + '\n')
-            for instance_id in self.instance_ids:
-                fp.write(instance_id + '\n')
-            fp.write(self.INSTANCE_TAG_KEYS_MARKER + '\n')
-            for instance_tag_key in self.instance_tag_keys:
-                fp.write(instance_tag_key + '\n')
-            fp.write(self.INSTANCE_TAG_VALUES_MARKER + '\n')
-            for instance_tag_value in self.instance_tag_values:
-                fp.write(instance_tag_value + '\n')
-            fp.write(self.BUCKET_NAMES_MARKER + '\n')
-            for bucket_name in self.bucket_names:
-                fp.write(bucket_name + '\n')
+        self.default = default
+        self.create_resources = create_resources
+        self.resources = LRUCache(max_size)
+        # Maps the requested (profile, region) to the resolved one and the
+        # stamp of the environment and aws config it was resolved with
+        self._keys = LRUCache(max_size)
+        self._lock = threading.Lock()
+
+    def get(self, profile=None, region=None, refresh=True):
+        """Gets the resources of a profile and region.
+
+        Args:
+            * profile: A string representing the profile, or None for the
+                default profile.
+            * region: A string representing the region, or None for the
+                default region.
+            * refresh: A boolean that determines whether to start refreshing
+                the resources in the background if they were just created.
+
+        Returns:
+            An instance of AwsResources.
+        """
+        if profile is None and region is None:
+            return self.default
+        with self._lock:
+            # Resolved again only once the environment or aws config changed,
+            # rather than parsing the aws config on each call
+            stamp = AwsResources.get_profile_region_stamp()
+            entry = self._keys.get((profile, region),
+                                   predicate=lambda entry: entry[1] == stamp)
+            if entry is None:
+                entry = (AwsResources.resolve_profile_region(profile, region),
+                         stamp)
+                self._keys.put((profile, region), entry)
+            key = entry[0]
+            if key == self.default.cache_key:
+                return self.default
+            resources = self.resources.get(key)
+            created = resources is None
+            if created:
+                resources = self.create_resources(profile, region)
+                self.resources.put(key, resources)
+        if created and refresh:
+            resources.refresh_async()
+        return resources
+
+    def refresh_all(self, keys, force_refresh=False, concurrency=4):
+        """Refreshes the resources of several profiles and regions.
+
+        The refreshes run on a background thread, at most concurrency at
+        once.
+
+        Args:
+            * keys: A list of (profile, region) tuples.
+            * force_refresh: A boolean determines whether to force a cache
+                refresh.
+            * concurrency: An int representing the maximum number of
+                profiles and regions to refresh at once.
+
+        Returns:
+            An instance of threading.Thread running the refreshes.
+        """
+        pending = queue.Queue()
+        for key in keys:
+            pending.put(key)
+
+        def worker():
+            while True:
+                try:
+                    profile, region = pending.get_nowait()
+                except queue.Empty:
+                    return
+                resources = self.get(profile, region, refresh=False)
+                resources.refresh_async(force_refresh).join()
+
+        def refresh():
+            threads = [threading.Thread(target=worker)
+                       for _ in range(min(max(1, concurrency), len(keys)))]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -5,7 +5,6 @@ import click
 import os
 import subprocess
 import traceback
-import webbrowser
 from prompt_toolkit import AbortAction, Application, CommandLineInterface
 from prompt_toolkit.enums import DEFAULT_BUFFER
 from prompt_toolkit.filters import Always, HasFocus, IsDone
@@ -14,18 +13,28 @@ from prompt_toolkit.layout.processors import \
 from prompt_toolkit.buffer import Buffer
 from prompt_toolkit.shortcuts import create_default_layout, create_eventloop
 from prompt_toolkit.history import FileHistory
-from awscli import completer as awscli_completer
-from .completer import AwsCompleter
-from .lexer import CommandLexer
+from .completer import AwsCompleter, AsyncCompleter
+from .executors import ClidriverExecutor
+from .lexer import CommandLexerFactory
 from .config import Config
+from .profiling import StartupProfiler
 from .style import StyleFactory
 from .keys import KeyManager
 from .toolbar import Toolbar
 from .commands import AwsCommands
 from .logger import SawsLogger
+from .utils import LazyModule
 from .__init__ import __version__
 
 
+# Only needed once the user asks for docs, the command index can't
+# complete or a command is run, so they are imported then rather than
+# before the prompt
+webbrowser = LazyModule('webbrowser')
+awscli_completer = LazyModule('awscli.completer')
+awscli_clidriver = LazyModule('awscli.clidriver')
+
+
 class Saws(object):
     """Encapsulates the Saws CLI.
 
@@ -45,13 +54,17 @@ class Saws(object):
         * logger: An instance of SawsLogger.
         * theme: A string representing the lexer theme.
             Currently only 'vim' is supported.
+        * profiler: An instance of StartupProfiler timing startup.
+        * executor: An instance of ClidriverExecutor running aws commands
+            in process, or None if commands are all run in the shell.
     """
 
-    def __init__(self):
+    def __init__(self, profiler=None):
         """Inits Saws.
 
         Args:
-            * None.
+            * profiler: An instance of StartupProfiler timing startup, or
+                None.
 
         Returns:
             None.
@@ -60,22 +73,32 @@ class Saws(object):
         self.key_manager = None
         self.theme = 'vim'
         self.PYGMENTS_CMD = ' | pygmentize -l json'
-        self.config = Config()
-        self.config_obj = self.config.read_configuration()
-        self.logger = SawsLogger(__name__,
-                                 self.config_obj['main']['log_file'],
-                                 self.config_obj['main']['log_level']).logger
-        self.aws_commands = AwsCommands()
-        self.commands, self.sub_commands, self.global_options, \
-            self.resource_options, self.ec2_states \
-            = self.aws_commands.generate_all_commands()
-        self.completer = AwsCompleter(
-            awscli_completer,
-            self.config_obj,
-            self.log_exception,
-            ec2_states=self.ec2_states,
-            fuzzy_match=self.get_fuzzy_match(),
-            shortcut_match=self.get_shortcut_match())
+        self.profiler = profiler or StartupProfiler()
+        with self.profiler.phase('config load'):
+            self.config = Config()
+            self.config_obj = self.config.read_configuration()
+            self.logger = SawsLogger(
+                __name__,
+                self.config_obj['main']['log_file'],
+                self.config_obj['main']['log_level']).logger
+        with self.profiler.phase('command model'):
+            self.aws_commands = AwsCommands()
+            self.commands, self.sub_commands, self.global_options, \
+                self.resource_options, self.ec2_states \
+                = self.aws_commands.get_all_commands()
+        with self.profiler.phase('completer'):
+            self.completer = AwsCompleter(
+                awscli_completer,
+                self.config_obj,
+                self.log_exception,
+                ec2_states=self.ec2_states,
+                fuzzy_match=self.get_fuzzy_match(),
+                shortcut_match=self.get_shortcut_match())
+        self.executor = None
+        if self.config_obj['main'].as_bool('in_process_commands'):
+            self.executor = ClidriverExecutor(awscli_clidriver,
+                                              self.log_exception,
+                                              self.PYGMENTS_CMD)
         self.create_cli()
 
     def log_exception(self, e, traceback, echo=False):
@@ -140,6 +163,7 @@ class Saws(object):
         """
         self.config_obj['main']['fuzzy_match'] = fuzzy
         self.completer.fuzzy_match = fuzzy
+        self.completer.clear_cache()
 
     def get_fuzzy_match(self):
         """Getter for fuzzy matching mode
@@ -171,6 +195,7 @@ class Saws(object):
         """
         self.config_obj['main']['shortcut_match'] = shortcut
         self.completer.shortcut_match = shortcut
+        self.completer.clear_cache()
 
     def get_shortcut_match(self):
         """Getter for shortcut matching mode
@@ -187,6 +212,37 @@ class Saws(object):
         """
         return self.config_obj['main'].as_bool('shortcut_match')
 
+    def get_refresh_status(self):
+        """Getter for the resource refresh status.
+
+        Used by prompt_toolkit's bottom toolbar.
+
+        Args:
+            * None.
+
+        Returns:
+            A string describing the resource refresh in progress, or None.
+        """
+        return self.completer.resources.refresh_status
+
+    def get_resource_age(self):
+        """Getter for the age of the oldest cached resources.
+
+        Used by prompt_toolkit's bottom toolbar.
+
+        Args:
+            * None.
+
+        Returns:
+            A float representing the number of seconds since the oldest
+            enabled resources were fetched, or None if none were fetched.
+        """
+        resources = self.completer.resources
+        ages = [resources.get_age(res_type)
+                for res_type in resources.get_enabled_res_types()]
+        ages = [age for age in ages if age is not None]
+        return max(ages) if ages else None
+
     def refresh_resources(self):
         """Convenience function to refresh resources for completion.
 
@@ -198,7 +254,7 @@ class Saws(object):
         Returns:
             None.
         """
-        self.completer.resources.refresh(force_refresh=True)
+        self.completer.refresh_resources(force_refresh=True)
 
     def handle_docs(self, text=None, from_fkey=False):
         """Displays contextual web docs for `F1` or the `docs` command.
@@ -328,7 +384,9 @@ class Saws(object):
                 return
             text = self.colorize_output(text)
         try:
-            if not self.handle_cd(text):
+            if not self.handle_cd(text) and (
+                    self.executor is None or
+                    self.executor.execute(text) is None):
                 # Pass the command onto the shell so aws-cli can execute it
                 subprocess.call(text, shell=True)
             print('')
@@ -343,17 +401,35 @@ class Saws(object):
         Args:
             * None.
 
+        Returns:
+            None.
+        """
+        with self.profiler.phase('lexer build'):
+            lexer = CommandLexerFactory(
+                self.aws_commands.get_all_commands(),
+                self.config.get_shortcuts(self.config_obj)).lexer
+        with self.profiler.phase('cli construction'):
+            self._create_cli(lexer)
+
+    def _create_cli(self, lexer):
+        """Creates the prompt_toolkit's CommandLineInterface.
+
+        Args:
+            * lexer: A pygments Lexer subclass highlighting commands.
+
         Returns:
             None.
         """
         history = FileHistory(os.path.expanduser('~/.saws-history'))
         toolbar = Toolbar(self.get_color,
                           self.get_fuzzy_match,
-                          self.get_shortcut_match)
+                          self.get_shortcut_match,
+                          self.get_refresh_status,
+                          self.get_resource_age)
         layout = create_default_layout(
             message='saws> ',
             reserve_space_for_menu=True,
-            lexer=CommandLexer,
+            lexer=lexer,
             get_bottom_toolbar_tokens=toolbar.handler,
             extra_input_processors=[
                 ConditionalProcessor(
@@ -362,10 +438,13 @@ class Saws(object):
                     filter=HasFocus(DEFAULT_BUFFER) & ~IsDone())
             ]
         )
+        completer = AsyncCompleter(self.completer, self.log_exception)
         cli_buffer = Buffer(
             history=history,
-            completer=self.completer,
+            completer=completer,
             complete_while_typing=Always())
+        # Each keystroke cancels the completion of the previous document
+        cli_buffer.on_text_changed += completer.cancel
         self.key_manager = KeyManager(
             self.set_color,
             self.get_color,
@@ -387,6 +466,9 @@ class Saws(object):
         self.aws_cli = CommandLineInterface(
             application=application,
             eventloop=eventloop)
+        # Redraw the toolbar as resources are refreshed in the background
+        self.completer.resources.on_refresh_status = \
+            self.aws_cli.request_redraw
 
     def run_cli(self):
         """Runs the main loop.
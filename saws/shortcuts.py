@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import re
+try:
+    from collections import OrderedDict
+except:
+    from ordereddict import OrderedDict
+
+
+class ShortcutExpander(object):
+    """Expands shortcut commands into their full commands in one pass.
+
+    Shortcuts are compiled into a trie of words.  Expanding walks the words
+    of the text once, replacing the longest shortcut starting at each word.
+    Each `%s` in a full command is substituted, in order, with the words
+    following the shortcut.
+
+    Attributes:
+        * shortcuts: An OrderedDict containing the shortcut commands as
+            keys and their corresponding full commands as values.
+        * trie: A dict of dicts keyed by the words of the shortcut
+            commands, whose nodes store the full command under VALUE.
+        * VALUE: The key storing a full command in a trie node.
+        * SUBSTITUTION: A string representing a substitution marker.
+        * WORD_REGEX: A compiled regex matching a word.
+    """
+
+    VALUE = None
+    SUBSTITUTION = '%s'
+    WORD_REGEX = re.compile(r'\S+')
+
+    def __init__(self, shortcuts=None):
+        """Initializes ShortcutExpander.
+
+        Args:
+            * shortcuts: An OrderedDict containing the shortcut commands as
+                keys and their corresponding full commands as values.
+
+        Returns:
+            None.
+        """
+        self.shortcuts = OrderedDict()
+        self.trie = {}
+        if shortcuts is not None:
+            self.update(shortcuts)
+
+    def update(self, shortcuts):
+        """Compiles the shortcuts, unless they are unchanged.
+
+        Args:
+            * shortcuts: An OrderedDict containing the shortcut commands as
+                keys and their corresponding full commands as values.
+
+        Returns:
+            A boolean that determines whether the shortcuts were compiled.
+        """
+        items = list(shortcuts.items())
+        if items == list(self.shortcuts.items()):
+            return False
+        self.shortcuts = OrderedDict(items)
+        trie = {}
+        for key, value in items:
+            node = trie
+            for word in key.split():
+                node = node.setdefault(word, {})
+            # The first shortcut listed wins, as it did when shortcuts were
+            # tried top to bottom
+            node.setdefault(self.VALUE, value)
+        self.trie = trie
+        return True
+
+    def expand(self, text):
+        """Replaces the shortcut commands in text with their full commands.
+
+        Args:
+            * text: A string representing the input command text.
+
+        Returns:
+            A string representing the input command text with its
+            shortcuts replaced.
+        """
+        if not self.trie:
+            return text
+        spans = [match.span() for match in self.WORD_REGEX.finditer(text)]
+        words = [text[start:end] for start, end in spans]
+        pieces = []
+        last = 0
+        i = 0
+        while i < len(words):
+            node = self.trie
+            match = None
+            j = i
+            while j < len(words) and words[j] in node:
+                node = node[words[j]]
+                j += 1
+                if self.VALUE in node:
+                    match = (j, node[self.VALUE])
+            if match is None:
+                i += 1
+                continue
+            end, value = match
+            arguments = words[end:end + value.count(self.SUBSTITUTION)]
+            for argument in arguments:
+                value = value.replace(self.SUBSTITUTION, argument, 1)
+            pieces.append(text[last:spans[i][0]])
+            pieces.append(value)
+            i = end + len(arguments)
+            last = spans[i - 1][1]
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return ''.join(pieces)
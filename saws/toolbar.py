@@ -11,28 +11,56 @@ class Toolbar(object):
         * handler: A callable get_toolbar_items.
     """
 
-    def __init__(self, color_cfg, fuzzy_cfg, shortcuts_cfg):
+    def __init__(self, color_cfg, fuzzy_cfg, shortcuts_cfg,
+                 refresh_status=None, resource_age=None):
         """Initializes ToolBar.
 
         Args:
             * color_cfg: A boolean that spedifies whether to color the output.
             * fuzzy_cfg: A boolean that spedifies whether to do fuzzy matching.
             * shortcuts_cfg: A boolean that spedifies whether to match shortcuts.
+            * refresh_status: A callable that returns a string describing
+                the resource refresh in progress, or None.
+            * resource_age: A callable that returns a float representing
+                the number of seconds since the oldest resources were
+                fetched, or None.
 
         Returns:
             None
         """
         self.handler = self.create_toolbar_handler(color_cfg,
                                                    fuzzy_cfg,
-                                                   shortcuts_cfg)
+                                                   shortcuts_cfg,
+                                                   refresh_status,
+                                                   resource_age)
 
-    def create_toolbar_handler(self, color_cfg, fuzzy_cfg, shortcuts_cfg):
+    def format_age(self, age):
+        """Formats an age in its largest whole unit, such as '5m'.
+
+        Args:
+            * age: A float representing a number of seconds.
+
+        Returns:
+            A string representing the age.
+        """
+        for unit, seconds in [('d', 86400), ('h', 3600), ('m', 60)]:
+            if age >= seconds:
+                return '{0}{1}'.format(int(age // seconds), unit)
+        return '{0}s'.format(int(age))
+
+    def create_toolbar_handler(self, color_cfg, fuzzy_cfg, shortcuts_cfg,
+                               refresh_status=None, resource_age=None):
         """Creates the toolbar handler.
 
         Args:
             * color_cfg: A boolean that spedifies whether to color the output.
             * fuzzy_cfg: A boolean that spedifies whether to do fuzzy matching.
             * shortcuts_cfg: A boolean that spedifies whether to match shortcuts.
+            * refresh_status: A callable that returns a string describing
+                the resource refresh in progress, or None.
+            * resource_age: A callable that returns a float representing
+                the number of seconds since the oldest resources were
+                fetched, or None.
 
         Returns:
             A callable get_toolbar_items.
@@ -40,6 +68,8 @@ class Toolbar(object):
         assert callable(color_cfg)
         assert callable(fuzzy_cfg)
         assert callable(shortcuts_cfg)
+        assert refresh_status is None or callable(refresh_status)
+        assert resource_age is None or callable(resource_age)
 
         def get_toolbar_items(_):
             """Returns bottom menu items.
@@ -68,12 +98,22 @@ class Toolbar(object):
             else:
                 shortcuts_token = Token.Toolbar.Off
                 shortcuts = 'OFF'
+            status = refresh_status() if refresh_status is not None else None
+            if status:
+                refresh_token = Token.Toolbar.On
+                refresh = '{0}...'.format(status)
+            else:
+                refresh_token = Token.Toolbar
+                refresh = 'Refresh'
+                age = resource_age() if resource_age is not None else None
+                if age is not None:
+                    refresh += ' ({0} old)'.format(self.format_age(age))
             return [
                 (Token.Toolbar, ' [F1] Docs '),
                 (color_token, ' [F2] Color: {0} '.format(color)),
                 (fuzzy_token, ' [F3] Fuzzy: {0} '.format(fuzzy)),
                 (shortcuts_token, ' [F4] Shortcuts: {0} '.format(shortcuts)),
-                (Token.Toolbar, ' [F5] Refresh '),
+                (refresh_token, ' [F5] {0} '.format(refresh)),
                 (Token.Toolbar, ' [F10] Exit ')
             ]
 
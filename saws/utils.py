@@ -1,19 +1,189 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from __future__ import print_function
+import importlib
+import re
 import six
 import shlex
-import fuzzyfinder
+import threading
 from prompt_toolkit.completion import Completion
+from .cache import LRUCache
+from .matching import FuzzyMatcher, PrefixMatcher
+
+
+class LazyModule(object):
+    """A module imported the first time one of its attributes is used.
+
+    Used for modules that are slow to import and not needed to show the
+    prompt, such as the awscli completer.
+
+    Attributes:
+        * name: A string representing the name of the module.
+    """
+
+    def __init__(self, name):
+        """Initializes LazyModule.
+
+        Args:
+            * name: A string representing the name of the module.
+
+        Returns:
+            None.
+        """
+        self.name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Imports the module, unless it was already imported.
+
+        Args:
+            * None.
+
+        Returns:
+            The module.
+        """
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self.name)
+            return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+class Tokenizer(object):
+    """Splits text into words like shlex, caching the results.
+
+    Words are split in a single pass following shlex's posix rules, but
+    unterminated quotes and trailing backslashes are kept in the last word
+    instead of raising.  Results are cached by text, and when the text only
+    had characters appended, just the tail starting at the last word is
+    tokenized again.
+
+    Attributes:
+        * CHUNK_REGEX: A compiled regex matching whitespace, an unquoted
+            run, a single or double quoted string, or an escaped character.
+        * cache: An instance of LRUCache mapping text to a tuple of its
+            words and the offset of its last word.
+    """
+
+    CHUNK_REGEX = re.compile(r'''
+        (?P<space>\s+)
+        | (?P<word>[^\s'"\\]+)
+        | '(?P<single>[^']*)'?
+        | "(?P<double>(?:[^"\\]|\\.)*\\?)"?
+        | \\(?P<escaped>.?)
+        ''', re.VERBOSE | re.DOTALL)
+    DOUBLE_QUOTE_ESCAPE_REGEX = re.compile(r'\\(["\\])')
+
+    def __init__(self, max_size=32):
+        """Initializes Tokenizer.
+
+        Args:
+            * max_size: An int representing the number of texts to cache.
+
+        Returns:
+            None.
+        """
+        self.cache = LRUCache(max_size)
+        self._last = ('', [], 0)
+
+    def tokenize(self, text):
+        """Splits text into words.
+
+        Args:
+            * text: A string to split.
+
+        Returns:
+            A list of strings for each word in the text.
+        """
+        entry = self.cache.get(text)
+        if entry is None:
+            last_text, last_words, last_start = self._last
+            if last_text and text.startswith(last_text):
+                # Resume from the start of the last word, which the
+                # appended characters may extend
+                words, start = self._scan(text, last_start)
+                words = last_words[:len(last_words) - 1] + words \
+                    if last_start < len(last_text) else last_words + words
+            else:
+                words, start = self._scan(text, 0)
+            entry = (words, start)
+            self.cache.put(text, entry)
+        self._last = (text, entry[0], entry[1])
+        return list(entry[0])
+
+    def _scan(self, text, pos):
+        """Splits text into words, starting at pos.
+
+        Internal method, call tokenize instead.
+
+        Args:
+            * text: A string to split.
+            * pos: An int representing the offset to start at, which must
+                not be inside a word.
+
+        Returns:
+            A tuple of the list of words and the offset of the start of
+            the last word, or the end of text if it ends with whitespace.
+        """
+        words = []
+        word = None
+        start = pos
+        end = len(text)
+        while pos < end:
+            match = self.CHUNK_REGEX.match(text, pos)
+            pos = match.end()
+            if match.group('space') is not None:
+                if word is not None:
+                    words.append(word)
+                    word = None
+                start = pos
+                continue
+            if word is None:
+                word = ''
+            if match.group('word') is not None:
+                word += match.group('word')
+            elif match.group('single') is not None:
+                word += match.group('single')
+            elif match.group('double') is not None:
+                word += self.DOUBLE_QUOTE_ESCAPE_REGEX.sub(
+                    r'\1', match.group('double'))
+            else:
+                # Keep a trailing backslash that escapes nothing
+                word += match.group('escaped') or '\\'
+        if word is not None:
+            words.append(word)
+        return words, start
 
 
 class TextUtils(object):
     """Utilities for parsing and matching text.
 
     Attributes:
-        * None.
+        * fuzzy_matcher: An instance of FuzzyMatcher.
+        * prefix_matcher: An instance of PrefixMatcher.
+        * tokenizer: An instance of Tokenizer.
+        * MORE_COMPLETIONS: A string displayed in the meta of the last
+            completion when some matches are left out.
     """
 
+    MORE_COMPLETIONS = 'more\u2026'
+
+    def __init__(self):
+        """Initializes TextUtils.
+
+        Args:
+            * None.
+
+        Returns:
+            None.
+        """
+        self.fuzzy_matcher = FuzzyMatcher()
+        self.prefix_matcher = PrefixMatcher()
+        self.tokenizer = Tokenizer()
+
     def shlex_split(self, text):
         """Wrapper for shlex, because it does not seem to handle unicode in 2.6.
 
@@ -27,27 +197,70 @@ class TextUtils(object):
             text = text.encode('utf-8')
         return shlex.split(text)
 
-    def find_collection_matches(self, word, collection, fuzzy):
-        """Yields all matching names in list.
+    def find_collection_matches(self, word, collection, fuzzy, key=None,
+                                limit=None):
+        """Yields the best matching names in list.
+
+        Only the best limit names are selected, with a heap rather than a
+        full sort, and Completions are only created for them.  When names
+        are left out, the meta of the last Completion displays
+        MORE_COMPLETIONS to tell the user to keep typing.
 
         Args:
             * word: A string representing the word before
                 the cursor.
             * collection: A collection of words to match.
             * fuzzy: A boolean that specifies whether to use fuzzy matching.
+            * key: A hashable identifying the collection across refreshes,
+                such as the option it completes, or None.
+            * limit: An int representing the maximum number of names to
+                complete, or None to complete every name.
 
         Yields:
             A generator of prompt_toolkit's Completions.
         """
+        # Select one more name than displayed to tell if any are left out
+        select = limit + 1 if limit is not None else None
         if fuzzy:
-            for suggestion in fuzzyfinder.fuzzyfinder(word, collection):
-                yield Completion(suggestion, -len(word))
+            names = self.fuzzy_matcher.find_matches(word, collection, select)
         else:
-            for name in sorted(collection):
-                if name.startswith(word) or not word:
-                    yield Completion(name, -len(word))
+            names = self.prefix_matcher.find_matches(word, collection, key,
+                                                     select)
+        completions = (Completion(name, -len(word)) for name in names)
+        for completion in self.limit_completions(completions, limit):
+            yield completion
+
+    def limit_completions(self, completions, limit):
+        """Yields at most limit completions.
+
+        If completions are left out, the last one yielded displays
+        MORE_COMPLETIONS in its meta.  This does not add a completion that
+        inserts nothing, or change the common prefix of the completions.
 
-    def find_matches(self, word, collection, fuzzy):
+        Args:
+            * completions: An iterable of prompt_toolkit's Completions.
+            * limit: An int representing the maximum number of completions,
+                or None to yield every completion.
+
+        Yields:
+            A generator of prompt_toolkit's Completions.
+        """
+        last = None
+        for index, completion in enumerate(completions):
+            if limit is not None and index == limit:
+                meta = last.display_meta
+                yield Completion(
+                    last.text, last.start_position, display=last.display,
+                    display_meta=meta + ' ' + self.MORE_COMPLETIONS
+                    if meta else self.MORE_COMPLETIONS)
+                return
+            if last is not None:
+                yield last
+            last = completion
+        if last is not None:
+            yield last
+
+    def find_matches(self, word, collection, fuzzy, key=None, limit=None):
         """Finds all matches in collection for word.
 
         Args:
@@ -55,13 +268,17 @@ class TextUtils(object):
                 the cursor.
             * collection: A collection of words to match.
             * fuzzy: A boolean that specifies whether to use fuzzy matching.
+            * key: A hashable identifying the collection across refreshes,
+                such as the option it completes, or None.
+            * limit: An int representing the maximum number of names to
+                complete, or None to complete every name.
 
         Yields:
             A generator of prompt_toolkit's Completions.
         """
         word = self.last_token(word).lower()
         for suggestion in self.find_collection_matches(
-                word, collection, fuzzy):
+                word, collection, fuzzy, key, limit):
             yield suggestion
 
     def get_tokens(self, text):
@@ -74,9 +291,7 @@ class TextUtils(object):
             A list of strings for each word in the text.
         """
         if text is not None:
-            text = text.strip()
-            words = self.safe_split(text)
-            return words
+            return self.safe_split(text)
         return []
 
     def last_token(self, text):
@@ -89,17 +304,16 @@ class TextUtils(object):
             A string representing the last word in the text.
         """
         if text is not None:
-            text = text.strip()
-            if len(text) > 0:
-                word = self.safe_split(text)[-1]
-                word = word.strip()
-                return word
+            words = self.safe_split(text)
+            if words:
+                return words[-1].strip()
         return ''
 
     def safe_split(self, text):
         """Safely splits the input text.
 
-        Shlex can't always split. For example, "\" crashes the completer.
+        Unlike shlex, the tokenizer doesn't raise on unterminated quotes or
+        a trailing backslash, such as "\\", while the user is still typing.
 
         Args:
             * text: A string to split.
@@ -108,8 +322,4 @@ class TextUtils(object):
             A list that contains words for each split element of text.
 
         """
-        try:
-            words = self.shlex_split(text)
-            return words
-        except:
-            return text
+        return self.tokenizer.tokenize(text)
@@ -17,7 +17,6 @@ setup(
         'click>=4.0',
         'configobj >= 5.0.6',
         'enum34>=1.0.4',
-        'fuzzyfinder>=1.0.0',
         'ordereddict>=1.1',
         'prompt-toolkit>=0.46',
         'six>=1.9.0',
@@ -25,6 +24,7 @@ setup(
     ],
     extras_require={
         'testing': [
+            'fuzzyfinder>=2.0.0',
             'mock>=1.0.1',
             'pytest>=2.7.0',
             'tox>=1.9.2'
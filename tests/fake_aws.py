@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import shutil
+import tempfile
+import mock
+from saws.cache import ResourceCache
+from saws.providers import BotocoreResourceProvider
+
+
+INSTANCES = [
+    ('i-a1', 'running', [{'Key': 'Name', 'Value': 'web'}], '10.0.0.1'),
+    ('i-b2', 'stopped', [{'Key': 'Name', 'Value': 'db'}], '10.0.0.2'),
+]
+BUCKET_NAMES = ['bucket-a', 'bucket-b']
+
+
+def stub_aws(test_case):
+    """Stubs the AWS queries and the resource cache for a test.
+
+    Saws refreshes its resources in the background on startup, which would
+    call AWS with the user's credentials and write to the user's cache.
+    Instead, the resource provider yields fixed instances and buckets, and
+    resources are cached in a temporary directory.
+
+    Args:
+        * test_case: An instance of unittest.TestCase.  The stubs are
+            removed when it is cleaned up.
+
+    Returns:
+        None.
+    """
+    cache_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, cache_dir, True)
+    patchers = [
+        mock.patch.multiple(
+            BotocoreResourceProvider,
+            is_available=mock.Mock(return_value=True),
+            iter_instances=lambda self: iter(INSTANCES),
+            iter_bucket_names=lambda self: iter(BUCKET_NAMES),
+            iter_resources=lambda self, fetcher: iter([])),
+        mock.patch.object(ResourceCache, 'CACHE_DIR', cache_dir),
+    ]
+    for patcher in patchers:
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
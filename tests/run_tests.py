@@ -4,11 +4,17 @@ from __future__ import unicode_literals
 from __future__ import print_function
 import unittest
 from test_completer import CompleterTest  # NOQA
+from test_executors import ExecutorsTest  # NOQA
 from test_commands import CommandsTest  # NOQA
+from test_index import IndexTest  # NOQA
+from test_lexer import LexerTest  # NOQA
 from test_resources import ResourcesTest  # NOQA
 from test_saws import SawsTest  # NOQA
 from test_toolbar import ToolbarTest  # NOQA
+from test_utils import UtilsTest  # NOQA
 from test_keys import KeysTest  # NOQA
+from test_matching import MatchingTest  # NOQA
+from test_providers import ProvidersTest  # NOQA
 try:
     from test_cli import CliTest  # NOQA
 except:
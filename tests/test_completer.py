@@ -1,24 +1,52 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from __future__ import print_function
+import threading
+import time
 import unittest
 import mock
+try:
+    from collections import OrderedDict
+except:
+    from ordereddict import OrderedDict
+from prompt_toolkit.completion import Completer, Completion
 from prompt_toolkit.document import Document
 from awscli import completer as awscli_completer
-from saws.completer import AwsCompleter
+from saws.backends import CaptureCompletionBackend, \
+    ResidentCompletionBackend
+from saws.completer import AwsCompleter, AsyncCompleter
 from saws.commands import AwsCommands
 from saws.saws import Saws
 from saws.resources import AwsResources
+from saws.shortcuts import ShortcutExpander
+from saws.utils import TextUtils
+from fake_aws import stub_aws
+
+
+class SlowCompleter(Completer):
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.release = threading.Event()
+        self.finished = []
+
+    def get_completions(self, document, _):
+        # Block until released, like a slow awscli or fuzzy match would
+        self.release.wait(self.delay)
+        for suffix in ['1', '2', '3']:
+            yield Completion(document.text + suffix)
+        self.finished.append(document.text)
 
 
 class CompleterTest(unittest.TestCase):
 
-    @mock.patch('saws.resources.print')
-    def setUp(self, mock_print):
+    def setUp(self):
+        stub_aws(self)
         self.saws = Saws()
         self.completer = self.create_completer()
         self.completer_event = self.create_completer_event()
-        mock_print.assert_called_with('Loaded resources from cache')
+        self.saws.completer.resources.wait_for_refresh()
+        self.completer.resources.wait_for_refresh()
 
     def create_completer(self):
         self.aws_commands = AwsCommands()
@@ -27,7 +55,7 @@ class CompleterTest(unittest.TestCase):
             self.aws_commands.generate_all_commands()
         return AwsCompleter(awscli_completer,
                             self.saws.config_obj,
-                            self.saws.logger,
+                            self.saws.log_exception,
                             self.ec2_states)
 
     def create_completer_event(self):
@@ -80,6 +108,152 @@ class CompleterTest(unittest.TestCase):
         expected = [AwsCommands.AWS_COMMAND]
         self.verify_completions(commands, expected)
 
+    def test_completion_backends(self):
+        capture = CaptureCompletionBackend(awscli_completer,
+                                           self.saws.log_exception)
+        resident = ResidentCompletionBackend(awscli_completer,
+                                             self.saws.log_exception)
+        commands = ['aws e',
+                    'aws ec2',
+                    'aws ec2 describe-ins',
+                    'aws ec2 describe-instances --',
+                    'aws --outp']
+        for command in commands:
+            assert sorted(capture.complete(command)) == \
+                sorted(resident.complete(command))
+        completer = resident.get_completer()
+        resident.complete('aws s3')
+        assert resident.get_completer() is completer
+
+    def test_completion_cache_narrowing(self):
+        backend = mock.Mock(wraps=self.completer.completion_backend)
+        self.completer.completion_backend = backend
+        self.completer.clear_cache()
+        expected = ['describe-instances', 'describe-instance-status']
+        for command in ['aws ec2 describe-i',
+                        'aws ec2 describe-in',
+                        'aws ec2 describe-ins']:
+            self.verify_completions([command], expected)
+        assert backend.complete.call_count == 1
+        assert self.completer.completion_cache.hits == 2
+        completions = self.completer.get_aws_cli_completions(
+            Document(text='aws ec2 describe-instances'))
+        assert completions == []
+        assert backend.complete.call_count == 2
+        self.verify_completions(['aws ec2 describe-instances --'],
+                                ['--instance-ids'])
+        self.verify_completions(['aws ec2 describe-instances --inst'],
+                                ['--instance-ids'])
+        assert backend.complete.call_count == 3
+
+    def test_completion_cache_eviction(self):
+        self.completer.completion_cache.max_size = 2
+        self.completer.clear_cache()
+        for command in ['aws ec2 d', 'aws s3api g', 'aws emr l']:
+            self.completer.get_aws_cli_completions(Document(text=command))
+        assert len(self.completer.completion_cache) == 2
+        assert self.completer.completion_cache.evictions == 1
+        assert ('aws', 'ec2') not in self.completer.completion_cache
+
+    def test_completion_cache_invalidation(self):
+        self.saws.completer.get_aws_cli_completions(
+            Document(text='aws ec2 d'))
+        assert len(self.saws.completer.completion_cache) == 1
+        self.saws.set_fuzzy_match(not self.saws.get_fuzzy_match())
+        assert len(self.saws.completer.completion_cache) == 0
+        self.saws.completer.get_aws_cli_completions(
+            Document(text='aws ec2 d'))
+        self.saws.set_shortcut_match(not self.saws.get_shortcut_match())
+        assert len(self.saws.completer.completion_cache) == 0
+
+    def test_async_completer_cancels_stale_keystrokes(self):
+        slow_completer = SlowCompleter(delay=5)
+        completer = AsyncCompleter(slow_completer, mock.Mock())
+        results = {}
+
+        def type_text(text):
+            start = time.time()
+            completions = completer.get_completions(
+                Document(text=text), self.completer_event)
+            results[text] = ([c.text for c in completions],
+                             time.time() - start)
+
+        threads = []
+        for text in ['aws e', 'aws ec', 'aws ec2']:
+            thread = threading.Thread(target=type_text, args=(text,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.05)
+        # Earlier keystrokes return at once, without waiting on the slow
+        # completer, and nothing stale is published
+        for thread in threads[:-1]:
+            thread.join(1)
+            assert not thread.is_alive()
+        assert results['aws e'] == ([], results['aws e'][1])
+        assert results['aws ec'][0] == []
+        assert results['aws e'][1] < 1
+        slow_completer.release.set()
+        threads[-1].join(5)
+        assert results['aws ec2'][0] == ['aws ec21', 'aws ec22', 'aws ec23']
+        # Stale workers stop at the first completion they yield
+        assert slow_completer.finished == ['aws ec2']
+
+    def test_async_completer_single_worker(self):
+        running = []
+        calls = []
+
+        class CountingCompleter(Completer):
+
+            def get_completions(self, document, _):
+                running.append(document.text)
+                calls.append(list(running))
+                try:
+                    time.sleep(0.05)
+                    yield Completion(document.text)
+                finally:
+                    running.remove(document.text)
+
+        completer = AsyncCompleter(CountingCompleter(), mock.Mock())
+        threads = []
+        for end in range(1, 20):
+            thread = threading.Thread(
+                target=completer.get_completions,
+                args=(Document(text='aws ec2'[:end % 8]),
+                      self.completer_event))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.005)
+        for thread in threads:
+            thread.join(5)
+        # Superseded requests are dropped rather than run side by side
+        assert all(len(running_calls) == 1 for running_calls in calls)
+        assert len(calls) < len(threads)
+        assert completer._worker is not None
+
+    def test_resident_backend_builds_once(self):
+        aws_completer = mock.Mock()
+        aws_completer.Completer.side_effect = \
+            lambda: time.sleep(0.05) or mock.Mock()
+        resident = ResidentCompletionBackend(aws_completer, mock.Mock())
+        threads = [threading.Thread(target=resident.get_completer)
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert aws_completer.Completer.call_count == 1
+
+    def test_async_completer_cancel(self):
+        slow_completer = SlowCompleter(delay=5)
+        completer = AsyncCompleter(slow_completer, mock.Mock())
+        threading.Timer(0.1, completer.cancel).start()
+        start = time.time()
+        completions = completer.get_completions(Document(text='aws'),
+                                                self.completer_event)
+        assert completions == []
+        assert time.time() - start < 1
+        slow_completer.release.set()
+
     def test_global_options(self):
         commands = ['aws -', 'aws --']
         expected = self.saws.global_options
@@ -105,12 +279,194 @@ class CompleterTest(unittest.TestCase):
             result = self.completer.replace_shortcut(command)
             assert result == expect
 
+    def test_shortcut_expansion(self):
+        expander = ShortcutExpander(OrderedDict([
+            ('ec2 ls', 'ec2 describe-instances'),
+            ('ec2 ls --ec2-tag', 'ec2 describe-instances --filters '
+                                 '"Name=tag:%s,Values=%s"'),
+            ('s3 ls [*]', 's3 ls s3://%s/'),
+            ('emr ls', 'emr list-clusters')]))
+        assert expander.expand('aws ec2 ls && aws emr ls --active') == \
+            'aws ec2 describe-instances && aws emr list-clusters --active'
+        assert expander.expand('aws ec2 ls --ec2-tag Stack prod --debug') == \
+            'aws ec2 describe-instances --filters ' \
+            '"Name=tag:Stack,Values=prod" --debug'
+        assert expander.expand('aws s3 ls [*] my.bucket') == \
+            'aws s3 ls s3://my.bucket/'
+        assert expander.expand('aws s3 ls x my.bucket') == \
+            'aws s3 ls x my.bucket'
+        assert expander.expand('aws ec2 lsx') == 'aws ec2 lsx'
+        assert not expander.update(OrderedDict(expander.shortcuts))
+        assert expander.update(OrderedDict([('ec2 ls', 'ec2 foo')]))
+        assert expander.expand('aws  ec2 ls') == 'aws  ec2 foo'
+
     def test_instance_ids(self):
         commands = ['aws ec2 ls --instance-ids i-a']
         expected = ['i-a875ecc3', 'i-a51d05f4', 'i-a3628153']
         self.completer.resources.instance_ids.extend(expected)
         self.verify_completions(commands, expected)
 
+    def test_profile_region_instance_ids(self):
+        resources = self.completer.create_resources('prod', 'eu-west-1')
+        resources.instance_ids = ['i-e123', 'i-e456']
+        resources.refresh_expired = mock.Mock()
+        self.completer.resource_pool.resources.put(('prod', 'eu-west-1'),
+                                                   resources)
+        commands = ['aws ec2 ls --profile prod --region eu-west-1 '
+                    '--instance-ids i-e']
+        self.verify_completions(commands, ['i-e123', 'i-e456'])
+        commands = ['aws ec2 stop-instances --profile=prod '
+                    '--region=eu-west-1 --instance-ids i-e']
+        self.verify_completions(commands, ['i-e123', 'i-e456'])
+        resources.refresh_expired.assert_called_with()
+        words = ['aws', 'ec2', 'ls', '--region', 'eu-west-1']
+        assert self.completer.get_resources(words) is not resources
+        assert self.completer.get_resources(['aws', 'ec2', 'ls']) is \
+            self.completer.resources
+
+    def test_lazy_resources(self):
+        resources = self.completer.resources
+        with mock.patch.object(resources, 'fetch_lazy_resources_async') \
+                as mock_fetch:
+            words = ['aws', 'lambda', 'invoke', '--function-name', 'res']
+            assert list(self.completer.get_all_resource_completions(
+                words, 'res')) == []
+            mock_fetch.assert_called_once_with('--function-name')
+            resources.lazy_resources['--function-name'] = \
+                ['resize', 'resolve', 'thumbnail']
+            resources.lazy_fetched_at['--function-name'] = time.time()
+            self.verify_completions(
+                ['aws lambda invoke --function-name res'],
+                ['resize', 'resolve'])
+            assert mock_fetch.call_count == 1
+            for command in ['aws glue get-table --table-name ',
+                            'aws opsworks create-stack --stack-name ',
+                            'aws --region eu-west-1 --output json glue '
+                            'get-table --table-name ']:
+                words = self.completer.text_utils.get_tokens(command)
+                assert self.completer.get_all_resource_completions(
+                    words, '') is None, command
+            assert mock_fetch.call_count == 1
+
+    def test_service_name(self):
+        for command, service_name in [
+                ('aws', None),
+                ('aws --debug', None),
+                ('aws lambda invoke', 'lambda'),
+                ('aws --profile prod --debug dynamodb scan', 'dynamodb'),
+                ('aws --region=eu-west-1 sns publish', 'sns')]:
+            words = self.completer.text_utils.get_tokens(command)
+            assert self.completer.get_service_name(words) == service_name
+
+    def test_max_completions(self):
+        self.completer.max_completions = 2
+        self.completer.resources.instance_ids = ['i-a1', 'i-a2', 'i-a3']
+        completions = list(self._get_completions(
+            'aws ec2 ls --instance-ids i-a'))
+        assert sorted(completion.text for completion in completions) == \
+            ['i-a1', 'i-a2']
+        assert [completion.display_meta for completion in completions
+                if completion.display_meta] == [TextUtils.MORE_COMPLETIONS]
+
+    def test_tag_scoped_completions(self):
+        resources = self.completer.resources
+        resources.refresh_instance_tags = True
+        resources.update_instances([
+            ('i-a1', 'running', [{'Key': 'Stack', 'Value': 'prod'},
+                                 {'Key': 'Name', 'Value': 'web'}]),
+            ('i-a2', 'running', [{'Key': 'Stack', 'Value': 'prod-blue'}]),
+            ('i-a3', 'stopped', [{'Key': 'Name', 'Value': 'prod-db'}])])
+        resources.refresh_expired = mock.Mock()
+
+        def completion_texts(command):
+            return sorted(completion.text
+                          for completion in self._get_completions(command))
+
+        assert completion_texts('aws ec2 ls --ec2-tag-value prod') == \
+            ['prod', 'prod-blue', 'prod-db']
+        assert completion_texts('aws ec2 ls --ec2-tag-key Stack '
+                                '--ec2-tag-value prod') == \
+            ['prod', 'prod-blue']
+        assert completion_texts('aws ec2 ls --ec2-tag ') == \
+            ['Name', 'Stack']
+        assert completion_texts('aws ec2 ls --ec2-tag Name ') == \
+            ['prod-db', 'web']
+        assert completion_texts('aws ec2 ls --ec2-tag Stack prod '
+                                '--instance-ids i-') == ['i-a1']
+        assert completion_texts('aws ec2 ls --ec2-tag-key Name '
+                                '--instance-ids i-') == ['i-a1', 'i-a3']
+        assert completion_texts('aws ec2 ls --instance-ids i-') == \
+            ['i-a1', 'i-a2', 'i-a3']
+
+    def test_state_scoped_completions(self):
+        resources = self.completer.resources
+        resources.refresh_instance_tags = True
+        resources.update_instances([
+            ('i-a1', 'running', [{'Key': 'Stack', 'Value': 'prod'}]),
+            ('i-a2', 'stopped', [{'Key': 'Stack', 'Value': 'prod'}]),
+            ('i-a3', 'stopped', [{'Key': 'Stack', 'Value': 'dev'}])])
+        resources.refresh_expired = mock.Mock()
+
+        def completion_texts(command):
+            return sorted(completion.text
+                          for completion in self._get_completions(command))
+
+        assert completion_texts('aws ec2 start-instances '
+                                '--instance-ids i-') == ['i-a2', 'i-a3']
+        assert completion_texts('aws ec2 stop-instances '
+                                '--instance-ids i-') == ['i-a1']
+        assert completion_texts('aws ec2 ls --ec2-state stopped '
+                                '--ec2-tag Stack prod '
+                                '--instance-ids i-') == ['i-a2']
+        assert resources.get_instance_ids('Stack', 'prod', 'stopped') is \
+            resources.get_instance_ids('Stack', 'prod', 'stopped')
+        assert completion_texts('aws ec2 ls --ec2-state run') == ['running']
+
+    def test_instance_search(self):
+        resources = self.completer.resources
+        resources.refresh_instance_tags = True
+        resources.update_instances([
+            ('i-a1', 'running', [{'Key': 'Name', 'Value': 'web-server-1'}],
+             '10.0.0.1'),
+            ('i-a2', 'stopped', [{'Key': 'Name', 'Value': 'Web-Server-2'},
+                                 {'Key': 'Stack', 'Value': 'prod'}],
+             '10.0.0.2'),
+            ('i-a3', 'running', [{'Key': 'Name', 'Value': 'db'}], None)])
+        resources.refresh_expired = mock.Mock()
+
+        def completions(command):
+            return sorted((completion.text, completion.display_meta)
+                          for completion in self._get_completions(command))
+
+        assert completions('aws ec2 ls --instance-ids web') == [
+            ('i-a1', 'web-server-1 (10.0.0.1)'),
+            ('i-a2', 'Web-Server-2 (10.0.0.2)')]
+        assert completions('aws ec2 ls --instance-ids SERV') == \
+            completions('aws ec2 ls --instance-ids web')
+        assert completions('aws ec2 ls --instance-ids 10.0.0.2') == [
+            ('i-a2', 'Web-Server-2 (10.0.0.2)')]
+        assert completions('aws ec2 stop-instances --instance-ids web') == [
+            ('i-a1', 'web-server-1 (10.0.0.1)')]
+        assert [text for text, _ in
+                completions('aws ec2 ls --instance-ids i-a')] == \
+            ['i-a1', 'i-a2', 'i-a3']
+        self.completer.max_completions = 1
+        limited = completions('aws ec2 ls --instance-ids web')
+        assert len(limited) == 1
+        assert limited[0][1].endswith(') ' + TextUtils.MORE_COMPLETIONS)
+
+    def test_instance_search_start_position(self):
+        resources = self.completer.resources
+        resources.refresh_instance_tags = True
+        resources.update_instances([
+            ('i-a1', 'running', [{'Key': 'Name', 'Value': '\u0130stanbul'}])])
+        resources.refresh_expired = mock.Mock()
+        # '\u0130'.lower() is two characters long
+        completions = list(self._get_completions(
+            'aws ec2 ls --instance-ids \u0130st'))
+        assert [(completion.text, completion.start_position)
+                for completion in completions] == [('i-a1', -3)]
+
     def test_instance_keys(self):
         commands = ['aws ec2 ls --ec2-tag-key na']
         expected = ['name', 'namE']
@@ -160,6 +516,10 @@ class CompleterTest(unittest.TestCase):
         expected = 'aws ec2 ls --filters "Name=tag-key,Values=prod"'
         result = self.completer.replace_substitution(command)
         assert result == expected
+        command = 'aws ec2 ls --filters "Name=tag:%s,Values=%s" Stack prod'
+        expected = 'aws ec2 ls --filters "Name=tag:Stack,Values=prod"'
+        result = self.completer.replace_substitution(command)
+        assert result == expected
         command = 'aws ec2 ls --ec2-tag-key Stack'
         expected = 'aws ec2 describe-instances --filters "Name=tag-key,Values=Stack"'
         result = self.completer.replace_shortcut(command)
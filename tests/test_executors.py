@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import logging
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from saws.executors import ClidriverExecutor
+
+
+class ExecutorsTest(unittest.TestCase):
+
+    PYGMENTS_CMD = ' | pygmentize -l json'
+
+    def setUp(self):
+        self.aws_clidriver = mock.Mock()
+        self.aws_clidriver.create_clidriver.side_effect = self.create_driver
+        self.executor = ClidriverExecutor(self.aws_clidriver, mock.Mock(),
+                                          self.PYGMENTS_CMD)
+        self.cwd = os.getcwd()
+        self.temp_dir = tempfile.mkdtemp()
+        os.chdir(self.temp_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def create_driver(self):
+        driver = mock.Mock()
+        variables = {}
+        driver.session.instance_variables.side_effect = \
+            lambda: dict(variables)
+        driver.session.set_config_variable.side_effect = \
+            variables.__setitem__
+        driver.session.get_config_variable.return_value = None
+
+        def main(args):
+            # CLIDriver.main sets the profile given by --profile
+            profile = self.executor.get_profile(args)
+            if profile:
+                variables['profile'] = profile
+            return driver.main.return_value
+
+        driver.main.side_effect = main
+        driver.main.return_value = 0
+        return driver
+
+    def test_get_args(self):
+        get_args = self.executor.get_args
+        assert get_args('aws ec2 describe-instances') == \
+            ['aws', 'ec2', 'describe-instances']
+        assert get_args(
+            'aws ec2 describe-instances --filters "Name=tag:Name,'
+            'Values=\\"web\\"" --query \'Reservations[].Instances[]\'') == \
+            ['aws', 'ec2', 'describe-instances', '--filters',
+             'Name=tag:Name,Values="web"', '--query',
+             'Reservations[].Instances[]']
+        assert get_args('aws s3 ls a\\ b \\\n  --recursive') == \
+            ['aws', 's3', 'ls', 'a b', '--recursive']
+        assert get_args('aws ec2 describe-instances --query R[*]') == \
+            ['aws', 'ec2', 'describe-instances', '--query', 'R[*]']
+        for text in ['aws s3 ls | grep foo', 'aws s3 ls > out',
+                     'aws s3 ls $BUCKET', 'aws s3 ls "$BUCKET"',
+                     'aws s3 ls `echo bucket`', 'aws s3 ls; ls',
+                     'aws s3 ls ~/foo', 'aws s3 ls "foo',
+                     'aws s3 ls\naws ec2', 'aws s3 ls foo\\']:
+            assert get_args(text) is None, text
+        open(os.path.join(self.temp_dir, 'file.json'), 'w').close()
+        assert get_args('aws s3 cp *.json s3://bucket') is None
+
+    def test_execute(self):
+        assert self.executor.execute('ls -l') is None
+        assert self.executor.execute('aws s3 ls | head') is None
+        assert self.executor.execute('aws s3 ls --no-sign-request') is None
+        self.aws_clidriver.create_clidriver.assert_not_called()
+        assert self.executor.execute('aws ec2 describe-instances') == 0
+        driver = self.executor.drivers[None][0]
+        driver.main.assert_called_with(['ec2', 'describe-instances'])
+        driver.main.return_value = 255
+        assert self.executor.execute('aws s3 ls') == 255
+        driver.main.return_value = None
+        assert self.executor.execute('aws configure list') == 0
+        self.aws_clidriver.create_clidriver.assert_called_once_with()
+        assert sys.argv[0] != 'aws'
+
+    def test_without_history_recorder(self):
+        # Older awscli versions have no HISTORY_RECORDER
+        del self.aws_clidriver.HISTORY_RECORDER
+        assert self.executor.execute('aws ec2 describe-instances') == 0
+        self.executor.log_exception.assert_not_called()
+
+    def test_exit_codes(self):
+        self.executor.execute('aws ec2 describe-instances')
+        driver = self.executor.drivers[None][0]
+        driver.main.side_effect = SystemExit(2)
+        assert self.executor.execute('aws ec2 --bad') == 2
+        driver.main.side_effect = SystemExit()
+        assert self.executor.execute('aws ec2 --bad') == 0
+        driver.main.side_effect = ValueError('boom')
+        with mock.patch('saws.executors.traceback.print_exc'):
+            assert self.executor.execute('aws ec2 describe-instances') == 1
+
+    def test_profiles(self):
+        self.executor.execute('aws s3 ls')
+        self.executor.execute('aws s3 ls --profile prod')
+        self.executor.execute('aws s3 ls --profile=prod')
+        assert set(self.executor.drivers) == set([None, 'prod'])
+        assert self.aws_clidriver.create_clidriver.call_count == 2
+
+    def test_session_restored(self):
+        self.executor.execute('aws s3 ls')
+        driver = self.executor.drivers[None][0]
+        session = driver.session
+        logger = logging.getLogger('awscli')
+        handlers = logger.handlers[:]
+
+        def main(args):
+            session.set_config_variable('region', 'eu-west-1')
+            logger.addHandler(logging.NullHandler())
+            return 0
+
+        driver.main.side_effect = main
+        self.executor.execute('aws s3 ls --region eu-west-1')
+        assert session.instance_variables().get('region') is None
+        assert logger.handlers == handlers
+        session.set_default_client_config.assert_called_with(
+            session.get_default_client_config.return_value)
+
+        def main(args):
+            session.set_config_variable('profile', 'prod')
+            return 0
+
+        # An abbreviated --profile replaces the driver
+        driver.main.side_effect = main
+        self.executor.execute('aws s3 ls --prof prod')
+        assert None not in self.executor.drivers
+
+    def test_driver_replaced(self):
+        self.executor.max_commands = 2
+        for _ in range(3):
+            self.executor.execute('aws s3 ls')
+        assert self.aws_clidriver.create_clidriver.call_count == 2
+        config_file = os.path.join(self.temp_dir, 'config')
+        open(config_file, 'w').close()
+        driver = self.executor.drivers[None][0]
+        driver.session.get_config_variable.return_value = config_file
+        self.executor.execute('aws s3 ls')
+        assert self.aws_clidriver.create_clidriver.call_count == 3
+
+    def test_highlight(self):
+        self.executor.execute('aws s3 ls')
+        driver = self.executor.drivers[None][0]
+        driver.main.side_effect = \
+            lambda args: sys.stdout.write('{"Buckets": []}\n') and 0
+        with mock.patch.object(self.executor, 'write_highlighted') \
+                as mock_write:
+            assert self.executor.execute(
+                'aws s3api list-buckets' + self.PYGMENTS_CMD) == 0
+        mock_write.assert_called_with('{"Buckets": []}\n')
+        # As in the shell, the pipeline exits with pygmentize's status
+        driver.main.side_effect = lambda args: 255
+        with mock.patch.object(self.executor, 'write_highlighted'):
+            assert self.executor.execute(
+                'aws s3api list-buckets' + self.PYGMENTS_CMD) == 0
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from awscli import completer as awscli_completer
+from saws.backends import IndexCompletionBackend, ResidentCompletionBackend
+from saws.index import AwsCommandIndex
+
+
+class IndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.resident = ResidentCompletionBackend(awscli_completer,
+                                                 mock.Mock())
+        cls.index = AwsCommandIndex.build(
+            driver=cls.resident.get_completer().driver,
+            services=['ec2', 's3', 's3api'])
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, 'saws-index')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_complete_matches_awscli(self):
+        commands = ['aws ec2',
+                    'aws ec2 describe-ins',
+                    'aws ec2 describe-instances --',
+                    'aws ec2 describe-instances --instance-ids i-1 --',
+                    'aws s3 l',
+                    'aws s3api get-bucket-acl --b',
+                    'aws --outp',
+                    'aws --output']
+        for command in commands:
+            assert sorted(self.index.complete(command)) == \
+                sorted(self.resident.complete(command)), command
+        assert self.index.complete('aws ec') == ['ec2']
+
+    def test_complete_enum_values(self):
+        values = self.index.complete('aws ec2 describe-volumes --filters x '
+                                     '--output t')
+        assert values == ['text', 'table']
+        assert self.index.complete('aws --profile') is None
+
+    def test_save_load(self):
+        assert not AwsCommandIndex.is_current(self.index_path)
+        self.index.save(self.index_path)
+        assert AwsCommandIndex.is_current(self.index_path)
+        index = AwsCommandIndex.load(self.index_path)
+        assert index.commands == self.index.commands
+        assert index.global_options == self.index.global_options
+
+    def test_interrupted_save(self):
+        self.index.save(self.index_path)
+        with mock.patch('saws.index.zlib.compress',
+                        side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.index.save(self.index_path)
+        assert os.listdir(self.temp_dir) == ['saws-index']
+        index = AwsCommandIndex.load(self.index_path)
+        assert index.commands == self.index.commands
+
+    def test_stale_index(self):
+        self.index.awscli_version = '0.0.1'
+        try:
+            self.index.save(self.index_path)
+        finally:
+            self.index.awscli_version = AwsCommandIndex().awscli_version
+        assert not AwsCommandIndex.is_current(self.index_path)
+        backend = IndexCompletionBackend(awscli_completer, mock.Mock(),
+                                         self.index_path)
+        assert backend.index is None
+        assert 'ec2' in backend.complete('aws ec')
+
+    def test_index_backend(self):
+        self.index.save(self.index_path)
+        backend = IndexCompletionBackend(awscli_completer, mock.Mock(),
+                                         self.index_path)
+        assert backend.index is not None
+        assert backend.fallback is None
+        backend.fallback = mock.Mock()
+        assert 'describe-instances' in backend.complete('aws ec2 describe-i')
+        backend.fallback.complete.assert_not_called()
+        backend.complete('aws --profile')
+        backend.fallback.complete.assert_called_with('aws --profile')
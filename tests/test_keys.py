@@ -13,14 +13,15 @@ from prompt_toolkit.keys import Key, Keys
 from pygments.token import Token
 from saws.saws import Saws
 from saws.keys import KeyManager
+from fake_aws import stub_aws
 
 
 class KeysTest(unittest.TestCase):
 
-    @mock.patch('saws.resources.print')
-    def setUp(self, mock_print):
+    def setUp(self):
+        stub_aws(self)
         self.saws = Saws()
-        mock_print.assert_called_with('Loaded resources from cache')
+        self.saws.completer.resources.wait_for_refresh()
         self.registry = self.saws.key_manager.manager.registry
         self.processor = self.saws.aws_cli.input_processor
         self.DOCS_HOME_URL = 'http://docs.aws.amazon.com/cli/latest/reference/index.html'
@@ -49,7 +50,8 @@ class KeysTest(unittest.TestCase):
         with self.assertRaises(EOFError):
             self.processor.feed_key(KeyPress(Keys.F10, ''))
 
-    @mock.patch('saws.resources.print')
-    def test_f5(self, mock_print):
-        self.processor.feed_key(KeyPress(Keys.F5, ''))
-        mock_print.assert_called_with('Done refreshing')
+    def test_f5(self):
+        resources = self.saws.completer.resources
+        with mock.patch.object(resources, 'refresh_async') as mock_refresh:
+            self.processor.feed_key(KeyPress(Keys.F5, ''))
+        mock_refresh.assert_called_with(force_refresh=True)
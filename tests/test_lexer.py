@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import random
+import unittest
+from collections import OrderedDict
+from pygments.token import Keyword, Name, Operator, Generic, Literal, Text
+from saws.commands import AwsCommands
+from saws.lexer import CommandLexer, CommandLexerFactory
+
+
+class LexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.commands = (['ec2', 's3'],
+                         ['describe-instances', 'ls'],
+                         ['--profile', '--output'],
+                         ['--instance-ids', '--ec2-tag'],
+                         ['running', 'stopped'])
+        shortcuts = OrderedDict([('ec2 ls --ec2-tag', '')])
+        self.lexer = CommandLexerFactory(self.commands, shortcuts).lexer()
+
+    def tokens(self, text):
+        return [(token_type, value) for _, token_type, value
+                in self.lexer.get_tokens_unprocessed(text)
+                if token_type is not Text]
+
+    def test_token_types(self):
+        assert self.tokens('aws ec2 describe-instances --profile dev '
+                           '--instance-ids i-1 running docs') == [
+            (Literal.String, 'aws'),
+            (Name.Class, 'ec2'),
+            (Keyword.Declaration, 'describe-instances'),
+            (Generic.Output, '--profile'),
+            (Operator.Word, '--instance-ids'),
+            (Generic.Output, 'running'),
+            (Literal.Number, AwsCommands.AWS_DOCS)]
+
+    def test_precedence(self):
+        # ec2 and ls are commands before they are shortcut tokens
+        assert self.tokens('aws ec2 ls --ec2-tag') == [
+            (Literal.String, 'aws'),
+            (Name.Class, 'ec2'),
+            (Keyword.Declaration, 'ls'),
+            (Operator.Word, '--ec2-tag')]
+
+    def test_option_value(self):
+        assert self.tokens('aws s3 ls --output=json') == [
+            (Literal.String, 'aws'),
+            (Name.Class, 's3'),
+            (Keyword.Declaration, 'ls'),
+            (Generic.Output, '--output')]
+
+    def test_covers_text(self):
+        for text in ['', '  aws  ec2 ', 'aws ec2x  "a b"\tfoo=', '\n']:
+            tokens = list(self.lexer.get_tokens_unprocessed(text))
+            assert ''.join(value for _, _, value in tokens) == text
+            position = 0
+            for index, _, value in tokens:
+                assert index == position
+                position += len(value)
+
+    def test_large_vocabulary(self):
+        options = ['--option-%d' % i for i in range(20000)]
+        commands = self.commands[:3] + (options, self.commands[4])
+        lexer = CommandLexerFactory(commands, OrderedDict()).lexer()
+        tokens = list(lexer.get_tokens_unprocessed('ec2 ls --option-19999'))
+        assert tokens[-1] == (7, Operator.Word, '--option-19999')
+
+    def test_incremental(self):
+        rand = random.Random(0)
+        words = ['aws', 'ec2', 'ls', '--output=json', '--profile', ' ',
+                 '\n', 'running', '{"Name": "tag:Name"}', '=', 'e', 's']
+        text = ''
+        for _ in range(500):
+            position = rand.randint(0, len(text))
+            if text and rand.random() < 0.3:
+                text = text[:position] + text[position + 1:]
+            else:
+                text = text[:position] + rand.choice(words) + \
+                    text[position:]
+            tokens = list(self.lexer.get_tokens_unprocessed(text))
+            assert tokens == list(self.lexer.classify(text))
+        assert len(self.lexer._cache) == CommandLexer.CACHE_SIZE
+
+    def test_common_prefix_length(self):
+        assert CommandLexer.common_prefix_length('', 'aws') == 0
+        assert CommandLexer.common_prefix_length('aws ec2', 'aws s3') == 4
+        assert CommandLexer.common_prefix_length('aws', 'aws') == 3
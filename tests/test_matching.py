@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import random
+import unittest
+import fuzzyfinder
+from saws.matching import FuzzyIndex, FuzzyMatcher, PrefixIndex, \
+    PrefixMatcher
+
+
+class MatchingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = FuzzyMatcher()
+        rand = random.Random(0)
+        alphabet = 'abcdef0123456789'
+        self.instance_ids = ['i-' + ''.join(rand.choice(alphabet)
+                                            for _ in range(8))
+                             for _ in range(2000)]
+        self.tag_values = ['production', 'production-blue', 'Production',
+                           'staging', 'billing', 'web-server-logs',
+                           'web-server-images', 'metrics', 'testing',
+                           'development-feature', 'security']
+        self.queries = ['', 'a', 'a5', 'i-a', 'ff0', '9a9', 'i-abc1',
+                        'zzz', 'prod', 'pro', 'PROD', 'sl', 'wsi', 'tig',
+                        'dev-f', 'ee']
+
+    def test_golden_ranking(self):
+        assert self.matcher.find_matches('prod', self.tag_values) == \
+            ['Production', 'production', 'production-blue']
+        assert self.matcher.find_matches('wsl', self.tag_values) == \
+            ['web-server-logs']
+        assert self.matcher.find_matches('ti', self.tag_values) == \
+            ['testing', 'Production', 'production', 'production-blue',
+             'metrics', 'staging']
+
+    def test_matches_fuzzyfinder(self):
+        for collection in [self.tag_values, self.instance_ids]:
+            for query in self.queries:
+                expected = list(fuzzyfinder.fuzzyfinder(query, collection))
+                assert self.matcher.find_matches(query, collection) == \
+                    expected, query
+                index = FuzzyIndex(collection)
+                result = [match[-1] for match in index.find_matches(query)]
+                assert result == expected, query
+
+    def test_index_reuse(self):
+        index = self.matcher.get_index(self.instance_ids)
+        assert self.matcher.get_index(self.instance_ids) is index
+        self.instance_ids.append('i-a5000000')
+        assert self.matcher.get_index(self.instance_ids) is not index
+        assert 'i-a5000000' in self.matcher.find_matches('a5000000',
+                                                         self.instance_ids)
+
+    def test_candidates_pruning(self):
+        index = FuzzyIndex(self.tag_values)
+        candidates = [self.tag_values[i] for i in index.candidates('bl')]
+        assert sorted(candidates) == ['billing', 'production-blue',
+                                      'web-server-logs']
+        assert index.candidates('q') == []
+
+    def test_prefix_index(self):
+        for collection in [self.tag_values, self.instance_ids]:
+            index = PrefixIndex(collection)
+            for query in self.queries:
+                expected = [item for item in sorted(collection)
+                            if item.startswith(query)]
+                assert index.find_matches(query) == expected, query
+        index = PrefixIndex(['a\U0010ffff', 'a\U0010ffffb', 'b'])
+        assert index.find_matches('a\U0010ffff') == \
+            ['a\U0010ffff', 'a\U0010ffffb']
+
+    def test_prefix_index_update(self):
+        index = PrefixIndex(self.instance_ids)
+        assert not index.update(set(self.instance_ids))
+        items = index.items
+        instance_ids = self.instance_ids[100:] + ['i-a5000000', 'i-00000000']
+        assert index.update(instance_ids)
+        # Lookups in progress keep the items they started with
+        assert items is not index.items
+        assert index.items == sorted(set(instance_ids))
+        assert index.find_matches('i-a5000') == ['i-a5000000']
+
+    def test_prefix_matcher(self):
+        matcher = PrefixMatcher()
+        index = matcher.get_index(self.instance_ids, 'instance ids')
+        assert matcher.get_index(self.instance_ids, 'instance ids') is index
+        instance_ids = self.instance_ids + ['i-a5000000']
+        assert matcher.get_index(instance_ids, 'instance ids') is index
+        assert matcher.find_matches('i-a5000', instance_ids,
+                                    'instance ids') == ['i-a5000000']
+        assert matcher.find_matches('prod', self.tag_values) == \
+            ['production', 'production-blue']
+
+    def test_limit(self):
+        for collection in [self.tag_values, self.instance_ids]:
+            for query in self.queries:
+                matches = self.matcher.find_matches(query, collection)
+                assert self.matcher.find_matches(query, collection, 3) == \
+                    matches[:3], query
+                matches = PrefixMatcher().find_matches(query, collection)
+                assert PrefixMatcher().find_matches(
+                    query, collection, limit=3) == matches[:3], query
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import unittest
+import botocore.session
+from botocore.stub import Stubber
+from saws.providers import BotocoreResourceProvider, ResourceFetcher, \
+    ResourceFetcherRegistry
+
+
+class ProvidersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = botocore.session.get_session()
+        self.session.set_config_variable('region', 'us-east-1')
+        self.provider = BotocoreResourceProvider(self.session, timeout=5)
+        for service_name in ['ec2', 's3', 'lambda', 'dynamodb']:
+            self.provider.clients[service_name] = self.session.create_client(
+                service_name,
+                region_name='us-east-1',
+                aws_access_key_id='access-key',
+                aws_secret_access_key='secret-key')
+
+    def create_fleet_pages(self, num_instances, page_size):
+        pages = []
+        for start in range(0, num_instances, page_size):
+            instances = []
+            for i in range(start, min(start + page_size, num_instances)):
+                instance = {
+                    'InstanceId': 'i-{0:08x}'.format(i),
+                    'State': {'Code': 16, 'Name': 'running'},
+                }
+                if i % 2:
+                    instance['PrivateIpAddress'] = '10.0.{0}.{1}'.format(
+                        i // 256, i % 256)
+                    instance['Tags'] = [
+                        {'Key': 'Name', 'Value': 'web server {0}'.format(i)},
+                        {'Key': 'Stack', 'Value': 'prod'}]
+                instances.append(instance)
+            pages.append({'Reservations': [{'Instances': instances}]})
+        return pages
+
+    def stub_pages(self, stubber, operation_name, pages):
+        for i, page in enumerate(pages):
+            if i < len(pages) - 1:
+                page['NextToken'] = 'token-{0}'.format(i)
+            expected_params = {}
+            if i:
+                expected_params['NextToken'] = 'token-{0}'.format(i - 1)
+            stubber.add_response(operation_name, page, expected_params)
+
+    def test_iter_instances(self):
+        num_instances = 2500
+        pages = self.create_fleet_pages(num_instances, page_size=1000)
+        stubber = Stubber(self.provider.get_client('ec2'))
+        self.stub_pages(stubber, 'describe_instances', pages)
+        with stubber:
+            instances = list(self.provider.iter_instances())
+        stubber.assert_no_pending_responses()
+        assert len(instances) == num_instances
+        assert instances[0] == ('i-00000000', 'running', None, None)
+        assert instances[-1] == (
+            'i-000009c3', 'running',
+            [{'Key': 'Name', 'Value': 'web server 2499'},
+             {'Key': 'Stack', 'Value': 'prod'}],
+            '10.0.9.195')
+
+    def test_iter_bucket_names(self):
+        stubber = Stubber(self.provider.get_client('s3'))
+        stubber.add_response('list_buckets', {
+            'Buckets': [{'Name': 'bucket-a'}, {'Name': 'bucket-b'}]}, {})
+        with stubber:
+            assert list(self.provider.iter_bucket_names()) == \
+                ['bucket-a', 'bucket-b']
+
+    def test_get_client(self):
+        provider = BotocoreResourceProvider(self.session, timeout=5)
+        client = provider.get_client('ec2')
+        assert provider.get_client('ec2') is client
+        assert client.meta.config.read_timeout == 5
+        assert client.meta.config.connect_timeout == 5
+
+    def test_get_client_region(self):
+        provider = BotocoreResourceProvider(self.session, region='eu-west-1')
+        assert provider.get_client('ec2').meta.region_name == 'eu-west-1'
+
+    def test_iter_resources(self):
+        fetcher = ResourceFetcherRegistry().get('--function-name')
+        stubber = Stubber(self.provider.get_client('lambda'))
+        stubber.add_response('list_functions', {
+            'Functions': [{'FunctionName': 'resize'}],
+            'NextMarker': 'marker'}, {})
+        stubber.add_response('list_functions', {
+            'Functions': [{'FunctionName': 'thumbnail'}]},
+            {'Marker': 'marker'})
+        with stubber:
+            assert list(self.provider.iter_resources(fetcher)) == \
+                ['resize', 'thumbnail']
+        stubber.assert_no_pending_responses()
+        fetcher = ResourceFetcherRegistry().get('--table-name')
+        stubber = Stubber(self.provider.get_client('dynamodb'))
+        stubber.add_response('list_tables', {'TableNames': ['users']}, {})
+        with stubber:
+            assert list(self.provider.iter_resources(fetcher)) == ['users']
+
+    def test_resource_fetcher_command(self):
+        fetcher = ResourceFetcher('lambda', 'list_functions',
+                                  'Functions', 'FunctionName')
+        assert fetcher.get_command() == \
+            'aws lambda list-functions ' \
+            '--query "Functions[].FunctionName" --output json'
+        assert fetcher.parse_output('["resize", null]\n') == ['resize']
+        fetcher = ResourceFetcher('sqs', 'list_queues', 'QueueUrls')
+        assert fetcher.get_command() == \
+            'aws sqs list-queues --query "QueueUrls" --output json'
+        assert fetcher.parse_output('null\n') == []
+
+    def test_registry(self):
+        registry = ResourceFetcherRegistry()
+        for option in ['--function-name', '--db-instance-identifier',
+                       '--queue-url', '--stack-name', '--table-name',
+                       '--role-name']:
+            assert option in registry
+        fetcher = ResourceFetcher('kinesis', 'list_streams', 'StreamNames')
+        registry.register('--stream-name', fetcher)
+        assert registry.get('--stream-name') is fetcher
+        assert list(registry)[-1] == '--stream-name'
+        assert registry.get('--instance-ids') is None
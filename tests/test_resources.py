@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from __future__ import print_function
+import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import mock
 if sys.version_info < (2, 7):
     import unittest2 as unittest
 else:
     import unittest
 from saws.saws import Saws
-from saws.resources import AwsResources
+from saws.cache import ResourceCache
+from saws.resources import AwsResources, AwsResourcePool
+from fake_aws import stub_aws
 
 
 class ResourcesTest(unittest.TestCase):
@@ -18,19 +25,23 @@ class ResourcesTest(unittest.TestCase):
         self.NUM_INSTANCE_TAG_KEYS = 3
         self.NUM_INSTANCE_TAG_VALUES = 6
         self.NUM_BUCKET_NAMES = 16
-        self.RESOURCES = 'data/RESOURCES.txt'
         self.RESOURCES_SAMPLE = 'data/RESOURCES_SAMPLE.txt'
+        stub_aws(self)
         self.create_resources()
 
-    @mock.patch('saws.resources.print')
-    def create_resources(self, mock_print):
+    def create_resources(self):
         self.saws = Saws()
         self.resources = self.saws.completer.resources
+        self.resources.wait_for_refresh()
         self.resources.RESOURCE_FILE = self.RESOURCES_SAMPLE
-        mock_print.assert_called_with('Loaded resources from cache')
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.resources.cache = ResourceCache(
+            os.path.join(self.cache_dir, 'resources'))
+        self.resources.resource_ttls = dict(
+            (res_type, 0) for res_type in AwsResources.ResType)
 
-    @mock.patch('saws.resources.print')
-    def test_refresh(self, mock_print):
+    def test_refresh(self):
         self.resources.refresh(force_refresh=False)
         assert len(self.resources.instance_ids) == \
             self.NUM_INSTANCE_IDS
@@ -40,55 +51,433 @@ class ResourcesTest(unittest.TestCase):
             self.NUM_INSTANCE_TAG_VALUES
         assert len(self.resources.bucket_names) == \
             self.NUM_BUCKET_NAMES
-        mock_print.assert_called_with('Loaded resources from cache')
 
-    @mock.patch('saws.resources.subprocess')
-    @mock.patch('saws.resources.print')
-    def test_refresh_forced(self, mock_print, mock_subprocess):
-        self.resources.RESOURCE_FILE = self.RESOURCES
-        with self.assertRaises(TypeError):
-            try:
-                self.resources.refresh(force_refresh=True)
-            except TypeError as e:
-                # The subprocess mock will cause this function to
-                # throw an exception.  Check the mock worked as
-                # expected before satisfying assertRaises.
-                mock_subprocess.check_output.assert_called_with(
-                    self.resources.QUERY_INSTANCE_IDS_CMD,
-                    universal_newlines=True,
-                    shell=True)
-                mock_print.assert_called_with('  Refreshing instance ids...')
-                raise e
-        self.resources.RESOURCE_FILE = self.RESOURCES_SAMPLE
+    def test_refresh_forced(self):
+        outputs = {
+            self.resources.QUERY_INSTANCES_CMD: None,
+            self.resources.QUERY_BUCKET_NAMES_CMD:
+                '2015-01-01 00:00:00 bucket-a\n2015-01-01 00:00:00 bucket-b\n',
+        }
+        self.resources.instance_ids = ['i-a']
+        self.resources.provider = None
+        with mock.patch.object(self.resources, 'query_aws',
+                               side_effect=outputs.get) as mock_query_aws:
+            self.resources.refresh(force_refresh=True)
+        assert mock_query_aws.call_count == len(outputs)
+        # The failed query keeps its previous resources
+        assert self.resources.instance_ids == ['i-a']
+        assert self.resources.bucket_names == ['bucket-a', 'bucket-b']
 
-    @mock.patch('saws.resources.subprocess')
-    def test_query_aws_with_instance_ids(self, mock_subprocess):
-        self.resources.query_aws(self.resources.QUERY_INSTANCE_IDS_CMD)
-        mock_subprocess.check_output.assert_called_with(
-            self.resources.QUERY_INSTANCE_IDS_CMD,
-            universal_newlines=True,
-            shell=True)
+    def test_refresh_async(self):
+        release = threading.Event()
+        statuses = []
+        self.resources.on_refresh_status = \
+            lambda: statuses.append(self.resources.refresh_status)
+        instance_ids = self.resources.instance_ids
 
-    @mock.patch('saws.resources.subprocess')
-    def test_query_aws_with_instance_tag_keys(self, mock_subprocess):
-        self.resources.query_aws(self.resources.QUERY_INSTANCE_TAG_KEYS_CMD)
-        mock_subprocess.check_output.assert_called_with(
-            self.resources.QUERY_INSTANCE_TAG_KEYS_CMD,
-            universal_newlines=True,
-            shell=True)
+        def query_instances():
+            release.wait(5)
+            self.resources.instance_ids = ['i-new']
+
+        with mock.patch.object(self.resources, 'query_instances',
+                               side_effect=query_instances):
+            with mock.patch.object(self.resources, 'query_bucket_names'):
+                thread = self.resources.refresh_async(force_refresh=True)
+                assert self.resources.refresh_async() is thread
+                # The previous resources are served while refreshing
+                assert self.resources.instance_ids is instance_ids
+                assert not self.resources.wait_for_refresh(0.01)
+                release.set()
+                assert self.resources.wait_for_refresh(5)
+        assert self.resources.instance_ids == ['i-new']
+        assert instance_ids != ['i-new']
+        assert self.resources.refresh_status is None
+        assert statuses == ['Refreshing 0/2', 'Refreshing 1/2',
+                            'Refreshing 2/2', None]
+        self.resources.on_refresh_status = None
+
+    def test_refresh_expired(self):
+        res_type = self.resources.ResType
+        self.resources.resource_ttls = {
+            res_type.INSTANCE_IDS: 60,
+            res_type.INSTANCE_TAG_KEYS: 60,
+            res_type.INSTANCE_TAG_VALUES: 60,
+            res_type.BUCKET_NAMES: 0}
+        now = time.time()
+        self.resources.fetched_at = {
+            res_type.INSTANCE_IDS: now - 120,
+            res_type.INSTANCE_TAG_KEYS: now,
+            res_type.INSTANCE_TAG_VALUES: now,
+            res_type.BUCKET_NAMES: now - 120}
+        self.resources._attempted_at = {}
+        assert self.resources.get_expired_res_types() == \
+            [res_type.INSTANCE_IDS]
+        assert 119 < self.resources.get_age(res_type.INSTANCE_IDS) < 180
+        with mock.patch.object(self.resources, 'query_instances',
+                               return_value=False) as mock_instances:
+            with mock.patch.object(self.resources,
+                                   'query_bucket_names') as mock_buckets:
+                self.resources.refresh_expired().join()
+                # A failed query is not retried before its TTL elapses
+                assert self.resources.refresh_expired() is None
+        assert mock_instances.call_count == 1
+        assert not mock_buckets.called
+        assert self.resources.get_age(res_type.INSTANCE_IDS) > 119
+        self.resources.fetched_at = {}
+        self.resources._attempted_at = {}
+        assert self.resources.get_expired_res_types() == \
+            self.resources.get_enabled_res_types()
+
+    def test_refresh_expired_stamps_query_types(self):
+        res_type = self.resources.ResType
+        self.resources.resource_ttls = dict(
+            (res_type, 60) for res_type in AwsResources.ResType)
+        now = time.time()
+        self.resources.fetched_at = {
+            res_type.INSTANCE_IDS: now - 120,
+            res_type.INSTANCE_TAG_KEYS: now - 30,
+            res_type.INSTANCE_TAG_VALUES: now - 30,
+            res_type.BUCKET_NAMES: now}
+        self.resources._attempted_at = {}
+        with mock.patch.object(self.resources, 'query_instances',
+                               return_value=True), \
+                mock.patch.object(self.resources,
+                                  'query_bucket_names') as mock_buckets:
+            self.resources.refresh_expired().join()
+        assert not mock_buckets.called
+        # The tags were fetched by the same describe-instances query
+        for res_type in [res_type.INSTANCE_IDS, res_type.INSTANCE_TAG_KEYS,
+                         res_type.INSTANCE_TAG_VALUES]:
+            assert self.resources.get_age(res_type) < 10
+        assert self.resources.get_expired_res_types() == []
+
+    def test_cache_migration(self):
+        res_type = self.resources.ResType
+        file_path = os.path.join(self.cache_dir, 'RESOURCES.txt')
+        with open(file_path, 'w') as fp:
+            fp.write('[instance ids] 1445000000\ni-a\n'
+                     '[bucket names]\nbucket-a\n')
+        modified_at = os.path.getmtime(file_path)
+        self.resources.RESOURCE_FILE = file_path
+        self.resources.fetched_at = {}
+        with mock.patch.object(self.resources, 'run_queries'):
+            self.resources.refresh()
+        assert self.resources.instance_ids == ['i-a']
+        assert self.resources.bucket_names == ['bucket-a']
+        fetched_at = {res_type.INSTANCE_IDS: 1445000000,
+                      res_type.BUCKET_NAMES: modified_at}
+        assert self.resources.fetched_at == fetched_at
+        os.remove(file_path)
+        resources = AwsResources(mock.Mock())
+        resources.cache = ResourceCache(self.resources.cache.path)
+        resources.load_cache()
+        assert resources.instance_ids == ['i-a']
+        assert resources.bucket_names == ['bucket-a']
+        assert resources.fetched_at == fetched_at
+
+    def test_load_cache_instance_search(self):
+        self.resources.update_instances([
+            ('i-a1', 'running', [{'Key': 'Name', 'Value': 'web'}],
+             '10.0.0.1')])
+        assert self.resources.cache.save(self.resources.get_cache_data())
+        resources = AwsResources(mock.Mock())
+        resources.cache = ResourceCache(self.resources.cache.path)
+        resources.load_cache()
+        assert resources.instance_search_index['10.0.0.1'] == ['i-a1']
+        assert resources.instance_search_index['web'] == ['i-a1']
+        assert '10.0.0.1' in resources.instance_search_terms
+
+    def test_resource_cache(self):
+        directory = os.path.join(self.cache_dir, 'saws')
+        cache = ResourceCache(os.path.join(directory, 'resources'))
+        assert cache.load() is None
+        data = {'instance_ids': ['i-a'], 'bucket_names': []}
+        assert cache.save(data)
+        assert not cache.save({'instance_ids': ['i-a'], 'bucket_names': []})
+        assert os.listdir(directory) == ['resources']
+        assert ResourceCache(cache.path).load() == data
+        with open(cache.path, 'r+b') as fp:
+            fp.write(b'saws-resources 0')
+        assert ResourceCache(cache.path).load() is None
+
+    def test_corrupt_resource_cache(self):
+        self.resources.cache.save({'instance_ids': ['i-a']})
+        with open(self.resources.cache.path, 'r+b') as fp:
+            contents = fp.read()
+            fp.seek(0)
+            fp.truncate()
+            fp.write(contents[:-8])
+        resources = AwsResources(mock.Mock())
+        resources.cache = ResourceCache(self.resources.cache.path)
+        assert resources.cache.load() is None
+        assert not os.path.exists(resources.cache.path)
+        # A refresh goes on to query AWS, then writes a new cache
+        resources.cache.save({'instance_ids': ['i-a']})
+        with open(resources.cache.path, 'r+b') as fp:
+            fp.seek(-8, os.SEEK_END)
+            fp.write(b'\0' * 8)
+        resources.RESOURCE_FILE = os.path.join(self.cache_dir, 'missing')
+        with mock.patch.object(resources, 'run_queries') as mock_queries:
+            resources.refresh()
+        assert mock_queries.called
+        assert ResourceCache(resources.cache.path).load() is not None
+
+    def test_profile_region(self):
+        resources = AwsResources(mock.Mock(), resource_provider='shell',
+                                 profile='prod account', region='eu-west-1')
+        assert resources.get_query_options() == \
+            " --profile 'prod account' --region eu-west-1"
+        assert os.path.basename(resources.cache.path) == \
+            'resources-prod_account-eu_west_1'
+        assert os.path.basename(
+            AwsResources(mock.Mock(), region='us-east-1').cache.path) == \
+            'resources-default-us_east_1'
+        with mock.patch.object(resources, 'query_aws',
+                               return_value='[]') as mock_query_aws:
+            resources.query_instances()
+        mock_query_aws.assert_called_once_with(
+            resources.QUERY_INSTANCES_CMD + resources.get_query_options())
+        # Only the default profile and region migrate RESOURCES.txt
+        resources.cache = ResourceCache(
+            os.path.join(self.cache_dir, 'missing'))
+        resources.RESOURCE_FILE = self.RESOURCES_SAMPLE
+        with self.assertRaises(IOError):
+            resources.load_cache()
+
+    def test_resource_pool(self):
+        created = []
+
+        def create_resources(profile, region):
+            resources = mock.Mock()
+            created.append((profile, region))
+            return resources
+
+        pool = AwsResourcePool(self.resources, create_resources, max_size=2)
+        assert pool.get() is self.resources
+        east = pool.get(region='us-east-1')
+        east.refresh_async.assert_called_once_with()
+        assert pool.get(region='us-east-1') is east
+        west = pool.get('prod', 'us-west-2', refresh=False)
+        assert not west.refresh_async.called
+        pool.get(region='us-east-1')
+        pool.get(region='eu-west-1')
+        # The least recently used resources are evicted
+        assert pool.get('prod', 'us-west-2') is not west
+        assert pool.get(region='us-east-1') is not east
+        assert created == [(None, 'us-east-1'), ('prod', 'us-west-2'),
+                           (None, 'eu-west-1'), ('prod', 'us-west-2'),
+                           (None, 'us-east-1')]
+        # So are the least recently requested profiles and regions
+        assert len(pool._keys) == 2
+
+    def test_default_profile_region(self):
+        config_file = os.path.join(self.cache_dir, 'config')
+        with open(config_file, 'w') as fp:
+            fp.write('[default]\nregion = us-east-1\n'
+                     '[profile dev]\nregion = eu-west-1\n')
+        environ = {'AWS_CONFIG_FILE': config_file}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            assert AwsResources.resolve_profile_region() == \
+                ('default', 'us-east-1')
+            assert AwsResources.resolve_profile_region(region='us-west-2') == \
+                ('default', 'us-west-2')
+            os.environ['AWS_PROFILE'] = 'prod'
+            prod = AwsResources(mock.Mock())
+            os.environ['AWS_PROFILE'] = 'dev'
+            dev = AwsResources(mock.Mock())
+            pool = AwsResourcePool(dev, mock.Mock())
+            assert pool.get('dev') is dev
+            assert pool.get(region='eu-west-1') is dev
+            assert pool.get('prod') is not dev
+            os.environ['AWS_DEFAULT_REGION'] = 'ap-south-1'
+            assert AwsResources.resolve_profile_region() == \
+                ('dev', 'ap-south-1')
+            # Requested keys are resolved again once the environment changes
+            os.environ['AWS_PROFILE'] = 'prod'
+            assert pool.get(region='eu-west-1') is not dev
+            os.environ['AWS_PROFILE'] = 'dev'
+            assert pool.get(region='eu-west-1') is dev
+        # Each profile's default resources are cached in their own file
+        assert os.path.basename(prod.cache.path) == 'resources-prod-default'
+        assert os.path.basename(dev.cache.path) == \
+            'resources-dev-eu_west_1'
+
+    def test_resource_pool_refresh_all(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def refresh_async(force_refresh):
+            with lock:
+                running.append(None)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            return mock.Mock()
+
+        def create_resources(profile, region):
+            resources = mock.Mock()
+            resources.refresh_async.side_effect = refresh_async
+            return resources
+
+        pool = AwsResourcePool(self.resources, create_resources)
+        keys = [(None, region) for region in
+                ['us-east-1', 'us-west-1', 'us-west-2', 'eu-west-1',
+                 'eu-central-1']]
+        pool.refresh_all(keys, force_refresh=True, concurrency=2).join()
+        assert len(peak) == len(keys)
+        assert max(peak) == 2
+        for key in keys:
+            pool.get(*key).refresh_async.assert_called_once_with(True)
+
+    def test_query_instances(self):
+        output = '''[
+            ["i-a", "running", [{"Key": "Name", "Value": "web"},
+                                {"Key": "Stack", "Value": "prod"}]],
+            ["i-b", "stopped", [{"Key": "Stack", "Value": "dev"}]],
+            ["i-c", "pending", null]
+        ]'''
+        self.resources.provider = None
+        with mock.patch.object(self.resources, 'query_aws',
+                               return_value=output) as mock_query_aws:
+            self.resources.query_instances()
+        mock_query_aws.assert_called_once_with(
+            self.resources.QUERY_INSTANCES_CMD)
+        assert self.resources.instance_ids == ['i-a', 'i-b', 'i-c']
+        assert self.resources.instance_tag_keys == set(['Name', 'Stack'])
+        assert self.resources.instance_tag_values == \
+            set(['web', 'prod', 'dev'])
+        assert self.resources.instance_tags == {
+            'i-a': {'Name': 'web', 'Stack': 'prod'},
+            'i-b': {'Stack': 'dev'},
+            'i-c': {}}
+        assert self.resources.instance_states == {
+            'i-a': 'running', 'i-b': 'stopped', 'i-c': 'pending'}
+        assert self.resources.tag_values_by_key == {
+            'Name': set(['web']), 'Stack': set(['prod', 'dev'])}
+        assert self.resources.get_tagged_instance_ids('Stack', 'dev') == \
+            ['i-b']
+        assert sorted(self.resources.get_tagged_instance_ids('Stack')) == \
+            ['i-a', 'i-b']
+        assert self.resources.get_tagged_instance_ids(value='web') == ['i-a']
+        assert self.resources.get_tag_values('Owner') == set()
+
+    def test_query_with_provider(self):
+        self.resources.provider = mock.Mock()
+        self.resources.provider.iter_instances.return_value = iter([
+            ('i-a', 'running', [{'Key': 'Name', 'Value': 'web server'}]),
+            ('i-b', 'stopped', None)])
+        self.resources.provider.iter_bucket_names.return_value = \
+            iter(['bucket-a', 'bucket-b'])
+        with mock.patch.object(self.resources, 'query_aws') as mock_query_aws:
+            self.resources.query_instances()
+            self.resources.query_bucket_names()
+        assert not mock_query_aws.called
+        assert self.resources.instance_ids == ['i-a', 'i-b']
+        assert self.resources.instance_tag_values == set(['web server'])
+        assert self.resources.instance_states == {
+            'i-a': 'running', 'i-b': 'stopped'}
+        assert self.resources.bucket_names == ['bucket-a', 'bucket-b']
+
+    def test_lazy_resources(self):
+        release = threading.Event()
+        self.resources.provider = mock.Mock()
+        self.resources.provider.iter_instances.side_effect = \
+            lambda: iter([])
+        self.resources.provider.iter_bucket_names.side_effect = \
+            lambda: iter([])
+        self.resources.provider.iter_resources.side_effect = \
+            lambda fetcher: release.wait() and iter(['resize', 'thumbnail'])
+        option = '--function-name'
+        # Nothing is fetched until the option is completed
+        self.resources.refresh(force_refresh=True)
+        assert not self.resources.provider.iter_resources.called
+        assert self.resources.get_lazy_resources(option) == []
+        release.set()
+        assert self.resources.wait_for_lazy_resources(option)
+        self.resources.provider.iter_resources.assert_called_once_with(
+            self.resources.fetchers.get(option))
+        assert self.resources.get_lazy_resources(option) == \
+            ['resize', 'thumbnail']
+        # The fetched resources are cached, and refreshed with F5
+        assert self.resources.provider.iter_resources.call_count == 1
+        assert self.resources.cache.load()['lazy_resources'] == \
+            {option: ['resize', 'thumbnail']}
+        self.resources.refresh(force_refresh=True)
+        assert self.resources.provider.iter_resources.call_count == 2
+        self.resources.lazy_resources = {}
+        self.resources.lazy_fetched_at = {}
+        self.resources.load_cache()
+        assert self.resources.lazy_resources == \
+            {option: ['resize', 'thumbnail']}
+
+    def test_lazy_resources_with_shell(self):
+        self.resources.provider = None
+        with mock.patch.object(self.resources, 'query_aws',
+                               return_value='["users", "orders"]\n') \
+                as mock_query_aws:
+            assert self.resources.query_lazy_resources('--table-name')
+            assert not self.resources.query_lazy_resources('--unknown')
+        mock_query_aws.assert_called_once_with(
+            'aws dynamodb list-tables --query "TableNames" --output json')
+        assert self.resources.lazy_resources['--table-name'] == \
+            ['users', 'orders']
+        self.resources.lazy_resources_ttl = 60
+        assert not self.resources.is_lazy_expired('--table-name')
+        self.resources.lazy_fetched_at['--table-name'] -= 120
+        self.resources._lazy_attempted_at['--table-name'] -= 120
+        assert self.resources.is_lazy_expired('--table-name')
+
+    def test_run_queries_concurrently(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def query():
+            with lock:
+                running.append(None)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+        def failing_query():
+            raise ValueError('failed')
+
+        self.resources.log_exception = mock.Mock()
+        self.resources.refresh_concurrency = 2
+        self.resources.run_queries([('query', query)] * 4 +
+                                   [('failing', failing_query)])
+        assert len(peak) == 4
+        assert max(peak) == 2
+        assert self.resources.log_exception.call_count == 1
+
+    def test_query_aws_timeout(self):
+        self.resources.log_exception = mock.Mock()
+        self.resources.refresh_timeout = 0.1
+        start = time.time()
+        assert self.resources.query_aws('sleep 5') is None
+        assert time.time() - start < 5
+        assert 'Timed out' in \
+            str(self.resources.log_exception.call_args[0][0])
+        self.resources.refresh_timeout = 0
+        assert self.resources.query_aws('echo done') == 'done\n'
+
+    def assert_query_aws(self, mock_subprocess, command):
+        self.resources.query_aws(command)
+        args, kwargs = mock_subprocess.Popen.call_args
+        assert args == (command,)
+        assert kwargs['stdout'] == mock_subprocess.PIPE
+        assert kwargs['universal_newlines']
+        assert kwargs['shell']
 
     @mock.patch('saws.resources.subprocess')
-    def query_aws_with_instance_tag_values(self, mock_subprocess):
-        self.resources.query_aws(self.resources.QUERY_INSTANCE_TAG_VALUES_CMD)
-        mock_subprocess.check_output.assert_called_with(
-            self.resources.QUERY_INSTANCE_TAG_VALUES_CMD,
-            universal_newlines=True,
-            shell=True)
+    def test_query_aws_with_instances(self, mock_subprocess):
+        self.assert_query_aws(mock_subprocess,
+                              self.resources.QUERY_INSTANCES_CMD)
 
     @mock.patch('saws.resources.subprocess')
     def test_query_aws_with_bucket_names(self, mock_subprocess):
-        self.resources.query_aws(self.resources.QUERY_BUCKET_NAMES_CMD)
-        mock_subprocess.check_output.assert_called_with(
-            self.resources.QUERY_BUCKET_NAMES_CMD,
-            universal_newlines=True,
-            shell=True)
+        self.assert_query_aws(mock_subprocess,
+                              self.resources.QUERY_BUCKET_NAMES_CMD)
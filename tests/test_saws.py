@@ -5,17 +5,21 @@ import mock
 import os
 import traceback
 import unittest
+from six.moves import builtins
 from saws.saws import Saws
 from saws.commands import AwsCommands
+from saws.config import Config
+from saws.profiling import StartupProfiler
+from fake_aws import stub_aws
 
 
 class SawsTest(unittest.TestCase):
 
-    @mock.patch('saws.resources.print')
-    def setUp(self, mock_print):
+    def setUp(self):
+        stub_aws(self)
         self.file_name = os.path.expanduser('~') + '/' + '.saws.log'
         self.saws = Saws()
-        mock_print.assert_called_with('Loaded resources from cache')
+        self.saws.completer.resources.wait_for_refresh()
         self.DOCS_HOME_URL = 'http://docs.aws.amazon.com/cli/latest/reference/index.html'
 
     @mock.patch('saws.saws.click')
@@ -35,6 +39,37 @@ class SawsTest(unittest.TestCase):
                 pass
             assert exception_message in line
 
+    def test_startup_reads_files_once(self):
+        opened = []
+        real_open = builtins.open
+
+        def counting_open(file, *args, **kwargs):
+            if not isinstance(file, int):
+                opened.append(os.path.realpath(file))
+            return real_open(file, *args, **kwargs)
+
+        with mock.patch.object(Config, '_snapshot', None), \
+                mock.patch.object(AwsCommands, '_all_commands', None), \
+                mock.patch.object(builtins, 'open', counting_open):
+            for _ in range(2):
+                saws = Saws()
+                saws.completer.resources.wait_for_refresh()
+        for path in [AwsCommands.SOURCES_PATH,
+                     os.path.join(AwsCommands.SOURCES_DIR, 'sawsrc'),
+                     os.path.expanduser('~/.sawsrc')]:
+            assert opened.count(os.path.realpath(path)) == 1, path
+
+    def test_profile_startup(self):
+        profiler = StartupProfiler()
+        saws = Saws(profiler)
+        saws.completer.resources.wait_for_refresh()
+        assert [name for name, _ in profiler.phases] == [
+            'config load', 'command model', 'completer', 'lexer build',
+            'cli construction']
+        report = profiler.format_report()
+        assert 'lexer build' in report
+        assert report.splitlines()[-1].startswith('total')
+
     def test_set_get_color(self):
         self.saws.set_color(True)
         assert self.saws.get_color()
@@ -108,6 +143,7 @@ class SawsTest(unittest.TestCase):
 
     @mock.patch('saws.saws.subprocess')
     def test_process_command(self, mock_subprocess):
+        self.saws.executor = None
         self.saws.set_color(False)
         INVAL_CMD = 'foo'
         self.saws.process_command(INVAL_CMD)
@@ -121,3 +157,18 @@ class SawsTest(unittest.TestCase):
         self.saws.process_command(AwsCommands.AWS_COMMAND)
         mock_subprocess.call.assert_called_with(colorized_command,
                                                 shell=True)
+
+    @mock.patch('saws.saws.subprocess')
+    def test_process_command_in_process(self, mock_subprocess):
+        # Running commands in process is opt in
+        assert self.saws.executor is None
+        self.saws.set_color(False)
+        self.saws.executor = mock.Mock()
+        self.saws.executor.execute.return_value = 0
+        self.saws.process_command(AwsCommands.AWS_COMMAND)
+        self.saws.executor.execute.assert_called_with(AwsCommands.AWS_COMMAND)
+        mock_subprocess.call.assert_not_called()
+        self.saws.executor.execute.return_value = None
+        self.saws.process_command('aws s3 ls | head')
+        mock_subprocess.call.assert_called_with('aws s3 ls | head',
+                                                shell=True)
@@ -1,22 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from __future__ import print_function
-import mock
 import unittest
 from pygments.token import Token
 from saws.saws import Saws
 from saws.toolbar import Toolbar
+from fake_aws import stub_aws
 
 
 class ToolbarTest(unittest.TestCase):
 
-    @mock.patch('saws.resources.print')
-    def setUp(self, mock_print):
+    def setUp(self):
+        stub_aws(self)
         self.saws = Saws()
         self.toolbar = Toolbar(self.saws.get_color,
                                self.saws.get_fuzzy_match,
                                self.saws.get_shortcut_match)
-        mock_print.assert_called_with('Loaded resources from cache')
+        self.saws.completer.resources.wait_for_refresh()
 
     def test_toolbar_on(self):
         expected = [
@@ -40,3 +40,30 @@ class ToolbarTest(unittest.TestCase):
             (Token.Toolbar, ' [F5] Refresh '),
             (Token.Toolbar, ' [F10] Exit ')]
         assert expected == self.toolbar.handler(None)
+
+    def test_toolbar_refreshing(self):
+        self.toolbar = Toolbar(self.saws.get_color,
+                               self.saws.get_fuzzy_match,
+                               self.saws.get_shortcut_match,
+                               self.saws.get_refresh_status)
+        resources = self.saws.completer.resources
+        assert (Token.Toolbar, ' [F5] Refresh ') in self.toolbar.handler(None)
+        resources.refresh_status = 'Refreshing 1/2'
+        assert (Token.Toolbar.On, ' [F5] Refreshing 1/2... ') in \
+            self.toolbar.handler(None)
+        resources.refresh_status = None
+
+    def test_toolbar_resource_age(self):
+        ages = [None]
+        self.toolbar = Toolbar(self.saws.get_color,
+                               self.saws.get_fuzzy_match,
+                               self.saws.get_shortcut_match,
+                               self.saws.get_refresh_status,
+                               lambda: ages[0])
+        assert (Token.Toolbar, ' [F5] Refresh ') in self.toolbar.handler(None)
+        ages[0] = 150
+        assert (Token.Toolbar, ' [F5] Refresh (2m old) ') in \
+            self.toolbar.handler(None)
+        assert self.toolbar.format_age(59.9) == '59s'
+        assert self.toolbar.format_age(7200) == '2h'
+        assert self.toolbar.format_age(86400 * 3) == '3d'
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from __future__ import print_function
+import random
+import shlex
+import unittest
+import mock
+from saws.utils import LazyModule, TextUtils, Tokenizer
+
+
+class UtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.text_utils = TextUtils()
+        self.tokenizer = Tokenizer()
+
+    def test_tokenize_matches_shlex(self):
+        texts = ['aws ec2 describe-instances',
+                 '  aws   ec2  ',
+                 'aws ec2 describe-instances --filters '
+                 '\'[{"Name": "tag:Stack", "Values": ["prod"]}]\'',
+                 'aws s3 cp "my file.txt" s3://bucket/my\\ file.txt',
+                 'echo "a \\"quoted\\" \\\\ word" \'single \\ quote\'',
+                 'a"b"\'c\'d ""']
+        rand = random.Random(0)
+        alphabet = 'ab -"\'\\'
+        while len(texts) < 500:
+            text = ''.join(rand.choice(alphabet)
+                           for _ in range(rand.randint(0, 12)))
+            try:
+                shlex.split(text)
+            except ValueError:
+                continue
+            texts.append(text)
+        for text in texts:
+            assert self.tokenizer.tokenize(text) == shlex.split(text), text
+
+    def test_tokenize_incomplete_input(self):
+        assert self.tokenizer.tokenize('aws ec2 "describe') == \
+            ['aws', 'ec2', 'describe']
+        assert self.tokenizer.tokenize("--filters '[{\"Name") == \
+            ['--filters', '[{"Name']
+        assert self.tokenizer.tokenize('aws \\') == ['aws', '\\']
+        assert self.text_utils.last_token('aws "ec2 \\') == 'ec2 \\'
+        assert self.text_utils.last_token('\\') == '\\'
+        assert self.text_utils.get_tokens('') == []
+
+    def test_tokenize_incremental(self):
+        text = 'aws ec2 describe-instances --filters \'[{"Name": "tag'
+        self.tokenizer.tokenize(text)
+        with mock.patch.object(self.tokenizer, '_scan',
+                               wraps=self.tokenizer._scan) as mock_scan:
+            for char in ':Stack"}]\' --output':
+                text += char
+                assert self.tokenizer.tokenize(text) == \
+                    Tokenizer().tokenize(text)
+            last_call = mock_scan.call_args_list[-1]
+            assert last_call == mock.call(text, text.index('--output'))
+            assert self.tokenizer.tokenize(text) == shlex.split(text)
+            assert mock_scan.call_count == len(':Stack"}]\' --output')
+
+    def test_find_matches_limit(self):
+        instance_ids = ['i-%04d' % i for i in range(5000)]
+        random.Random(0).shuffle(instance_ids)
+        for fuzzy in [False, True]:
+            completions = list(self.text_utils.find_matches(
+                'i-1', instance_ids, fuzzy, limit=10))
+            expected = [completion.text for completion in
+                        self.text_utils.find_matches('i-1', instance_ids,
+                                                     fuzzy)][:10]
+            assert [completion.text for completion in completions] == \
+                expected
+            assert completions[-1].display_meta == \
+                TextUtils.MORE_COMPLETIONS
+            assert not completions[-2].display_meta
+            completions = list(self.text_utils.find_matches(
+                'i-4999', instance_ids, fuzzy, limit=10))
+            assert [completion.text for completion in completions] == \
+                ['i-4999']
+            assert not completions[0].display_meta
+        assert expected == ['i-1000', 'i-1001', 'i-1002', 'i-1003',
+                            'i-1004', 'i-1005', 'i-1006', 'i-1007',
+                            'i-1008', 'i-1009']
+
+    def test_lazy_module(self):
+        module = LazyModule('json')
+        with mock.patch('importlib.import_module') as mock_import:
+            mock_import.return_value.dumps.return_value = '[]'
+            assert module.name == 'json'
+            mock_import.assert_not_called()
+            assert module.dumps([]) == '[]'
+            assert module.loads is mock_import.return_value.loads
+            mock_import.assert_called_once_with('json')